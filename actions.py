@@ -0,0 +1,539 @@
+from __future__ import annotations
+import ast
+import time
+from dataclasses import dataclass
+from typing import Annotated, Any, Callable, Literal, Union
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+# Common spellings models use for keys, mapped to pyautogui key names
+KEY_ALIASES = {
+    "control": "ctrl",
+    "cmd": "command",
+    "return": "enter",
+    "escape": "esc",
+    "del": "delete",
+    "pgup": "pageup",
+    "pgdn": "pagedown",
+    "arrowup": "up",
+    "arrowdown": "down",
+    "arrowleft": "left",
+    "arrowright": "right",
+    "windows": "win",
+    "super": "win",
+    "spacebar": "space",
+}
+
+
+def normalize_key(key: str) -> str:
+    """
+    Normalizes a key name to the spelling pyautogui expects.
+
+    Args:
+        key (str): The key name as written by the model (e.g. "Control", "Return").
+
+    Returns:
+        str: The pyautogui key name (e.g. "ctrl", "enter").
+    """
+    name = key.strip()
+    # Single characters keep their case (pyautogui types "A" with shift)
+    if len(name) == 1:
+        return name
+    name = name.lower().replace(" ", "")
+    return KEY_ALIASES.get(name, name)
+
+
+class HotkeyAction(BaseModel):
+    """
+    Data model representing a keyboard shortcut.
+
+    Attributes:
+        action (Literal["hotkey"]): The type of action, always "hotkey".
+        keys (list[str]): The keys to hold down together, in order (e.g. ["ctrl", "t"]).
+    """
+    action: Literal["hotkey"] = "hotkey"
+    keys: list[str] = Field(min_length=1, description="The keys pressed together, e.g. [\"ctrl\", \"t\"].")
+
+    @field_validator("keys")
+    @classmethod
+    def _normalize_keys(cls, keys: list[str]) -> list[str]:
+        return [normalize_key(key) for key in keys]
+
+
+class PressAction(BaseModel):
+    """
+    Data model representing a single key press, optionally repeated.
+
+    Attributes:
+        action (Literal["press"]): The type of action, always "press".
+        key (str): The key to press (e.g. "enter", "tab").
+        presses (int): How many times to press the key.
+    """
+    action: Literal["press"] = "press"
+    key: str = Field(description="The key to press, e.g. \"enter\" or \"tab\".")
+    presses: int = Field(default=1, ge=1, le=50, description="How many times to press the key.")
+
+    @field_validator("key")
+    @classmethod
+    def _normalize_key(cls, key: str) -> str:
+        return normalize_key(key)
+
+
+class WriteAction(BaseModel):
+    """
+    Data model representing typing a piece of text into the focused field.
+
+    Attributes:
+        action (Literal["write"]): The type of action, always "write".
+        text (str): The text to type.
+    """
+    action: Literal["write"] = "write"
+    text: str = Field(min_length=1, description="The text to type into the focused field.")
+
+
+class WaitAction(BaseModel):
+    """
+    Data model representing a pause, e.g. while a page loads.
+
+    Attributes:
+        action (Literal["wait"]): The type of action, always "wait".
+        seconds (float): How long to wait.
+    """
+    action: Literal["wait"] = "wait"
+    seconds: float = Field(ge=0, le=10, description="How many seconds to wait (at most 10).")
+
+
+class ClickAction(BaseModel):
+    """
+    Data model representing a mouse click on a described element (grounded by the local model) or at fixed coordinates.
+
+    Attributes:
+        action (Literal["click"]): The type of action, always "click".
+        target (str | None): A short description of the element to click (e.g. "the search box").
+        x (int | None): The x coordinate in screen pixels, when already known.
+        y (int | None): The y coordinate in screen pixels, when already known.
+        clicks (int): The number of clicks (2 for a double click).
+    """
+    action: Literal["click"] = "click"
+    target: str | None = Field(default=None, description="A short description of the element to click.")
+    x: int | None = Field(default=None, ge=0, description="The x coordinate in screen pixels, if known.")
+    y: int | None = Field(default=None, ge=0, description="The y coordinate in screen pixels, if known.")
+    clicks: int = Field(default=1, ge=1, le=3, description="The number of clicks.")
+
+    @model_validator(mode="after")
+    def _check_position(self) -> ClickAction:
+        if self.target is None and (self.x is None or self.y is None):
+            raise ValueError("A click needs either a target description or both x and y")
+        return self
+
+
+# A single (non-batch) action
+SimpleAction = Annotated[Union[HotkeyAction, PressAction, WriteAction, WaitAction, ClickAction], Field(discriminator="action")]
+
+
+class BatchAction(BaseModel):
+    """
+    Data model representing several actions executed in order.
+
+    Attributes:
+        action (Literal["batch"]): The type of action, always "batch".
+        actions (list[SimpleAction]): The actions to execute, in order.
+    """
+    action: Literal["batch"] = "batch"
+    actions: list[SimpleAction] = Field(min_length=1, max_length=20, description="The actions to execute in order.")
+
+
+# Any action the agent can execute (keyboard actions and clicks)
+Action = Annotated[Union[HotkeyAction, PressAction, WriteAction, WaitAction, ClickAction, BatchAction], Field(discriminator="action")]
+
+
+class ToolAction(BaseModel):
+    """
+    Data model representing the {"tool": "action", ...} object the agent outputs.
+
+    Attributes:
+        tool (Literal["action"]): Always "action".
+        description (str | None): What the action does, based on the current screenshot (schema-constrained
+            output often sends null).
+        action (Action): The action to execute.
+    """
+    tool: Literal["action"] = "action"
+    description: str | None = Field(default=None, description="A description of the action based on the current screenshot.")
+    action: Action
+
+
+class PlanStep(BaseModel):
+    """
+    Data model representing one step of a multi-action plan.
+
+    Attributes:
+        action (Action): The action to execute.
+        expect_change (bool | None): Whether the step should visibly change the screen; None skips the check.
+        checkpoint (bool): Whether to stop after this step and show the model a new screenshot.
+    """
+    action: Action
+    expect_change: bool | None = Field(default=None, description="Whether this step should visibly change the screen.")
+    checkpoint: bool = Field(default=False, description="Stop after this step and return a new screenshot.")
+
+
+class ToolPlan(BaseModel):
+    """
+    Data model representing the {"tool": "plan", ...} object: an ordered list of actions run between screenshots.
+
+    Attributes:
+        tool (Literal["plan"]): Always "plan".
+        description (str | None): What the plan does, based on the current screenshot.
+        steps (list[PlanStep]): The steps to execute in order.
+    """
+    tool: Literal["plan"] = "plan"
+    description: str | None = Field(default=None, description="A description of the plan based on the current screenshot.")
+    steps: list[PlanStep] = Field(min_length=1, max_length=20, description="The steps to execute in order.")
+
+
+# The "tool" values the agents act on
+TOOL_NAMES = ("action", "plan", "task_complete")
+
+
+class ToolResponse(BaseModel):
+    """
+    Data model representing the whole response in JSON mode: the reasoning followed by the tool object's fields.
+
+    Only used to derive the JSON schema sent to the providers; the tool object itself is still validated
+    by `ToolAction` or `ToolPlan`.
+
+    Attributes:
+        reasoning (str): The step-by-step reasoning about the current screenshot.
+        tool (Literal["action", "plan", "task_complete"]): The tool to use.
+        description (str | None): What the action or plan does.
+        action (Action | None): The action, for "action".
+        steps (list[PlanStep] | None): The steps, for "plan".
+    """
+    reasoning: str = Field(description="Step-by-step reasoning about the current screenshot and the next action.")
+    tool: Literal["action", "plan", "task_complete"]
+    description: str | None = Field(default=None, description="A description of the action or plan.")
+    action: Action | None = None
+    steps: list[PlanStep] | None = Field(default=None, max_length=20)
+
+
+def strip_schema_docs(schema: Any) -> Any:
+    """
+    Removes the "description" and "title" annotations from a JSON schema, keeping its structure.
+
+    Pydantic copies every model docstring and field description into the schema; they only repeat the
+    system prompt, and the schema is sent with every request.
+
+    Args:
+        schema (Any): A JSON schema, or any part of one.
+
+    Returns:
+        Any: A copy without annotations; property and definition names are kept even if they are "description".
+    """
+    if isinstance(schema, list):
+        return [strip_schema_docs(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    stripped = {}
+    for key, value in schema.items():
+        if key in ("description", "title"):
+            continue
+        if key in ("properties", "$defs") and isinstance(value, dict):
+            stripped[key] = {name: strip_schema_docs(subschema) for name, subschema in value.items()}
+        else:
+            stripped[key] = strip_schema_docs(value)
+    return stripped
+
+
+# JSON schema of the model's response, for providers that support schema-constrained decoding; built once
+# and stripped of its annotations
+TOOL_RESPONSE_SCHEMA = strip_schema_docs(ToolResponse.model_json_schema())
+
+# Prompt section added to the agents' system prompts in JSON mode (it also satisfies JSON mode's
+# requirement that the prompt asks for JSON)
+JSON_OUTPUT_PROMPT = """
+JSON mode:
+    Respond with exactly one JSON object and nothing else. Put your step-by-step reasoning in its "reasoning" field,
+    followed by the fields of the action, plan or task_complete object, for example:
+    {"reasoning": "A new tab is open and the address bar is focused, so I will type the URL.", "tool": "action",
+     "description": "Type the URL in the address bar", "action": {"action": "write", "text": "https://example.com"}}
+"""
+
+
+@dataclass
+class PlanOutcome:
+    """
+    The result of executing a plan.
+
+    Attributes:
+        executed (int): The number of steps executed.
+        total (int): The number of steps in the plan.
+        stop_reason (str | None): Why the plan stopped early ("checkpoint", "unexpected change", "no change"), or None if every step ran.
+    """
+    executed: int
+    total: int
+    stop_reason: str | None = None
+
+    def describe(self) -> str:
+        """
+        Summarizes the outcome for the model.
+
+        Returns:
+            str: A one-sentence summary, e.g. "Executed 2/4 plan steps; stopped at a checkpoint."
+        """
+        text = f"Executed {self.executed}/{self.total} plan steps"
+        if self.stop_reason == "checkpoint":
+            return f"{text}; stopped at a checkpoint."
+        if self.stop_reason == "unexpected change":
+            return f"{text}; stopped because step {self.executed} changed the screen unexpectedly."
+        if self.stop_reason == "no change":
+            return f"{text}; stopped because step {self.executed} did not change the screen as expected."
+        return f"{text}."
+
+
+class ExecutionError(Exception):
+    """
+    Raised when an action or plan fails after some of its steps already ran.
+
+    Attributes:
+        executed (int): The number of steps (batch actions, or plan steps) that ran before the failure.
+        completed (dict[str, Any] | None): The tool object cut down to what ran, for recording a trajectory
+            that replays exactly what happened; None if nothing ran.
+    """
+
+    def __init__(self, message: str, executed: int = 0, completed: dict[str, Any] | None = None) -> None:
+        super().__init__(message)
+        self.executed = executed
+        self.completed = completed
+
+
+def _dump(model: BaseModel) -> dict[str, Any]:
+    # The JSON form of a validated model, as the model would have written it
+    return model.model_dump(mode="json", exclude_none=True)
+
+
+def _action_prefix(action: Any, executed: int) -> dict[str, Any]:
+    # The part of an action that ran: the first `executed` actions of a batch, or the action itself
+    if isinstance(action, BatchAction):
+        return {"action": "batch", "actions": [_dump(step) for step in action.actions[:executed]]}
+    return _dump(action)
+
+
+def program_to_actions(program: str) -> list[dict[str, Any]]:
+    """
+    Translates a simple pyautogui program (the older output format) into action objects without executing it.
+
+    Only literal calls to pyautogui.hotkey, press, write/typewrite and time.sleep are accepted.
+
+    Args:
+        program (str): The Python program, e.g. "import pyautogui; pyautogui.hotkey('ctrl', 't')".
+
+    Returns:
+        list[dict[str, Any]]: The equivalent action objects.
+
+    Raises:
+        ValueError: If the program contains anything other than supported literal calls.
+    """
+    actions: list[dict[str, Any]] = []
+    for node in ast.parse(program).body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        if not (isinstance(node, ast.Expr) and isinstance(node.value, ast.Call)
+                and isinstance(node.value.func, ast.Attribute)):
+            raise ValueError(f"Unsupported statement in program: {ast.unparse(node)}")
+        call = node.value
+        name = call.func.attr
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords if kw.arg}
+        # Every supported call needs at least one positional argument (the keys, text or seconds); a bare
+        # pyautogui.press() would otherwise surface as an IndexError instead of a message the model can act on
+        if name in ("hotkey", "press", "write", "typewrite", "sleep") and not args:
+            raise ValueError(f"{name}() in program needs at least one positional argument")
+        if name == "hotkey":
+            actions.append({"action": "hotkey", "keys": list(args)})
+        elif name == "press":
+            keys = args[0] if isinstance(args[0], list) else [args[0]]
+            for key in keys:
+                actions.append({"action": "press", "key": key, "presses": kwargs.get("presses", 1)})
+        elif name in ("write", "typewrite"):
+            actions.append({"action": "write", "text": args[0]})
+        elif name == "sleep":
+            actions.append({"action": "wait", "seconds": args[0]})
+        else:
+            raise ValueError(f"Unsupported call in program: {name}")
+    return actions
+
+
+def parse_tool_action(obj: dict[str, Any]) -> ToolAction:
+    """
+    Validates a tool object from the model, accepting the older "program" format as well.
+
+    Args:
+        obj (dict[str, Any]): The decoded {"tool": "action", ...} object.
+
+    Returns:
+        ToolAction: The validated action.
+
+    Raises:
+        pydantic.ValidationError: If the object does not match the schema.
+        ValueError: If a legacy program cannot be translated.
+    """
+    if "action" not in obj and "program" in obj:
+        actions = program_to_actions(obj["program"])
+        action = actions[0] if len(actions) == 1 else {"action": "batch", "actions": actions}
+        obj = {"tool": "action", "description": obj.get("description", ""), "action": action}
+    return ToolAction.model_validate(obj)
+
+
+class ActionExecutor:
+    """
+    Executes validated actions directly through pyautogui with tunable timing.
+
+    Attributes:
+        pause (float): Seconds pyautogui waits after each call (pyautogui.PAUSE; its default is 0.1).
+        typing_interval (float): Seconds between typed characters.
+        locate (Callable[[str], tuple[int, int]] | None): Grounds a click target description to screen
+            coordinates (e.g. with the local Holo endpoint), or None if clicks need explicit coordinates.
+        backend (Any): The pyautogui module, or a stand-in with the same functions.
+    """
+
+    def __init__(self, pause: float = 0.02, typing_interval: float = 0.0, backend: Any = None,
+                 locate: Callable[[str], tuple[int, int]] | None = None) -> None:
+        self.pause = pause
+        self.typing_interval = typing_interval
+        self.locate = locate
+        self._backend = backend
+        if backend is not None:
+            backend.PAUSE = pause
+
+    @property
+    def backend(self) -> Any:
+        """The pyautogui module (imported on first use, since it connects to the display at import time)."""
+        if self._backend is None:
+            import pyautogui
+            pyautogui.PAUSE = self.pause
+            self._backend = pyautogui
+        return self._backend
+
+    def validate(self, action: Any) -> None:
+        """
+        Checks every key in an action against the backend's key list before anything is executed.
+
+        Args:
+            action (Any): A validated action.
+
+        Raises:
+            ValueError: If a key name is not recognized.
+        """
+        known = getattr(self.backend, "KEYBOARD_KEYS", None)
+        if known is None:
+            return
+        for step in action.actions if isinstance(action, BatchAction) else [action]:
+            keys = step.keys if isinstance(step, HotkeyAction) else [step.key] if isinstance(step, PressAction) else []
+            unknown = [key for key in keys if key not in known]
+            if unknown:
+                raise ValueError(f"Unknown key name(s): {unknown}")
+
+    def execute(self, action: Any) -> int:
+        """
+        Validates and executes one action (or a batch of them).
+
+        Args:
+            action (Any): A validated action.
+
+        Returns:
+            int: The number of actions executed (the batch size for a batch).
+
+        Raises:
+            ValueError: If a key name is not recognized (nothing is executed).
+            ExecutionError: If an action fails; `executed` counts the batch actions that ran before it.
+        """
+        self.validate(action)
+        steps = action.actions if isinstance(action, BatchAction) else [action]
+        for index, step in enumerate(steps):
+            try:
+                self._execute_step(step)
+            except Exception as e:
+                ran = f" (after {index} of {len(steps)} batch actions ran)" if index else ""
+                raise ExecutionError(f"{e}{ran}", executed=index) from e
+        return len(steps)
+
+    def _execute_step(self, step: Any) -> None:
+        if isinstance(step, HotkeyAction):
+            self.backend.hotkey(*step.keys)
+        elif isinstance(step, PressAction):
+            self.backend.press(step.key, presses=step.presses)
+        elif isinstance(step, WriteAction):
+            self.backend.write(step.text, interval=self.typing_interval)
+        elif isinstance(step, WaitAction):
+            time.sleep(step.seconds)
+        elif isinstance(step, ClickAction):
+            x, y = step.x, step.y
+            if x is None or y is None:
+                if self.locate is None:
+                    raise ValueError(f"Cannot click '{step.target}': no grounding model is configured")
+                x, y = self.locate(step.target)
+            self.backend.click(x, y, clicks=step.clicks)
+
+    def execute_tool_object(self, obj: dict[str, Any]) -> ToolAction:
+        """
+        Validates a tool object from the model and executes its action.
+
+        Args:
+            obj (dict[str, Any]): The decoded {"tool": "action", ...} object.
+
+        Returns:
+            ToolAction: The validated action that was executed.
+
+        Raises:
+            ExecutionError: If the action fails; `completed` holds the part of a batch that ran, if any.
+        """
+        tool_action = parse_tool_action(obj)
+        try:
+            self.execute(tool_action.action)
+        except ExecutionError as e:
+            if e.executed:
+                e.completed = {"tool": "action", "description": tool_action.description,
+                               "action": _action_prefix(tool_action.action, e.executed)}
+            raise
+        return tool_action
+
+    def execute_plan(self, plan: ToolPlan, detector: Any = None) -> PlanOutcome:
+        """
+        Executes a plan locally, stopping at checkpoints and when a step does not behave as expected.
+
+        Every step is validated before the first one runs. Steps with `expect_change` set are checked
+        with the change detector; the screen is only fingerprinted, never encoded or sent.
+
+        Args:
+            plan (ToolPlan): The validated plan.
+            detector (Any): A `ChangeDetector` used for `expect_change` checks, or None to skip them.
+
+        Returns:
+            PlanOutcome: How many steps ran and why the plan stopped.
+
+        Raises:
+            ExecutionError: If a step fails; `executed` counts the plan steps that ran before it, and
+                `completed` holds the plan cut down to them (plus the part of a failing batch that ran).
+        """
+        for step in plan.steps:
+            self.validate(step.action)
+
+        total = len(plan.steps)
+        for index, step in enumerate(plan.steps, 1):
+            check = detector is not None and step.expect_change is not None
+            before = detector.fingerprint_now() if check else None
+            try:
+                self.execute(step.action)
+            except ExecutionError as e:
+                steps = [_dump(done) for done in plan.steps[:index - 1]]
+                if e.executed:
+                    steps.append({**_dump(step), "action": _action_prefix(step.action, e.executed)})
+                completed = {"tool": "plan", "description": plan.description, "steps": steps} if steps else None
+                raise ExecutionError(f"Plan step {index} of {total} failed: {e}", executed=index - 1, completed=completed) from e
+            if check:
+                # A step expected to change the screen gets the full change timeout; otherwise one poll is enough
+                timeout = None if step.expect_change else detector.poll_interval
+                changed = detector.wait_for_change(before, timeout=timeout)
+                if changed != step.expect_change:
+                    return PlanOutcome(index, total, "unexpected change" if changed else "no change")
+            if step.checkpoint and index < total:
+                return PlanOutcome(index, total, "checkpoint")
+        return PlanOutcome(total, total)
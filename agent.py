@@ -1,20 +1,102 @@
 # necessary imports
 from __future__ import annotations
 import os
-import json
-from groq import Groq
 from dotenv import load_dotenv
-from capture import take_screenshot
-from utils import encode_image_to_data_uri
+from pydantic import ValidationError
+from actions import JSON_OUTPUT_PROMPT, TOOL_NAMES, TOOL_RESPONSE_SCHEMA, ActionExecutor, ExecutionError, PlanOutcome, ToolPlan
+from archive import archive_from_env
+from capture import get_default_capture
+from change_detection import ChangeDetector
+from memory import ConversationMemory
+from pipeline import FramePipeline, StepTimer
+from providers import CallInfo, build_pool
+from roi import build_roi_payload
+from router import CLICK_ACTION_PROMPT, TaskRouter, grounding_from_env
+from streaming import extract_tool_object, stream_completion
+from tracing import serve_metrics_from_env, tracer
+from trajectory import TrajectoryRecorder, TrajectoryStore
+from utils import ENCODING_PROFILES, EncodingProfile
 
 # Load environment variables from the .env file
 load_dotenv()
 
-# Initialize the Groq client with the API key from environment variables
-client = Groq(api_key=os.getenv("GROQ_API_KEY1"))
+# Initialize the provider pool: every GROQ_API_KEY, GROQ_API_KEY1 ... key is rotated. Set GROQ_AGENT_PROVIDERS
+# to comma-separated "backend:model" tiers (e.g. "groq:<model>,azure:gpt-4.1") to add failover
+client = build_pool(os.getenv("GROQ_AGENT_PROVIDERS", "groq:meta-llama/llama-4-scout-17b-16e-instruct"))
+
+# Recorded successful runs, replayed without the model when the same query comes in again
+trajectories = TrajectoryStore(os.getenv("TRAJECTORY_STORE", "trajectories.json"))
+
+# Optional screenshot archive (SCREENSHOT_ARCHIVE=<directory>); frames are written on a background thread
+archive = archive_from_env()
+
+# Send a low-resolution thumbnail plus sharp crops of the changed regions when only part of the screen changed
+ROI_CROPS = os.getenv("ROI_CROPS", "0") == "1"
+# Steps in ROI mode after which a full frame is sent again, even if little changed
+ROI_FULL_FRAME_EVERY = int(os.getenv("ROI_FULL_FRAME_EVERY", "5"))
+
+# Consecutive failed model calls (after the pool's own retries and failover) before the task is abandoned
+MAX_API_FAILURES = int(os.getenv("MAX_API_FAILURES", "3"))
+
+# Ask for a single JSON object (reasoning included) and constrain decoding with each provider's response format.
+# Unset, it is only used without streaming: the reasoning comes first, so the object closes at the very end of
+# the response and a streamed action could no longer be acted on early
+JSON_MODE = {"1": True, "0": False}.get(os.getenv("JSON_MODE", ""))
+
+# Local Holo grounding endpoint (HOLO_ENDPOINT_URL); when set, the model may click described elements
+grounding = grounding_from_env()
+
+# Validating executor for the model's actions; pause and typing interval are tunable via the environment
+# (click targets are grounded through the router, set up below perform_task)
+executor = ActionExecutor(
+    pause=float(os.getenv("ACTION_PAUSE", "0.02")),
+    typing_interval=float(os.getenv("TYPING_INTERVAL", "0.0")),
+)
+
+
+def execute_action(action: dict, detector: ChangeDetector | None = None) -> PlanOutcome | None:
+    """
+    Validates and executes one action or plan object produced by the model.
+
+    Args:
+        action (dict): The parsed {"tool": "action", ...} or {"tool": "plan", ...} object.
+        detector (ChangeDetector | None): The change detector used to check plan steps, or None to run plans unchecked.
+
+    Returns:
+        PlanOutcome | None: The plan outcome, or None for a single action.
+
+    Raises:
+        pydantic.ValidationError: If the object does not match the action schema.
+        ValueError: If the action uses an unknown key name.
+    """
+    if action.get("tool") == "plan":
+        return executor.execute_plan(ToolPlan.model_validate(action), detector)
+    executor.execute_tool_object(action)
+    return None
+
 
 # Main function to perform the task based on user query
-def perform_task(query: str) -> None:
+def perform_task(query: str, profile: EncodingProfile = ENCODING_PROFILES["groq"], stream: bool = True, replay: bool = True,
+                 roi: bool = ROI_CROPS, json_mode: bool | None = JSON_MODE, note: str | None = None) -> bool:
+    """
+    Runs the screenshot -> Groq model -> keyboard action loop until the task is done.
+
+    Args:
+        query (str): The user's task description.
+        profile (EncodingProfile): How screenshots are downscaled and compressed before upload.
+        stream (bool): Whether to stream completions and act on the first complete action.
+        replay (bool): Whether to replay a recorded trajectory for this query before calling the model.
+        roi (bool): Whether to send a thumbnail plus crops of the changed regions instead of the full frame when possible.
+        json_mode (bool | None): Whether to request schema-constrained JSON output with the reasoning in a "reasoning"
+            field; None enables it only when not streaming.
+        note (str | None): What was already done for this task before the model took over (e.g. a local click).
+
+    Returns:
+        bool: True if the model reported the task complete, False if it stopped on an unknown tool or the
+        model calls kept failing.
+    """
+    if json_mode is None:
+        json_mode = not stream
     # System context - only included once at the beginning
     SYSTEM_CONTEXT = {
         "role": "system",
@@ -26,7 +108,7 @@ def perform_task(query: str) -> None:
             Process Flow:
                 1. Analyze the current screenshot and query to understand the task
                 2. Reason step-by-step about required actions to take based on the current screen state.
-                3. After reasoning all the steps, you will describe and execute one action by outputting a JSON object with the required action.
+                3. After reasoning all the steps, you will describe and execute one action, or a plan of several actions whose results you can predict, by outputting a JSON object.
                 4. Wait for a new screenshot to be provided. Use this screenshot to check if the action was successful before continuing with the next action. If the action was not successful, adjust your approach based on the new screenshot.
                 5. Output plain text when keyboard actions are not required.
                 6. Repeat steps 1-5 until the task is complete.
@@ -36,12 +118,20 @@ def perform_task(query: str) -> None:
                 2. For keyboard actions: Output ONLY a JSON object with this exact structure
                     {"tool": "action",
                     "description": "A description of the action being taken based on the current screenshot.",
-                    "program": "The python code to execute the action based on the current screenshot."}
-            program: 
-                1. Use the pyautogui library to perform keyboard actions. 
-                2. Import pyautogui at the start of your program.
-                3. Use pyautogui.hotkey() for keyboard shortcuts. 
-                4. When typing go to the appropriate field first (e.g., address bar) then use pyautogui.write() to type.
+                    "action": <one of the actions below>}
+                3. For a sequence of actions whose results you can predict from the current screenshot: Output ONLY a JSON plan
+                    {"tool": "plan",
+                    "description": "A description of the plan based on the current screenshot.",
+                    "steps": [{"action": <one of the actions below>, "expect_change": true, "checkpoint": false}, ...]}
+                    The steps run without new screenshots. "expect_change" (optional) says whether the step should visibly change the screen;
+                    the plan stops early if it does not. Set "checkpoint": true on a step after which you need to see the screen before continuing.
+            action:
+                1. {"action": "hotkey", "keys": ["ctrl", "t"]} for keyboard shortcuts.
+                2. {"action": "press", "key": "enter", "presses": 1} to press a single key (presses is optional).
+                3. {"action": "write", "text": "..."} to type text. Go to the appropriate field first (e.g., address bar).
+                4. {"action": "wait", "seconds": 2} to wait for a page to load (at most 10 seconds).
+                5. {"action": "batch", "actions": [...]} to run several of the actions above in order.
+                Key names follow pyautogui: ctrl, alt, shift, enter, tab, esc, backspace, delete, up, down, left, right, pageup, pagedown, home, end, f1-f12.
             Example:
                 query: program to open a new tab and navigate to a URL
                 initial screenshot: (screenshot of a browser)
@@ -55,33 +145,38 @@ def perform_task(query: str) -> None:
                     First, I will open a new tab.
                     {"tool": "action",
                     "description": "Open a new tab",
-                    "program": "import pyautogui; pyautogui.hotkey('ctrl', 't')"}
+                    "action": {"action": "hotkey", "keys": ["ctrl", "t"]}}
                 screenshot: (screenshot of a browser with a new tab open)
                 model_response:
                     I see that a new tab has been opened. The address bar is focused. Now, I will type the URL in the address bar.
                     Next, I will type the URL in the address bar.
                     {"tool": "action",
                     "description": "Type the URL in the address bar",
-                    "program": "import pyautogui; pyautogui.write('https://example.com')"}
+                    "action": {"action": "write", "text": "https://example.com"}}
                 screenshot: (screenshot of a browser with the URL typed in the address bar)
                 model_response:
                     I see that the URL has been typed in the address bar. Now, I will press Enter to navigate to the URL.
                     {"tool": "action",
                     "description": "Press Enter to navigate to the URL",
-                    "program": "import pyautogui; pyautogui.press('enter')"}
+                    "action": {"action": "press", "key": "enter"}}
                 screenshot: (screenshot of the webpage at the URL)
                 model_response:
                     I see that I have navigated to the webpage at the URL. The task is complete.
                     {"tool": "task_complete"}
+                The same task as a single plan:
+                    {"tool": "plan",
+                    "description": "Open a new tab, type the URL and navigate to it",
+                    "steps": [{"action": {"action": "hotkey", "keys": ["ctrl", "t"]}, "expect_change": true},
+                              {"action": {"action": "write", "text": "https://example.com"}},
+                              {"action": {"action": "press", "key": "enter"}, "expect_change": true, "checkpoint": true}]}
             Important Notes:
                 1. Always analyze the current screenshot before taking any action.
                 2. If an action does not lead to the expected result of the task, adjust your approach based on the new screenshot.
-            """
+                3. Prefer a plan when the next few actions do not depend on what appears on screen; use single actions when they do.
+            """ + (CLICK_ACTION_PROMPT if grounding else "")
+            + (JSON_OUTPUT_PROMPT if json_mode else "")
     }
     
-    # Initialize messages with system context
-    messages = [SYSTEM_CONTEXT]
-    
     # Add the initial user query
     initial_user_message = {
         "role": "user",
@@ -93,108 +188,292 @@ def perform_task(query: str) -> None:
         ]
     }
     
-    # Add the initial user message to messages
-    messages.append(initial_user_message)
+    # Bounded conversation memory: keeps the system context and the query, compacts older turns
+    memory = ConversationMemory(SYSTEM_CONTEXT, initial_user_message)
     
+    # Change detector that waits for the screen to settle and remembers what the model last saw.
+    # After an action the model is not called until the screen has changed and settled (or timed out),
+    # so it never spends a round trip on a stale frame from a page that is still loading.
+    detector = ChangeDetector(get_default_capture())
+    # Fingerprint of the screen before the last executed action (None if no action was executed)
+    pre_action_fingerprint = None
+
+    # Records this run so it can be replayed next time
+    recorder = TrajectoryRecorder(query)
+
+    # Per-task counters: model calls made, actions executed, calls saved by running plans locally,
+    # and model calls repeated because the response had no valid tool object
+    model_calls = 0
+    actions_executed = 0
+    calls_saved = 0
+    format_retries = 0
+    # Model calls that failed in a row; a provider that keeps failing ends the task instead of crashing it
+    api_failures = 0
+
+    # Replay a recorded run of the same query, checking each step against the live screen
+    trajectory = trajectories.lookup(query) if replay else None
+    outcome = None
+    if trajectory is not None:
+        try:
+            outcome = trajectories.replay(trajectory, detector, execute_action)
+        except Exception as e:
+            # A failed replay is not fatal: the model carries on from whatever screen it left
+            print(f"Replay failed, continuing with the model: {e}")
+            tracer.increment("replay_failures")
+    if outcome is not None:
+        print(f"Replayed {len(outcome.steps)}/{len(trajectory.steps)} recorded steps, "
+              f"saving ~{outcome.time_saved:.1f}s of model time (store stats: {trajectories.stats})")
+        if outcome.completed:
+            trajectories.save()
+            print("Task completed successfully (replayed).")
+            return True
+        if outcome.steps:
+            # Continue with the model from where the recorded run diverged
+            recorder.extend(outcome.steps)
+            pre_action_fingerprint = outcome.baseline
+            memory.append({
+                "role": "user",
+                "content": "These actions were already executed: "
+                           + "; ".join(str(step.action.get("description")) for step in outcome.steps)
+                           + ". Continue the task from the current screen state."
+            })
+
+    # Tell the model what the local tier already did on this screen, so it does not blindly repeat it
+    if note:
+        memory.append({"role": "user", "content": note})
+
+    # Encode every new frame seen while settling on a background worker, so the settled frame is
+    # usually encoded (and its data URI built) by the time the screen has held still
+    # (not in ROI mode, where most steps send crops and the full frame is only encoded when it is needed)
+    pipeline = FramePipeline(profile)
+    if not roi:
+        detector.on_frame = pipeline.on_frame
+    # Static request parameters, prepared once; each step only adds its messages
+    request_template = dict(
+        temperature=1,
+        max_completion_tokens=1024,
+        top_p=1,
+        stop=None
+    )
+    if json_mode:
+        # Turned into each provider's response_format by the pool
+        request_template["response_schema"] = TOOL_RESPONSE_SCHEMA
+    # Stage timer of the current step (None before the first step)
+    timer = None
+    # In ROI mode, the last full frame sent (kept in memory as the reference the crops are relative to)
+    # and the number of steps since
+    reference_frame = None
+    steps_since_reference = 0
+
     # Main interaction loop
     while True:
-        # Take current screenshot
-        screen_shot = encode_image_to_data_uri(take_screenshot())
-        
-        # Create current state message with screenshot
-        current_state_message = {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": "Current screen state:"
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": screen_shot
-                    }
-                }
-            ]
-        }
-        
-        # Add current state to messages (maintaining full context)
-        current_messages = messages + [current_state_message]
+        # Report the previous step: its wall-clock time against the sum of its (partly overlapped) stages
+        if timer is not None:
+            print(pipeline.finish_step(timer))
+        timer = StepTimer()
+
+        # Wait for the screen to settle after the last action, then keep the settled frame in memory
+        with timer.stage("settle"):
+            frame = detector.settle(baseline=pre_action_fingerprint)
+        action_executed = pre_action_fingerprint is not None
+        pre_action_fingerprint = None
+        # Queue the settled frame for archiving; never blocks, and repeated screens are stored once
+        if archive is not None:
+            archive.submit(frame, detector.last_fingerprint)
+
+        # Tell the model when its last action left the screen exactly as it saw it before
+        state_text = "Current screen state:"
+        if action_executed and detector.is_redundant():
+            state_text = "Current screen state (unchanged after the last action):"
+        detector.mark_sent()
+
+        # In ROI mode, send a thumbnail plus crops of what changed since the reference frame; a full frame is sent
+        # instead when there is no reference yet, when too much changed, or every ROI_FULL_FRAME_EVERY steps
+        roi_payload = None
+        if roi and reference_frame is not None and steps_since_reference < ROI_FULL_FRAME_EVERY:
+            with timer.stage("roi"):
+                roi_payload = build_roi_payload(reference_frame, frame)
+        if roi_payload is not None:
+            steps_since_reference += 1
+            encoded = roi_payload.thumbnail
+            payload_bytes = roi_payload.payload_bytes
+            print(f"ROI payload: {payload_bytes / 1024:.1f} KB ({len(roi_payload.crops)} changed regions)")
+            current_state_message = {"role": "user", "content": roi_payload.content_parts(state_text)}
+        else:
+            # Take the frame encoded in the background while settling (or encode it now if the screen moved on)
+            prepared = pipeline.prepare(frame, detector.last_fingerprint)
+            timer.add("encode", prepared.encode_time)
+            encoded = prepared.encoded
+            payload_bytes = encoded.payload_bytes
+            print(f"Screenshot payload: {payload_bytes / 1024:.1f} KB ({encoded.width}x{encoded.height} {encoded.mime_type})")
+            # Create current state message with screenshot
+            current_state_message = {"role": "user", "content": [{"type": "text", "text": state_text}, prepared.image_part]}
+
+        # Add current state to the compacted history (within the memory's token budget)
+        with timer.stage("build"):
+            current_messages = memory.build(current_state_message)
+        if roi and roi_payload is None:
+            # The model keeps this full frame for the following steps, whose crops only show what changed since
+            reference_frame, steps_since_reference = frame, 0
+            memory.set_reference({"role": "user", "content": [
+                {"type": "text", "text": "Reference screenshot (full resolution) that later region crops are relative to:"},
+                prepared.image_part,
+            ]})
         
-        # Get completion from the model
-        completion = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=current_messages,
-            temperature=1,
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=False,
-            stop=None
-        )
-
-        # Extract the model's response
-        response = completion.choices[0].message.content
+        # Arguments shared by the streaming and non-streaming calls
+        # The pool fills call_info with this call's retries and provider
+        call_info = CallInfo()
+        completion_kwargs = dict(request_template, messages=current_messages, info=call_info)
+
+        # Action detected while streaming (None when not streaming or when no action was found)
+        streamed_action = None
+        try:
+            # Model call span: screenshot size and payload, tokens, retries and the provider that answered
+            with timer.stage("model", streamed=stream, width=encoded.width, height=encoded.height,
+                             payload_bytes=payload_bytes) as model_span:
+                if stream:
+                    # Stream the completion and stop reading as soon as the first complete action arrives
+                    result = stream_completion(client.create, tool_names=TOOL_NAMES, **completion_kwargs)
+                    response = result.text
+                    streamed_action = result.action
+                    prompt_tokens, completion_tokens = result.prompt_tokens, result.completion_tokens
+                    if result.time_to_action is not None:
+                        print(f"Time to action: {result.time_to_action:.2f}s")
+                else:
+                    # Get completion from the model
+                    completion = client.create(stream=False, **completion_kwargs)
+                    # Extract the model's response
+                    response = completion.choices[0].message.content
+                    prompt_tokens = completion.usage.prompt_tokens if completion.usage else None
+                    completion_tokens = completion.usage.completion_tokens if completion.usage else None
+                model_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               retries=call_info.retries, provider=call_info.provider)
+        except Exception as e:
+            # The pool has already retried with backoff and failover; report and try again next turn
+            print(f"Error calling Groq: {e}")
+            api_failures += 1
+            tracer.increment("api_failures")
+            if api_failures >= MAX_API_FAILURES:
+                print(f"Giving up after {api_failures} failed model calls in a row.")
+                return False
+            memory.append({
+                "role": "user",
+                "content": f"API call failed: {str(e)}. Please retry or adjust."
+            })
+            continue
+
+        api_failures = 0
+        model_latency = model_span.duration
+        model_calls += 1
         print(response)
+        # A stream cancelled at the action never receives the usage chunk; the memory's estimate is used instead
+        usage_note = "" if prompt_tokens is not None else " (estimated; no usage reported)"
+        print(f"Prompt tokens: {memory.record_usage(prompt_tokens)}{usage_note}")
         
         # Add the AI's response to the conversation history
         ai_response_message = {
             "role": "assistant",
             "content": response
         }
-        # Append the AI response to messages
-        messages.append(ai_response_message)
+        # Append the AI response to memory
+        memory.append(ai_response_message)
 
-        # Extract the dictionary part
-        start = response.find('{')
-        end = response.rfind('}') + 1
+        # Pick the tool object out of the response, unless streaming already found it; braces in the
+        # reasoning and extra objects are skipped instead of breaking the parse
+        parsed = streamed_action if streamed_action is not None else extract_tool_object(response, TOOL_NAMES)
         
-        # If a JSON object is found, parse and execute the action
-        if start != -1 and end != 0:
-            # Extract the JSON string
-            dict_str = response[start:end]
+        # If a tool object is found, validate and execute it
+        if parsed is not None:
+            # The reasoning is already in memory with the response; keep it out of the recorded trajectory
+            parsed.pop("reasoning", None)
             try:
-                # Parse the JSON string to a dictionary
-                parsed = json.loads(dict_str)
                 if parsed.get("tool") == "action":
+                    # Remember the screen the action starts from so the next settle waits for it to change
+                    pre_action_fingerprint = detector.last_fingerprint
                     # Execute the action
-                    exec(parsed.get("program"))
+                    with timer.stage("execute", tool="action"):
+                        execute_action(parsed)
+                    actions_executed += 1
+                    recorder.add_step(parsed, pre_action_fingerprint, model_latency)
                     # Add a user message indicating the action was executed
                     action_feedback = {
                         "role": "user",
                         "content": f"Action executed: {parsed.get('description')}. Please provide the next action based on the new screen state."
                     }
-                    messages.append(action_feedback)
+                    memory.append(action_feedback)
+                elif parsed.get("tool") == "plan":
+                    # Run the plan locally; only a checkpoint, an unexpected screen or the end of the plan returns to the model
+                    pre_action_fingerprint = detector.last_fingerprint
+                    with timer.stage("execute", tool="plan") as execute_span:
+                        outcome = execute_action(parsed, detector)
+                        execute_span.set(steps=outcome.executed)
+                    actions_executed += outcome.executed
+                    calls_saved += max(0, outcome.executed - 1)
+                    print(f"Plan: {outcome.describe()}")
+                    # Record only the steps that ran, so a replay stops where this run did
+                    recorder.add_step({**parsed, "steps": parsed["steps"][:outcome.executed]}, pre_action_fingerprint, model_latency)
+                    plan_feedback = {
+                        "role": "user",
+                        "content": f"Plan executed: {parsed.get('description')}. {outcome.describe()} Please provide the next action based on the new screen state."
+                    }
+                    memory.append(plan_feedback)
                 elif parsed.get("tool") == "task_complete":
-                    # Task is complete, exit the loop
+                    # Task is complete: store the run for replay and exit the loop
                     print("Task completed successfully.")
-                    break
+                    print(f"Task stats: {actions_executed} actions in {model_calls} model calls "
+                          f"({calls_saved} calls saved by plans, {format_retries} format retries)")
+                    print(pipeline.summary())
+                    print(tracer.report())
+                    recorder.finish(trajectories, detector.last_fingerprint)
+                    return True
                 else:
                     # Unknown tool, provide feedback
                     print("Unknown tool in response:", parsed.get("tool"))
-                    break
+                    return False
             except Exception as e: 
-                # Handle JSON parsing or execution errors 
+                # Handle validation or execution errors 
                 print("Error parsing or executing response:", e)
+                if isinstance(e, ValidationError):
+                    # The object did not match the action schema: a format failure like a missing object
+                    format_retries += 1
+                    tracer.increment("format_retries")
+                elif isinstance(e, ExecutionError) and e.completed is not None:
+                    # Part of the action or plan ran: record exactly that, so a replay repeats what happened
+                    recorder.add_step(e.completed, pre_action_fingerprint, model_latency)
+                    actions_executed += len(e.completed["steps"]) if e.completed["tool"] == "plan" else 1
                 # Add error feedback to context
                 error_feedback = {
                     "role": "user", 
                     "content": f"Error occurred: {str(e)}. Please adjust your approach."
                 }
-                # Append error feedback to messages
-                messages.append(error_feedback)
+                # Append error feedback to memory
+                memory.append(error_feedback)
         else:
-            # No JSON object found, provide feedback
+            # No tool object found, provide feedback
             print("No JSON object found in response:", response)
+            format_retries += 1
+            tracer.increment("format_retries")
             # Add feedback about invalid response format
             format_feedback = {
                 "role": "user",
                 "content": "Your response should contain a JSON object with the required structure. Please provide a valid response."
             }
-            # Append format feedback to messages
-            messages.append(format_feedback)
+            # Append format feedback to memory
+            memory.append(format_feedback)
+
+
+# Local-first routing: single-click tasks go to the grounding model before the planner, and every click step
+# the planner emits is grounded locally, escalating back to the planner when the answer is not confident
+router = TaskRouter(grounding, perform_task, planner_name="groq", executor=executor)
+if grounding is not None:
+    executor.locate = router.locate
+
 
 if __name__ == "__main__":
+    # Expose stage metrics for Prometheus when TRACE_METRICS_PORT is set
+    serve_metrics_from_env()
     # Enter the user's request
     query = input("Enter your request: ")
-    # Call the function to perform the task
-    perform_task(query)
\ No newline at end of file
+    # Run the task local-first; the planner's click steps are routed through the same router
+    router.run(query)
+    print(router.summary())
\ No newline at end of file
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import os
+import time
+import queue
+import atexit
+import itertools
+import threading
+from collections import deque
+from typing import Any
+import numpy as np
+from PIL import Image
+from change_detection import DEFAULT_TOLERANCE, frame_fingerprint, fingerprints_match
+
+# File extension and PIL format per archive format
+_ARCHIVE_FORMATS = {
+    "png": ("png", "PNG"),
+    "jpeg": ("jpg", "JPEG"),
+    "webp": ("webp", "WEBP"),
+}
+
+
+class ScreenshotArchive:
+    """
+    Archives captured frames to disk on a background thread with deduplication and size/age retention.
+
+    `submit` never blocks: frames go into a bounded queue and are dropped (and counted) when the writer
+    falls behind. File names are "<run>_<sequence>.<ext>", where the run prefix combines the start time
+    and process ID and the sequence is a monotonic counter, so names never collide and sort in capture order.
+
+    Attributes:
+        directory (str): The archive directory.
+        format (str): The image format ("png", "jpeg" or "webp").
+        quality (int): The JPEG/WebP quality (1-100).
+        compress_level (int): The PNG zlib level (0-9); low levels trade size for speed.
+        max_bytes (int): The total archive size above which the oldest files are deleted.
+        max_age (float): The age in seconds after which files are deleted.
+        tolerance (float | None): The fingerprint tolerance for skipping consecutive duplicates, or None to keep every frame.
+        stats (dict[str, int]): Counters for written, duplicate, dropped and deleted frames and bytes on disk.
+    """
+
+    def __init__(
+        self,
+        directory: str = "screenshots",
+        format: str = "png",
+        quality: int = 85,
+        compress_level: int = 1,
+        max_bytes: int = 500 * 1024 * 1024,
+        max_age: float = 24 * 3600.0,
+        max_queue: int = 8,
+        tolerance: float | None = DEFAULT_TOLERANCE,
+    ) -> None:
+        if format not in _ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {format}")
+        self.directory = directory
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.tolerance = tolerance
+        self.stats = {"written": 0, "duplicates": 0, "dropped": 0, "deleted": 0, "bytes": 0}
+        self._prefix = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self._sequence = itertools.count()
+        self._last_fingerprint: np.ndarray | None = None
+        self._queue: queue.Queue[tuple[str, np.ndarray] | None] = queue.Queue(maxsize=max_queue)
+        # Files on disk, oldest first: (path, size, modification time)
+        self._files: deque[tuple[str, int, float]] = deque()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+        self._thread = threading.Thread(target=self._run, name="screenshot-archive", daemon=True)
+        self._thread.start()
+        # Write whatever is still queued when the process exits
+        atexit.register(self.flush)
+
+    def _scan(self) -> None:
+        # Account for files left by earlier runs so retention covers them too
+        extensions = tuple(f".{ext}" for ext, _ in _ARCHIVE_FORMATS.values())
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(extensions):
+                info = entry.stat()
+                files.append((entry.path, info.st_size, info.st_mtime))
+        files.sort(key=lambda item: item[2])
+        self._files.extend(files)
+        self.stats["bytes"] = sum(size for _, size, _ in files)
+
+    def submit(self, frame: np.ndarray, fingerprint: np.ndarray | None = None) -> str | None:
+        """
+        Queues a frame for archiving without blocking.
+
+        Args:
+            frame (np.ndarray): A (height, width, 3) uint8 array in RGB order; it must not be modified afterwards.
+            fingerprint (np.ndarray | None): The frame's fingerprint, if already computed (saves recomputing it).
+
+        Returns:
+            str | None: The path the frame will be written to, or None if it was a duplicate or the queue was full.
+        """
+        if self.tolerance is not None:
+            if fingerprint is None:
+                fingerprint = frame_fingerprint(frame)
+            if fingerprints_match(fingerprint, self._last_fingerprint, self.tolerance):
+                self.stats["duplicates"] += 1
+                return None
+
+        ext = _ARCHIVE_FORMATS[self.format][0]
+        path = os.path.join(self.directory, f"{self._prefix}_{next(self._sequence):06d}.{ext}")
+        try:
+            self._queue.put_nowait((path, frame))
+        except queue.Full:
+            # Never stall the agent on disk I/O; losing an archive frame is acceptable
+            self.stats["dropped"] += 1
+            return None
+        self._last_fingerprint = fingerprint
+        return path
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+                self._enforce_retention()
+            except OSError as e:
+                print(f"Screenshot archive write failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path: str, frame: np.ndarray) -> None:
+        _, pil_format = _ARCHIVE_FORMATS[self.format]
+        options: dict[str, Any] = {"compress_level": self.compress_level} if pil_format == "PNG" else {"quality": self.quality}
+        # Write to a temporary name first so a crash never leaves a truncated file under the final name
+        tmp_path = f"{path}.tmp"
+        Image.fromarray(frame).save(tmp_path, format=pil_format, **options)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._files.append((path, size, time.time()))
+            self.stats["written"] += 1
+            self.stats["bytes"] += size
+
+    def _enforce_retention(self) -> None:
+        cutoff = time.time() - self.max_age
+        while True:
+            with self._lock:
+                if not self._files:
+                    return
+                path, size, mtime = self._files[0]
+                if self.stats["bytes"] <= self.max_bytes and mtime >= cutoff:
+                    return
+                self._files.popleft()
+                self.stats["bytes"] -= size
+                self.stats["deleted"] += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def flush(self) -> None:
+        """Blocks until every queued frame has been written."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Writes the queued frames and stops the background thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def archive_from_env() -> ScreenshotArchive | None:
+    """
+    Creates an archive from SCREENSHOT_ARCHIVE (the directory) and the optional SCREENSHOT_ARCHIVE_FORMAT,
+    SCREENSHOT_ARCHIVE_QUALITY, SCREENSHOT_ARCHIVE_MAX_MB and SCREENSHOT_ARCHIVE_MAX_AGE_HOURS variables.
+
+    Returns:
+        ScreenshotArchive | None: The archive, or None if SCREENSHOT_ARCHIVE is not set.
+    """
+    directory = os.getenv("SCREENSHOT_ARCHIVE")
+    if not directory:
+        return None
+    return ScreenshotArchive(
+        directory,
+        format=os.getenv("SCREENSHOT_ARCHIVE_FORMAT", "png"),
+        quality=int(os.getenv("SCREENSHOT_ARCHIVE_QUALITY", "85")),
+        max_bytes=int(float(os.getenv("SCREENSHOT_ARCHIVE_MAX_MB", "500")) * 1024 * 1024),
+        max_age=float(os.getenv("SCREENSHOT_ARCHIVE_MAX_AGE_HOURS", "24")) * 3600,
+    )
@@ -0,0 +1,438 @@
+from __future__ import annotations
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import functools
+import importlib
+import contextlib
+import tracemalloc
+from typing import Any
+import numpy as np
+from PIL import Image
+from runner import PROVIDER_MODULES
+from tracing import span, tracer
+
+# Environment variable holding each agent's provider spec; the benchmark points it at the stub server
+PROVIDER_SPEC_VARS = {
+    "groq": "GROQ_AGENT_PROVIDERS",
+    "azure": "AZURE_AGENT_PROVIDERS",
+}
+
+# Qwen2-VL image processor defaults (patch size 14, merge size 2), used by the Holo endpoint
+QWEN2_VL_FACTOR = 28
+QWEN2_VL_MIN_PIXELS = 56 * 56
+QWEN2_VL_MAX_PIXELS = 28 * 28 * 1280
+
+
+def synthetic_frame(index: int, size: tuple[int, int] = (1080, 1920)) -> np.ndarray:
+    """
+    Draws a deterministic fake browser screen: a toolbar and blocks of "text" that differ per index.
+
+    Args:
+        index (int): The frame number; each index gives a different but reproducible screen.
+        size (tuple[int, int]): The (height, width) of the frame.
+
+    Returns:
+        np.ndarray: A (height, width, 3) uint8 array in RGB order.
+    """
+    height, width = size
+    rng = np.random.default_rng(index)
+    frame = np.full((height, width, 3), 248, dtype=np.uint8)
+    # Toolbar and address bar
+    frame[:height // 14] = (222, 225, 230)
+    frame[height // 40:height // 18, width // 10:width * 3 // 4] = 255
+    # Lines of "text" in random positions
+    for _ in range(60):
+        y = int(rng.integers(height // 12, height - 20))
+        x = int(rng.integers(0, width - 200))
+        line_width = int(rng.integers(80, min(900, width - x)))
+        frame[y:y + 12, x:x + line_width] = rng.integers(0, 120, size=3, dtype=np.uint8)
+    return frame
+
+
+def load_frames(directory: str) -> list[np.ndarray]:
+    """
+    Loads a recorded screenshot sequence (PNG/JPEG files, in name order).
+
+    Args:
+        directory (str): The directory holding the screenshots.
+
+    Returns:
+        list[np.ndarray]: The frames as RGB arrays.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith((".png", ".jpg", ".jpeg")))
+    return [np.asarray(Image.open(os.path.join(directory, name)).convert("RGB")) for name in names]
+
+
+def scripted_responses(steps: int) -> list[str]:
+    """
+    Builds canned model responses: `steps` keyboard actions with some reasoning text, then task_complete.
+
+    Args:
+        steps (int): The number of action responses.
+
+    Returns:
+        list[str]: The assistant responses, in order.
+    """
+    actions = [
+        {"action": "hotkey", "keys": ["ctrl", "l"]},
+        {"action": "write", "text": "https://example.com/search?q=benchmark"},
+        {"action": "press", "key": "enter"},
+        {"action": "press", "key": "tab", "presses": 3},
+    ]
+    responses = []
+    for i in range(steps):
+        action = actions[i % len(actions)]
+        tool_object = {"tool": "action", "description": f"Step {i + 1}: {action['action']}", "action": action}
+        responses.append(
+            f"I see the result of the previous step on the current screen. The page has loaded and the next "
+            f"element is visible, so I will continue with step {i + 1}.\n{json.dumps(tool_object)}"
+        )
+    responses.append('The page shows the expected result. The task is complete.\n{"tool": "task_complete"}')
+    return responses
+
+
+class FakeCapture:
+    """
+    Stands in for `ScreenCapture`: serves a fixed frame sequence and moves to the next frame after each action.
+
+    Attributes:
+        frames (list[np.ndarray]): The frames to serve, in order (repeated cyclically).
+        index (int): The index of the frame currently on "screen".
+    """
+
+    def __init__(self, frames: list[np.ndarray]) -> None:
+        self.frames = frames
+        self.index = 0
+
+    @property
+    def monitor(self) -> dict[str, int]:
+        height, width = self.frames[0].shape[:2]
+        return {"left": 0, "top": 0, "width": width, "height": height}
+
+    def advance(self) -> None:
+        """Moves to the next frame, as if an action changed the screen."""
+        self.index = (self.index + 1) % len(self.frames)
+
+    def grab(self) -> np.ndarray:
+        """Returns the current frame (a copy, like a real grab)."""
+        with span("capture") as s:
+            frame = self.frames[self.index].copy()
+            s.set(width=frame.shape[1], height=frame.shape[0])
+        return frame
+
+    def close(self) -> None:
+        pass
+
+
+class FakeKeyboard:
+    """
+    Stands in for pyautogui in `ActionExecutor`: records calls and advances the fake screen.
+
+    Attributes:
+        capture (FakeCapture): The fake screen to advance after each call.
+        calls (list[tuple[str, tuple[Any, ...]]]): The recorded calls.
+        memory (list[int]): The traced Python heap size in bytes after each call, when tracemalloc is running.
+        PAUSE (float): Set by `ActionExecutor`; unused.
+    """
+
+    def __init__(self, capture: FakeCapture) -> None:
+        self.capture = capture
+        self.calls: list[tuple[str, tuple[Any, ...]]] = []
+        self.memory: list[int] = []
+        self.PAUSE = 0.0
+
+    def _record(self, name: str, *args: Any) -> None:
+        self.calls.append((name, args))
+        if tracemalloc.is_tracing():
+            self.memory.append(tracemalloc.get_traced_memory()[0])
+        self.capture.advance()
+
+    def hotkey(self, *keys: str) -> None:
+        self._record("hotkey", *keys)
+
+    def press(self, key: str, presses: int = 1) -> None:
+        self._record("press", key, presses)
+
+    def write(self, text: str, interval: float = 0.0) -> None:
+        self._record("write", text)
+
+    def click(self, x: int, y: int, clicks: int = 1) -> None:
+        self._record("click", x, y, clicks)
+
+
+def run_agent_benchmark(
+    provider: str,
+    frames: list[np.ndarray],
+    responses: list[str],
+    stream: bool = True,
+    latency: float = 0.0,
+    poll_interval: float = 0.01,
+    track_memory: bool = True,
+    verbose: bool = False,
+) -> dict[str, Any]:
+    """
+    Runs one task through an agent's perform_task with every external dependency replaced by a local fake.
+
+    The model is the stub server behind a "local" provider (so the real pool, OpenAI client, HTTP and
+    streaming paths are exercised), the screen is a `FakeCapture` and pyautogui is a `FakeKeyboard`.
+
+    Args:
+        provider (str): The agent to run ("groq" for agent.py, "azure" for open_ai.py).
+        frames (list[np.ndarray]): The screenshot sequence to replay.
+        responses (list[str]): The canned model responses.
+        stream (bool): Whether the agent streams completions.
+        latency (float): Simulated model latency in seconds per request.
+        poll_interval (float): The change detector's poll interval (the live default, 0.15s, would dominate).
+        track_memory (bool): Whether to trace heap growth with tracemalloc (which slows the run down).
+        verbose (bool): Whether to show the agent's own output.
+
+    Returns:
+        dict[str, Any]: Throughput, memory and payload figures for the run.
+    """
+    from stub_server import StubState, start_stub_server
+    from actions import ActionExecutor
+    from change_detection import ChangeDetector
+    from trajectory import TrajectoryStore
+
+    state = StubState(responses, latency=latency)
+    server = start_stub_server(state)
+    os.environ["LOCAL_LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ[PROVIDER_SPEC_VARS[provider]] = "local:stub"
+    module = importlib.import_module(PROVIDER_MODULES[provider])
+
+    # Swap the module-level dependencies for fakes; perform_task looks them up at call time
+    capture = FakeCapture(frames)
+    keyboard = FakeKeyboard(capture)
+    module.get_default_capture = lambda: capture
+    module.executor = ActionExecutor(pause=0.0, backend=keyboard)
+    module.ChangeDetector = functools.partial(ChangeDetector, poll_interval=poll_interval, change_timeout=poll_interval * 10)
+    module.trajectories = TrajectoryStore(os.path.join(tempfile.mkdtemp(prefix="bench-"), "trajectories.json"))
+
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            completed = module.perform_task("Benchmark task", stream=stream, replay=False)
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+        tracemalloc.stop()
+        server.shutdown()
+
+    model_calls = state.requests
+    encode = tracer.summary().get("encode", {})
+    return {
+        "completed": completed,
+        "model_calls": model_calls,
+        "actions": len(keyboard.calls),
+        "seconds": elapsed,
+        "steps_per_sec": model_calls / elapsed if elapsed else 0.0,
+        "heap_first_step_bytes": keyboard.memory[0] if keyboard.memory else None,
+        "heap_last_step_bytes": keyboard.memory[-1] if keyboard.memory else None,
+        "heap_growth_per_step_bytes": (keyboard.memory[-1] - keyboard.memory[0]) / (len(keyboard.memory) - 1)
+                                      if len(keyboard.memory) > 1 else None,
+        "heap_peak_bytes": peak,
+        "screenshot_payload_avg_bytes": tracer.counters.get("encode_payload_bytes", 0) / encode["count"] if encode else None,
+        "request_first_bytes": state.request_bytes[0] if state.request_bytes else None,
+        "request_last_bytes": state.request_bytes[-1] if state.request_bytes else None,
+        "request_max_bytes": max(state.request_bytes, default=None),
+    }
+
+
+def run_preprocess_benchmark(
+    sizes: list[tuple[int, int]],
+    iterations: int = 20,
+    methods: tuple[str, ...] = ("lanczos", "bilinear", "opencv"),
+    factor: int = QWEN2_VL_FACTOR,
+    min_pixels: int = QWEN2_VL_MIN_PIXELS,
+    max_pixels: int = QWEN2_VL_MAX_PIXELS,
+) -> list[dict[str, Any]]:
+    """
+    Times the CPU work the endpoint does per request before the model runs: PNG decoding, the cache key
+    (perceptual hash), the resize plan lookup and the resize with each resampling method, without loading the model.
+
+    Args:
+        sizes (list[tuple[int, int]]): The (width, height) screen sizes to test.
+        iterations (int): The number of timed runs per size.
+        methods (tuple[str, ...]): The resampling methods to compare (see preprocessing.RESAMPLE_METHODS).
+        factor (int): The resize factor (patch size x merge size).
+        min_pixels (int): The image processor's minimum pixel count.
+        max_pixels (int): The image processor's maximum pixel count.
+
+    Returns:
+        list[dict[str, Any]]: Per size, the resized dimensions and the median milliseconds per stage.
+    """
+    from endpoint.prediction_cache import PredictionCache
+    from endpoint.preprocessing import Preprocessor, load_image, resize_plan
+
+    preprocessors = {method: Preprocessor(method) for method in methods}
+    results = []
+    for width, height in sizes:
+        frame = synthetic_frame(0, (height, width))
+        png = io.BytesIO()
+        Image.fromarray(frame).save(png, format="PNG", compress_level=1)
+        png_bytes = png.getvalue()
+
+        timings: dict[str, list[float]] = {"decode": [], "cache_key": [], "plan": [], **{method: [] for method in methods}}
+        plan = resize_plan(width, height, factor, min_pixels, max_pixels)
+        for _ in range(iterations):
+            start = time.perf_counter()
+            image = load_image(png_bytes)
+            image.load()
+            timings["decode"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            PredictionCache.make_key(image, "the search button")
+            timings["cache_key"].append(time.perf_counter() - start)
+
+            # Cached after the first request at this resolution
+            start = time.perf_counter()
+            plan = resize_plan(width, height, factor, min_pixels, max_pixels)
+            timings["plan"].append(time.perf_counter() - start)
+
+            for method, preprocessor in preprocessors.items():
+                start = time.perf_counter()
+                preprocessor.resize(image, plan)
+                timings[method].append(time.perf_counter() - start)
+
+        results.append({
+            "size": f"{width}x{height}",
+            "resized": f"{plan.width}x{plan.height}",
+            **{f"{name}_ms": float(np.median(values)) * 1000 for name, values in timings.items()},
+        })
+    return results
+
+
+def check_budgets(result: dict[str, Any], maximums: dict[str, float | None], minimums: dict[str, float | None]) -> list[str]:
+    """
+    Compares benchmark figures against budgets; figures that were not measured (None) are not checked.
+
+    Args:
+        result (dict[str, Any]): The figures from one benchmark run (or one preprocess row).
+        maximums (dict[str, float | None]): Upper limits by figure name; None means no limit.
+        minimums (dict[str, float | None]): Lower limits by figure name; None means no limit.
+
+    Returns:
+        list[str]: A message per exceeded budget (empty when every budget is met).
+    """
+    failures = []
+    for name, limit in maximums.items():
+        value = result.get(name)
+        if limit is not None and value is not None and value > limit:
+            failures.append(f"{name} = {value:.6g} exceeds the budget of {limit:.6g}")
+    for name, limit in minimums.items():
+        value = result.get(name)
+        if limit is not None and value is not None and value < limit:
+            failures.append(f"{name} = {value:.6g} is below the budget of {limit:.6g}")
+    return failures
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    """
+    Parses a "WIDTHxHEIGHT" string.
+
+    Args:
+        value (str): The size, e.g. "1920x1080".
+
+    Returns:
+        tuple[int, int]: The (width, height).
+    """
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks: no display, API keys or model needed.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    agent_parser = commands.add_parser("agent", help="Run perform_task against recorded frames and canned responses.")
+    agent_parser.add_argument("--provider", choices=sorted(PROVIDER_MODULES), default="groq", help="Which agent to run.")
+    agent_parser.add_argument("--frames", help="Directory of recorded screenshots (synthetic frames if omitted).")
+    agent_parser.add_argument("--size", type=parse_size, default=(1920, 1080), help="Synthetic frame size, WIDTHxHEIGHT.")
+    agent_parser.add_argument("--responses", help="JSON file with a list of canned responses (scripted if omitted).")
+    agent_parser.add_argument("--steps", type=int, default=40, help="Number of scripted action steps.")
+    agent_parser.add_argument("--latency", type=float, default=0.0, help="Simulated model latency per request in seconds.")
+    agent_parser.add_argument("--no-stream", action="store_true", help="Use non-streaming completions.")
+    agent_parser.add_argument("--poll-interval", type=float, default=0.01, help="Change detector poll interval in seconds.")
+    agent_parser.add_argument("--no-memory", action="store_true", help="Skip heap tracing for a faster, cleaner timing run.")
+    agent_parser.add_argument("--verbose", action="store_true", help="Show the agent's output.")
+    agent_parser.add_argument("--min-steps-per-sec", type=float, help="Fail if throughput is lower (model calls per second).")
+    agent_parser.add_argument("--max-heap-growth", type=float, help="Fail if the heap grows more per step, in bytes.")
+    agent_parser.add_argument("--max-request-bytes", type=float, help="Fail if any model request is larger, in bytes.")
+    agent_parser.add_argument("--max-payload-bytes", type=float, help="Fail if the average screenshot payload is larger, in bytes.")
+
+    preprocess_parser = commands.add_parser("preprocess", help="Time the endpoint's per-request image preprocessing.")
+    preprocess_parser.add_argument("--sizes", default="1280x720,1920x1080,2560x1440,3840x2160",
+                                   help="Comma-separated WIDTHxHEIGHT screen sizes.")
+    preprocess_parser.add_argument("--iterations", type=int, default=20, help="Timed runs per size.")
+    preprocess_parser.add_argument("--methods", default="lanczos,bilinear,opencv",
+                                   help="Comma-separated resampling methods (lanczos, bilinear, opencv, torch).")
+    preprocess_parser.add_argument("--max-decode-ms", type=float, help="Fail if PNG decoding takes longer at any size.")
+    preprocess_parser.add_argument("--max-cache-key-ms", type=float, help="Fail if the cache key takes longer at any size.")
+    preprocess_parser.add_argument("--max-resize-ms", type=float, help="Fail if any resampling method takes longer at any size.")
+    args = parser.parse_args()
+
+    if args.command == "agent":
+        if args.frames:
+            frames = load_frames(args.frames)
+        else:
+            width, height = args.size
+            frames = [synthetic_frame(i, (height, width)) for i in range(8)]
+        if args.responses:
+            with open(args.responses, "r", encoding="utf-8") as f:
+                responses = json.load(f)
+        else:
+            responses = scripted_responses(args.steps)
+        result = run_agent_benchmark(args.provider, frames, responses, stream=not args.no_stream,
+                                     latency=args.latency, poll_interval=args.poll_interval,
+                                     track_memory=not args.no_memory, verbose=args.verbose)
+        print(json.dumps(result, indent=2))
+        print(tracer.report())
+        failures = [] if result["completed"] else ["the task did not complete"]
+        failures += check_budgets(
+            result,
+            maximums={
+                "heap_growth_per_step_bytes": args.max_heap_growth,
+                "request_max_bytes": args.max_request_bytes,
+                "screenshot_payload_avg_bytes": args.max_payload_bytes,
+            },
+            minimums={"steps_per_sec": args.min_steps_per_sec},
+        )
+    else:
+        # The preprocessing stage needs the endpoint's dependencies (transformers); skip it rather than fail
+        # so the agent benchmark can run in a lightweight environment
+        try:
+            importlib.import_module("endpoint.preprocessing")
+        except ImportError as e:
+            print(f"Skipping the preprocess benchmark: {e}")
+            return
+        methods = tuple(args.methods.split(","))
+        sizes = [parse_size(size) for size in args.sizes.split(",")]
+        failures = []
+        for row in run_preprocess_benchmark(sizes, args.iterations, methods):
+            print(json.dumps(row))
+            row_failures = check_budgets(
+                row,
+                maximums={
+                    "decode_ms": args.max_decode_ms,
+                    "cache_key_ms": args.max_cache_key_ms,
+                    **{f"{method}_ms": args.max_resize_ms for method in methods},
+                },
+                minimums={},
+            )
+            failures += [f"{row['size']}: {failure}" for failure in row_failures]
+
+    for failure in failures:
+        print(f"Benchmark failed: {failure}")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
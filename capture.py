@@ -1,35 +1,123 @@
 from __future__ import annotations
 import os
+import itertools
+import threading
 import mss
+import mss.tools
+import numpy as np
 from datetime import datetime
+from tracing import span
 
-def take_screenshot() -> str:
+
+class ScreenCapture:
+    """
+    Keeps a single `mss` instance alive and grabs frames of one monitor straight into memory.
+
+    Opening an `mss.mss()` context is comparatively expensive (it connects to the display server and
+    enumerates monitors), so the instance is created once and reused for every grab. `mss` handles are
+    not safe to share between threads, so one handle is kept per thread.
+
+    Attributes:
+        monitor_index (int): The `mss` monitor index to capture (1 is the primary monitor).
+        display (str | None): The X display to connect to (e.g. ":1"), or None for the default display.
+    """
+
+    def __init__(self, monitor_index: int = 1, display: str | None = None) -> None:
+        self.monitor_index = monitor_index
+        self.display = display
+        self._local = threading.local()
+
+    def _sct(self) -> mss.base.MSSBase:
+        # Lazily create one mss handle per thread and keep it alive
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            kwargs = {"display": self.display} if self.display else {}
+            sct = mss.mss(**kwargs)
+            self._local.sct = sct
+        return sct
+
+    @property
+    def monitor(self) -> dict[str, int]:
+        """The geometry of the captured monitor (left, top, width, height)."""
+        return self._sct().monitors[self.monitor_index]
+
+    def grab_raw(self) -> mss.screenshot.ScreenShot:
+        """
+        Grabs the monitor and returns the raw `mss` screenshot (BGRA pixels).
+
+        Returns:
+            mss.screenshot.ScreenShot: The raw screenshot.
+        """
+        return self._sct().grab(self.monitor)
+
+    def grab(self) -> np.ndarray:
+        """
+        Grabs the monitor as an RGB NumPy array.
+
+        Returns:
+            np.ndarray: A contiguous (height, width, 3) uint8 array in RGB order.
+        """
+        with span("capture") as s:
+            # mss returns BGRA; reorder the channels to RGB and drop alpha in one copy
+            bgra = np.asarray(self.grab_raw())
+            frame = np.ascontiguousarray(bgra[:, :, 2::-1])
+            s.set(width=frame.shape[1], height=frame.shape[0])
+        return frame
+
+    def close(self) -> None:
+        """Closes the mss handle owned by the calling thread, if any."""
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+# Shared capture instance for the primary monitor, reused by every call below
+_default_capture = ScreenCapture()
+
+# Monotonic counter that keeps take_screenshot names unique within a process
+_screenshot_sequence = itertools.count()
+
+
+def get_default_capture() -> ScreenCapture:
+    """
+    Returns the process-wide capture instance for the primary monitor.
+
+    Returns:
+        ScreenCapture: The shared capture instance.
+    """
+    return _default_capture
+
+
+def take_screenshot(directory: str = "screenshots") -> str:
     """
     Captures a screenshot of the primary monitor and saves it to the 'screenshots' directory.
 
-    This function uses the `mss` library to capture the screen and saves the screenshot as a PNG file
-    in the 'screenshots' directory. The file is named with a timestamp to ensure uniqueness.
+    This function uses the shared `mss` capture instance and saves the screenshot as a PNG file
+    in the given directory. The file is named with a millisecond timestamp, the process ID and a
+    monotonic sequence number, so captures within the same second never overwrite each other. The
+    agent loop grabs frames in memory through `get_default_capture()` (and keeps them with
+    `archive.ScreenshotArchive`) instead; this function is kept for callers that need a file on disk.
+
+    Args:
+        directory (str): The directory to save the screenshot in (default is "screenshots").
 
     Returns:
         str: The file path of the saved screenshot.
     """
     # Ensure the 'screenshots' directory exists; create it if it doesn't
-    if not os.path.exists("screenshots"):
-        os.makedirs("screenshots")
+    if not os.path.exists(directory):
+        os.makedirs(directory)
 
-    # Create a screen capture object using mss
-    with mss.mss() as sct:
-        # Select the primary monitor (index 1 in mss)
-        monitor = sct.monitors[1]
-        # Capture the screen contents of the primary monitor
-        screenshot = sct.grab(monitor)
+    # Capture the screen contents of the primary monitor
+    screenshot = _default_capture.grab_raw()
 
-        # Generate a timestamped filename for the screenshot
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        path = os.path.join("screenshots", f"screenshot_{ts}.png")
+    # Generate a collision-free, time-ordered filename for the screenshot
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    path = os.path.join(directory, f"screenshot_{ts}_{os.getpid()}_{next(_screenshot_sequence):06d}.png")
 
-        # Save the screenshot as a PNG file
-        mss.tools.to_png(screenshot.rgb, screenshot.size, output=path)
+    # Save the screenshot as a PNG file
+    mss.tools.to_png(screenshot.rgb, screenshot.size, output=path)
 
-        # Return the file path of the saved screenshot
-        return path
\ No newline at end of file
+    # Return the file path of the saved screenshot
+    return path
@@ -0,0 +1,201 @@
+from __future__ import annotations
+import time
+from typing import Callable
+import numpy as np
+from capture import ScreenCapture
+
+# Fingerprint grid (rows, columns); small enough to compare in microseconds
+FINGERPRINT_GRID = (36, 64)
+# Minimum per-cell grey-level change that counts as a real difference
+CELL_THRESHOLD = 6
+# Fraction of changed cells below which two frames are considered identical
+DEFAULT_TOLERANCE = 0.002
+
+
+def frame_fingerprint(frame: np.ndarray, grid: tuple[int, int] = FINGERPRINT_GRID) -> np.ndarray:
+    """
+    Reduces a frame to a small greyscale grid for fast comparison.
+
+    The frame is first subsampled with a stride (no copy), then each grid cell is averaged, which
+    keeps the fingerprint stable against single-pixel noise such as a blinking caret.
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 array in RGB order.
+        grid (tuple[int, int]): The (rows, columns) of the fingerprint grid.
+
+    Returns:
+        np.ndarray: A (rows, columns) uint8 array of cell brightness values.
+    """
+    rows, cols = grid
+    height, width = frame.shape[:2]
+    # Subsample to at most 4x4 pixels per cell before averaging
+    step_y = max(1, height // (rows * 4))
+    step_x = max(1, width // (cols * 4))
+    small = frame[::step_y, ::step_x]
+    # Crop to a whole number of cells
+    cell_h = max(1, small.shape[0] // rows)
+    cell_w = max(1, small.shape[1] // cols)
+    small = small[:cell_h * rows, :cell_w * cols]
+    # Integer luma approximation (R + 2G + B) / 4
+    gray = (small[..., 0].astype(np.uint16) + 2 * small[..., 1].astype(np.uint16) + small[..., 2]) >> 2
+    # Average each cell
+    cells = gray.reshape(gray.shape[0] // cell_h, cell_h, gray.shape[1] // cell_w, cell_w).mean(axis=(1, 3))
+    return cells.astype(np.uint8)
+
+
+def fingerprint_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Measures how much two fingerprints differ.
+
+    Args:
+        a (np.ndarray): The first fingerprint.
+        b (np.ndarray): The second fingerprint.
+
+    Returns:
+        float: The fraction of grid cells (0.0-1.0) whose brightness changed noticeably.
+    """
+    if a.shape != b.shape:
+        return 1.0
+    changed = np.abs(a.astype(np.int16) - b.astype(np.int16)) > CELL_THRESHOLD
+    return float(changed.mean())
+
+
+def fingerprints_match(a: np.ndarray | None, b: np.ndarray | None, tolerance: float = DEFAULT_TOLERANCE) -> bool:
+    """
+    Checks whether two fingerprints describe the same screen.
+
+    Args:
+        a (np.ndarray | None): The first fingerprint, or None.
+        b (np.ndarray | None): The second fingerprint, or None.
+        tolerance (float): The fraction of changed cells still treated as identical.
+
+    Returns:
+        bool: True if both fingerprints exist and match within the tolerance.
+    """
+    if a is None or b is None:
+        return False
+    return fingerprint_difference(a, b) <= tolerance
+
+
+class ChangeDetector:
+    """
+    Waits for the screen to settle after an action and tracks the frame the model last saw.
+
+    Attributes:
+        capture (ScreenCapture): The capture instance to poll.
+        tolerance (float): The fraction of changed cells still treated as identical.
+        settle_timeout (float): The maximum time in seconds to wait for a stable screen.
+        change_timeout (float): The maximum time in seconds to wait for an action to change the screen.
+        poll_interval (float): The delay in seconds between polls.
+        stable_polls (int): The number of consecutive matching polls that count as stable.
+        last_frame (np.ndarray | None): The most recent settled frame.
+        last_fingerprint (np.ndarray | None): The fingerprint of the most recent settled frame.
+        sent_fingerprint (np.ndarray | None): The fingerprint of the frame the model last saw.
+        on_frame (Callable[[np.ndarray, np.ndarray], None] | None): Called with every polled frame and its fingerprint
+            while settling, e.g. to start encoding speculatively.
+    """
+
+    def __init__(
+        self,
+        capture: ScreenCapture,
+        tolerance: float = DEFAULT_TOLERANCE,
+        settle_timeout: float = 5.0,
+        change_timeout: float = 1.5,
+        poll_interval: float = 0.15,
+        stable_polls: int = 2,
+        on_frame: Callable[[np.ndarray, np.ndarray], None] | None = None,
+    ) -> None:
+        self.capture = capture
+        self.tolerance = tolerance
+        self.settle_timeout = settle_timeout
+        self.change_timeout = change_timeout
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.last_frame: np.ndarray | None = None
+        self.last_fingerprint: np.ndarray | None = None
+        self.sent_fingerprint: np.ndarray | None = None
+        self.on_frame = on_frame
+
+    def settle(self, baseline: np.ndarray | None = None) -> np.ndarray:
+        """
+        Polls the screen until it stops changing or the timeout expires.
+
+        If a baseline fingerprint is given (the screen before an action), the screen must first
+        differ from it, or `change_timeout` must pass, before it can be considered settled. This
+        avoids returning the stale pre-action frame while a page is still reacting.
+
+        Args:
+            baseline (np.ndarray | None): The fingerprint of the screen before the last action.
+
+        Returns:
+            np.ndarray: The settled frame.
+        """
+        start = time.monotonic()
+        frame = self.capture.grab()
+        fingerprint = frame_fingerprint(frame)
+        if self.on_frame is not None:
+            self.on_frame(frame, fingerprint)
+        changed = baseline is None or not fingerprints_match(fingerprint, baseline, self.tolerance)
+        matches = 0
+
+        while time.monotonic() - start < self.settle_timeout:
+            # Stop once the screen has reacted (or gave up reacting) and then held still
+            if matches >= self.stable_polls and (changed or time.monotonic() - start >= self.change_timeout):
+                break
+            time.sleep(self.poll_interval)
+            next_frame = self.capture.grab()
+            next_fingerprint = frame_fingerprint(next_frame)
+            if self.on_frame is not None:
+                self.on_frame(next_frame, next_fingerprint)
+            if fingerprints_match(next_fingerprint, fingerprint, self.tolerance):
+                matches += 1
+            else:
+                matches = 0
+            if not changed and not fingerprints_match(next_fingerprint, baseline, self.tolerance):
+                changed = True
+            frame, fingerprint = next_frame, next_fingerprint
+
+        self.last_frame = frame
+        self.last_fingerprint = fingerprint
+        return frame
+
+    def fingerprint_now(self) -> np.ndarray:
+        """
+        Grabs the screen once and returns its fingerprint without settling.
+
+        Returns:
+            np.ndarray: The fingerprint of the current screen.
+        """
+        return frame_fingerprint(self.capture.grab())
+
+    def wait_for_change(self, baseline: np.ndarray, timeout: float | None = None) -> bool:
+        """
+        Polls until the screen differs from a baseline fingerprint or the timeout expires.
+
+        Args:
+            baseline (np.ndarray): The fingerprint to compare against.
+            timeout (float | None): The maximum time in seconds to wait (defaults to `change_timeout`).
+
+        Returns:
+            bool: True if the screen changed within the timeout.
+        """
+        deadline = time.monotonic() + (self.change_timeout if timeout is None else timeout)
+        while True:
+            if not fingerprints_match(self.fingerprint_now(), baseline, self.tolerance):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+    def is_redundant(self) -> bool:
+        """
+        Checks whether the last settled frame matches the frame the model last saw.
+
+        Returns:
+            bool: True if sending the frame again would give the model no new information.
+        """
+        return fingerprints_match(self.last_fingerprint, self.sent_fingerprint, self.tolerance)
+
+    def mark_sent(self) -> None:
+        """Records the last settled frame as the frame the model has seen."""
+        self.sent_fingerprint = self.last_fingerprint
@@ -0,0 +1,2 @@
+# Lets `pytest` (run from the repository root) import the top-level modules from tests/: pytest puts the
+# directory of this file on sys.path when it loads it.
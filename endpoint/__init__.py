@@ -0,0 +1,2 @@
+# Holo grounding endpoint. Run from the repository root with `python -m endpoint.endpoint`, so the
+# endpoint modules and the shared root modules (tracing) import without path changes.
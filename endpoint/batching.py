@@ -0,0 +1,148 @@
+from __future__ import annotations
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, TypeVar
+
+# Type of one request item and of one result
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatchMetrics:
+    """
+    Running metrics of a micro-batcher.
+
+    Attributes:
+        batches (int): The number of batches processed.
+        items (int): The number of requests processed.
+        max_batch_size_seen (int): The largest batch processed.
+        total_compute_time (float): The total seconds spent inside the batch function.
+        total_queue_time (float): The total seconds requests waited before their batch started.
+        last_batch_size (int): The size of the most recent batch.
+        last_batch_latency (float): The compute seconds of the most recent batch.
+        started_at (float): The monotonic time the batcher started.
+    """
+    batches: int = 0
+    items: int = 0
+    max_batch_size_seen: int = 0
+    total_compute_time: float = 0.0
+    total_queue_time: float = 0.0
+    last_batch_size: int = 0
+    last_batch_latency: float = 0.0
+    started_at: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """
+        Summarizes the metrics, including averages and throughput.
+
+        Returns:
+            dict[str, float]: The metric values.
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size_seen,
+            "avg_batch_latency_s": self.total_compute_time / self.batches if self.batches else 0.0,
+            "avg_queue_wait_s": self.total_queue_time / self.items if self.items else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_latency_s": self.last_batch_latency,
+            "throughput_items_per_s": self.items / elapsed,
+        }
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects concurrent requests into batches and runs them through one batch function.
+
+    The first request of a batch starts a collection window; the batch is dispatched when the
+    window closes or when `max_batch_size` requests have arrived, whichever is first. Each caller
+    blocks until its own result is ready.
+
+    Attributes:
+        process_batch (Callable[[list[T]], list[R]]): Processes a list of items and returns one result per item.
+        max_batch_size (int): The maximum number of items per batch.
+        max_wait (float): The collection window in seconds.
+        metrics (BatchMetrics): Running batch metrics.
+    """
+
+    def __init__(self, process_batch: Callable[[list[T]], list[R]], max_batch_size: int = 8, max_wait_ms: float = 20.0) -> None:
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = BatchMetrics(started_at=time.monotonic())
+        self._queue: queue.Queue[tuple[T, Future, float]] = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: T) -> R:
+        """
+        Queues one item and waits for its result.
+
+        Args:
+            item (T): The request item.
+
+        Returns:
+            R: The result for this item.
+        """
+        future: Future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future.result()
+
+    def _collect(self) -> list[tuple[T, Future, float]]:
+        # Block for the first item, then gather more until the window closes or the batch is full
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            start = time.monotonic()
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch function returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            compute_time = time.monotonic() - start
+
+            # Route each result back to its caller
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+            with self._metrics_lock:
+                self.metrics.batches += 1
+                self.metrics.items += len(batch)
+                self.metrics.max_batch_size_seen = max(self.metrics.max_batch_size_seen, len(batch))
+                self.metrics.total_compute_time += compute_time
+                self.metrics.total_queue_time += sum(start - queued_at for _, _, queued_at in batch)
+                self.metrics.last_batch_size = len(batch)
+                self.metrics.last_batch_latency = compute_time
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns a snapshot of the batch metrics.
+
+        Returns:
+            dict[str, Any]: The metric values.
+        """
+        with self._metrics_lock:
+            return self.metrics.as_dict()
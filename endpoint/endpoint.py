@@ -1,94 +1,460 @@
 # Import necessary libraries
 from __future__ import annotations
+import os
+import time
+import copy
+import argparse
+import threading
+import dataclasses
 from typing import Any
 import torch
 import gradio as gr
 from PIL import Image
-from transformers import AutoModelForImageTextToText, AutoProcessor
-from transformers.models.qwen2_vl.image_processing_qwen2_vl import smart_resize
-from endpoint_functions import get_chat_messages
+from tracing import serve_metrics_from_env, span, tracer
+from .endpoint_functions import CLICK_PREFILL, parse_click
+from .preprocessing import RESAMPLE_METHODS, ImageInput, Preprocessor, load_image
+from .batching import MicroBatcher
+from .serving import SERVING_MODES, ModelServer, default_mode_name
+from .prediction_cache import PredictionCache
 
 # Model name for loading the pre-trained weights
-model_name = "Hcompany/Holo1.5-3B"  # Options: "Hcompany/Holo1.5-7B", "Hcompany/Holo1.5-72B"
+model_name = os.getenv("HOLO_MODEL", "Hcompany/Holo1.5-3B")  # Options: "Hcompany/Holo1.5-7B", "Hcompany/Holo1.5-72B"
 
-# Load the model and processor for image-text tasks
-model = AutoModelForImageTextToText.from_pretrained(
-    model_name,
-    dtype=torch.bfloat16,
-    device_map="auto",
+# The model and processor are loaded lazily on the first request (or by warmup), so importing this
+# module is cheap and does not need a GPU
+server = ModelServer(model_name, SERVING_MODES[default_mode_name()])
+
+# Serializes model calls: the batcher thread and predict_many() share the model, whose rope state is per-call
+model_lock = threading.Lock()
+
+# Resize plans and the rendered prompt are cached; HOLO_RESAMPLE picks lanczos, bilinear, opencv or torch
+preprocessor = Preprocessor(os.getenv("HOLO_RESAMPLE", "lanczos"))
+
+# Prefill the start of the click JSON and stop at its closing brace, so the model can only produce the
+# coordinates (HOLO_PREFILL=0 lets it generate freely)
+ANSWER_PREFILL = CLICK_PREFILL if os.getenv("HOLO_PREFILL", "1") == "1" else ""
+MAX_NEW_TOKENS = 32 if ANSWER_PREFILL else 256
+
+# Batching window: requests arriving within MAX_WAIT_MS of each other share one generate call
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 25.0
+
+# Cache of grounding results for repeated (screen, task) pairs; set HOLO_CACHE_PATH to persist it across restarts
+cache = PredictionCache(
+    ttl=float(os.getenv("HOLO_CACHE_TTL", "600")),
+    persist_path=os.getenv("HOLO_CACHE_PATH") or None,
 )
-processor = AutoProcessor.from_pretrained(model_name)
 
 
-def predict(image: Image.Image, task: str) -> Any:
+def model_input_size(image: Image.Image) -> tuple[int, int]:
     """
-    Processes the input image and navigation task, generates a prompt, and returns the model's response.
+    Computes the size the model's image processor resizes an image to; click coordinates refer to this size.
 
     Args:
         image (Image.Image): The input GUI image.
-        task (str): The navigation task or target element description.
 
     Returns:
-        Any: The model's decoded output, typically a JSON with click coordinates.
+        tuple[int, int]: The resized (width, height).
     """
-    # Resize image according to model's image processor configuration
-    image_processor_config = processor.image_processor
-    resized_height, resized_width = smart_resize(
-        image.height,
-        image.width,
-        factor=image_processor_config.patch_size * image_processor_config.merge_size,
-        min_pixels=image_processor_config.min_pixels,
-        max_pixels=image_processor_config.max_pixels,
-    )
+    _, processor = server.get()
+    plan = preprocessor.plan(processor, image.width, image.height)
+    return plan.width, plan.height
 
-    # Resize the image using high-quality resampling
-    processed_image: Image.Image = image.resize(
-        size=(resized_width, resized_height),
-        resample=Image.Resampling.LANCZOS
-    )
 
-    # Construct the prompt messages for the model
-    messages: list[dict[str, Any]] = get_chat_messages(task, processed_image)
+def prepare_image(image: Image.Image) -> Image.Image:
+    """
+    Resizes an image according to the model's image processor configuration.
+
+    Runs on the request's own thread, so resizing overlaps other requests' generation instead of
+    holding up the batch.
 
-    # Apply the chat template to format the prompt for the model
-    text_prompt = processor.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True
-    )
+    Args:
+        image (Image.Image): The input GUI image.
+
+    Returns:
+        Image.Image: The resized image.
+    """
+    model, processor = server.get()
+    if preprocessor.method == "torch" and preprocessor.device is None:
+        # Resize on the model's device
+        preprocessor.device = model.device
+    with span("preprocess", width=image.width, height=image.height, method=preprocessor.method) as preprocess_span:
+        resized, plan, _ = preprocessor.prepare(image, processor)
+        preprocess_span.set(resized_width=plan.width, resized_height=plan.height)
+    return resized
+
+
+def generation_options(processor: Any) -> dict[str, Any]:
+    """
+    Returns the generate() arguments shared by every prediction path.
+
+    Args:
+        processor (Any): The model's processor (its tokenizer decodes the stop strings).
+
+    Returns:
+        dict[str, Any]: The token limit, plus the stop string that ends a prefilled answer.
+    """
+    if not ANSWER_PREFILL:
+        return {"max_new_tokens": MAX_NEW_TOKENS}
+    return {"max_new_tokens": MAX_NEW_TOKENS, "stop_strings": ["}"], "tokenizer": processor.tokenizer}
+
+
+def predict_batch(requests: list[tuple[Image.Image, str]]) -> list[Any]:
+    """
+    Processes several (image, task) requests with a single padded generate call.
+
+    Args:
+        requests (list[tuple[Image.Image, str]]): The GUI images, already resized by `prepare_image`, and their navigation tasks.
+
+    Returns:
+        list[Any]: The model's decoded output for each request, in order.
+    """
+    model, processor = server.get()
+    processed_images = [image for image, _ in requests]
 
-    # Process inputs for the model
+    # Insert each task into the cached rendered prompt
+    text_prompts = [preprocessor.render_prompt(processor, task) + ANSWER_PREFILL for _, task in requests]
+
+    # Process all inputs together, padding the prompts to a common length. Padding must go on the left:
+    # generation continues from the last position of every row, which right padding would fill with pad tokens
+    processor.tokenizer.padding_side = "left"
     inputs = processor(
-        text=[text_prompt],
-        images=[processed_image],
+        text=text_prompts,
+        images=processed_images,
         padding=True,
         return_tensors="pt",
     ).to(model.device)
 
-    # Generate the model's response
-    generated_ids = model.generate(**inputs, max_new_tokens=256)
+    # Generate the model's responses for the whole batch
+    with span("generate", batch_size=len(requests), prompt_tokens=int(inputs.attention_mask.sum())) as generate_span:
+        with model_lock, torch.inference_mode():
+            generated_ids = model.generate(**inputs, **generation_options(processor))
 
-    # Trim the input IDs from the generated output
-    generated_ids_trimmed = [
-        out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-    ]
+        # Trim the input IDs from the generated output
+        generated_ids_trimmed = [
+            out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+        ]
+        generate_span.set(completion_tokens=sum(len(ids) for ids in generated_ids_trimmed))
 
-    # Decode the output to obtain the result
-    result = processor.batch_decode(
+    # Decode the outputs to obtain the results, restoring the prefilled start of the answer
+    return [ANSWER_PREFILL + text for text in processor.batch_decode(
         generated_ids_trimmed,
         skip_special_tokens=True,
         clean_up_tokenization_spaces=False
-    )[0]
-    return result
+    )]
 
 
-# Set up the Gradio interface for interactive prediction
-iface = gr.Interface(
-    fn=predict,
-    inputs=[gr.Image(type="pil"), gr.Textbox()],
-    outputs=gr.JSON()
+# Scheduler that groups concurrent predict() calls into batches
+batcher: MicroBatcher[tuple[Image.Image, str], Any] = MicroBatcher(
+    predict_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
 )
 
 
-# Launch the Gradio app with sharing enabled
-iface.launch(share=True)
\ No newline at end of file
+def cache_result(key: Any, result: Any) -> None:
+    """
+    Caches a model answer, unless it is not a usable click.
+
+    An unparseable (or failed) answer would otherwise be served for the cache's whole TTL, so a retry on
+    the same screen would never reach the model again.
+
+    Args:
+        key (Any): The cache key from `cache.make_key`.
+        result (Any): The model's decoded output.
+    """
+    if isinstance(result, str) and parse_click(result) is not None:
+        cache.put(key, result)
+
+
+def predict(image: ImageInput, task: str) -> Any:
+    """
+    Processes the input image and navigation task, generates a prompt, and returns the model's response.
+
+    Repeated (screen, task) pairs are answered from the cache; other concurrent calls are grouped
+    by the micro-batcher and share one generate call.
+
+    Args:
+        image (ImageInput): The input GUI image, as a PIL image, PNG/JPEG bytes or an RGB array.
+        task (str): The navigation task or target element description.
+
+    Returns:
+        Any: The model's decoded output, typically a JSON with click coordinates.
+    """
+    start = time.perf_counter()
+    image = load_image(image)
+    with span("predict", width=image.width, height=image.height) as predict_span:
+        key = cache.make_key(image, task)
+        result = cache.get(key)
+        predict_span.set(cache_hit=result is not None)
+        if result is None:
+            # Preprocess here, not in the batch, so the batcher's latency is generation alone
+            result = batcher.submit((prepare_image(image), task))
+            cache_result(key, result)
+    server.record_latency(time.perf_counter() - start)
+    return result
+
+
+def predict_region(image: ImageInput, task: str, left: int, top: int, right: int, bottom: int) -> dict[str, Any]:
+    """
+    Localizes a target inside one region of the screen and returns the click in full-screen coordinates.
+
+    The image may be the full screenshot (the region is cropped here) or, to keep the upload small, just the
+    region itself. Only the crop is resized for the model, so small regions are seen at (up to) native
+    resolution instead of being shrunk with the rest of the screen.
+
+    Args:
+        image (ImageInput): The full screenshot, or the already-cropped region (PIL image, PNG/JPEG bytes or RGB array).
+        task (str): The target element description.
+        left (int): The region's left edge in full-screen pixels.
+        top (int): The region's top edge in full-screen pixels.
+        right (int): The region's right edge in full-screen pixels.
+        bottom (int): The region's bottom edge in full-screen pixels.
+
+    Returns:
+        dict[str, Any]: The click action with full-screen "x" and "y", plus the "raw" model output
+        (only "raw" if the output could not be parsed).
+    """
+    left, top, right, bottom = int(left), int(top), int(right), int(bottom)
+    image = load_image(image)
+    crop = image if image.size == (right - left, bottom - top) else image.crop((left, top, right, bottom))
+    result = predict(crop, task)
+    click = parse_click(result)
+    if click is None:
+        # Counted in batch_metrics and on /metrics
+        tracer.increment("click_parse_failures")
+        return {"raw": result}
+
+    # The model answers in the resized crop's pixel space; scale to the crop, then offset into the screen
+    resized_width, resized_height = model_input_size(crop)
+    return {
+        "action": click.action,
+        "x": round(left + click.x * crop.width / resized_width),
+        "y": round(top + click.y * crop.height / resized_height),
+        "raw": result,
+    }
+
+
+def predict_many(image: ImageInput, tasks: list[str]) -> list[Any]:
+    """
+    Localizes several targets on the same screenshot, encoding the screenshot only once.
+
+    The prompt is identical up to the target description, so the image and the prompt up to the image
+    end marker are run through the model once and the resulting KV cache (including the vision features)
+    is reused for every target; each target then only costs the instructions, its own prompt tokens and decoding.
+
+    Args:
+        image (ImageInput): The input GUI image, as a PIL image, PNG/JPEG bytes or an RGB array.
+        tasks (list[str]): The target element descriptions.
+
+    Returns:
+        list[Any]: The model's decoded output for each task, in order.
+    """
+    start = time.perf_counter()
+    image = load_image(image)
+    keys = [cache.make_key(image, task) for task in tasks]
+    results: list[Any] = [cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    model, processor = server.get()
+    processed_image = prepare_image(image)
+
+    # The cached rendered prompt: the shared prefix ends at a special token (the image end marker), so
+    # tokenizing the per-task text on its own gives the same IDs as tokenizing the whole prompt
+    prefix_text, task_head = preprocessor.shared_prefix(processor)
+    _, suffix_template = preprocessor.prompt_parts(processor)
+
+    # Process the image and the shared prefix once
+    prefix_inputs = processor(
+        text=[prefix_text],
+        images=[processed_image],
+        return_tensors="pt",
+    ).to(model.device)
+
+    with model_lock, torch.inference_mode():
+        # Run the vision encoder and the prefix through the model once, keeping the KV cache
+        with span("prefill", width=image.width, height=image.height, tasks=len(pending),
+                  prompt_tokens=prefix_inputs.input_ids.shape[1]):
+            prefix_cache = model(**prefix_inputs, use_cache=True).past_key_values
+
+        for i in pending:
+            # Append only the task-specific tokens (instructions, task and generation prompt) to the cached prefix
+            suffix_ids = processor.tokenizer(
+                task_head + tasks[i] + suffix_template + ANSWER_PREFILL,
+                add_special_tokens=False,
+                return_tensors="pt",
+            ).input_ids.to(model.device)
+            input_ids = torch.cat([prefix_inputs.input_ids, suffix_ids], dim=1)
+
+            # Generate from a copy of the prefix cache so every task starts from the same state
+            with span("generate", batch_size=1, prompt_tokens=suffix_ids.shape[1]) as generate_span:
+                generated_ids = model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    pixel_values=prefix_inputs.pixel_values,
+                    image_grid_thw=prefix_inputs.image_grid_thw,
+                    past_key_values=copy.deepcopy(prefix_cache),
+                    **generation_options(processor),
+                )
+                generate_span.set(completion_tokens=generated_ids.shape[1] - input_ids.shape[1])
+
+            # Trim the input IDs and decode the result
+            results[i] = ANSWER_PREFILL + processor.decode(
+                generated_ids[0, input_ids.shape[1]:],
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False
+            )
+            cache_result(keys[i], results[i])
+
+    server.record_latency(time.perf_counter() - start)
+    return results
+
+
+def predict_many_text(image: Image.Image, tasks: str) -> list[Any]:
+    """
+    Gradio wrapper for `predict_many` taking one target description per line.
+
+    Args:
+        image (Image.Image): The input GUI image.
+        tasks (str): The target element descriptions, one per line.
+
+    Returns:
+        list[Any]: The model's decoded output for each target.
+    """
+    return predict_many(image, [line.strip() for line in tasks.splitlines() if line.strip()])
+
+
+def batch_metrics() -> dict[str, Any]:
+    """
+    Returns the micro-batcher's per-batch latency and throughput metrics, the cache hit and miss counters,
+    p50/p95 latency per traced stage, the median preprocessing and generation times side by side, and the
+    tracer's counters (e.g. click_parse_failures).
+
+    Returns:
+        dict[str, Any]: The metric values.
+    """
+    stages = tracer.summary()
+    latency_split = {f"{name}_p50_ms": stages[name]["p50_s"] * 1000 for name in ("preprocess", "generate") if name in stages}
+    return {**batcher.stats(), "cache": cache.stats(), "stages": stages, "latency_split": latency_split,
+            "counters": dict(tracer.counters)}
+
+
+def health() -> dict[str, Any]:
+    """
+    Readiness probe: reports whether the model is loaded and warmed up, plus cold-start and latency figures.
+
+    Returns:
+        dict[str, Any]: The server status.
+    """
+    return server.status()
+
+
+def warmup() -> None:
+    """Loads the model and runs one prediction on a blank screen so the first real request is not slow."""
+    blank_screen = Image.new("RGB", (1280, 720), "white")
+    server.warmup(lambda: predict_batch([(prepare_image(blank_screen), "the center of the screen")]))
+
+
+def build_app() -> gr.Blocks:
+    """
+    Builds the Gradio app with the prediction, metrics and health endpoints.
+
+    Returns:
+        gr.Blocks: The app, with its queue configured for batching.
+    """
+    # Set up the Gradio interface for interactive prediction
+    iface = gr.Interface(
+        fn=predict,
+        inputs=[gr.Image(type="pil"), gr.Textbox()],
+        outputs=gr.JSON()
+    )
+
+    # Several targets on one screenshot, sharing a single image encoding
+    many_iface = gr.Interface(
+        fn=predict_many_text,
+        inputs=[gr.Image(type="pil"), gr.Textbox(lines=4, placeholder="One target per line")],
+        outputs=gr.JSON(),
+        api_name="predict_many"
+    )
+
+    # Target inside a region of the screen, answered in full-screen coordinates
+    region_iface = gr.Interface(
+        fn=predict_region,
+        inputs=[
+            gr.Image(type="pil"),
+            gr.Textbox(),
+            gr.Number(label="left", precision=0),
+            gr.Number(label="top", precision=0),
+            gr.Number(label="right", precision=0),
+            gr.Number(label="bottom", precision=0),
+        ],
+        outputs=gr.JSON(),
+        api_name="predict_region"
+    )
+
+    # Expose the batching metrics alongside the prediction interface
+    metrics_iface = gr.Interface(
+        fn=batch_metrics,
+        inputs=None,
+        outputs=gr.JSON(),
+        api_name="metrics"
+    )
+
+    # Readiness probe for load balancers and the agents
+    health_iface = gr.Interface(
+        fn=health,
+        inputs=None,
+        outputs=gr.JSON(),
+        api_name="health"
+    )
+    app = gr.TabbedInterface(
+        [iface, many_iface, region_iface, metrics_iface, health_iface],
+        ["Predict", "Predict many", "Predict region", "Metrics", "Health"]
+    )
+
+    # Let concurrent requests reach predict() at the same time so they can be batched
+    app.queue(default_concurrency_limit=MAX_BATCH_SIZE)
+    return app
+
+
+def main() -> None:
+    global server, preprocessor
+    parser = argparse.ArgumentParser(description="Serve the Holo grounding model.")
+    parser.add_argument("--mode", choices=sorted(SERVING_MODES), default=default_mode_name(), help="Serving mode.")
+    parser.add_argument("--threads", type=int, default=None, help="Torch CPU threads (CPU modes only).")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the warmup pass (the model still loads before serving).")
+    parser.add_argument("--share", action="store_true", help="Create a public Gradio share link.")
+    parser.add_argument("--port", type=int, default=7860, help="Port to listen on.")
+    parser.add_argument("--resample", choices=RESAMPLE_METHODS, default=preprocessor.method,
+                        help="Screenshot resampling: lanczos (sharpest), bilinear, opencv (fastest on CPU) or torch (on the model's device).")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port (defaults to TRACE_METRICS_PORT, if set).")
+    args = parser.parse_args()
+
+    # Prometheus text endpoint with per-stage latency, token and payload counters
+    if args.metrics_port is not None:
+        tracer.serve_metrics(args.metrics_port, prefix="holo")
+    else:
+        serve_metrics_from_env(prefix="holo")
+
+    mode = SERVING_MODES[args.mode]
+    if args.threads is not None:
+        mode = dataclasses.replace(mode, cpu_threads=args.threads)
+    server = ModelServer(model_name, mode)
+    preprocessor = Preprocessor(args.resample)
+
+    # Load (and optionally warm up) before accepting traffic
+    if args.no_warmup:
+        server.mark_ready()
+    else:
+        warmup()
+    print(health())
+
+    # Launch the Gradio app
+    build_app().launch(share=args.share, server_port=args.port)
+
+
+if __name__ == "__main__":
+    main()
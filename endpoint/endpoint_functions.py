@@ -1,7 +1,11 @@
 from __future__ import annotations
+import json
 from typing import Any, Literal
 from PIL import Image
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+
+# Start of the model's answer, appended after the generation prompt so the model only fills in the coordinates
+CLICK_PREFILL = '{"action": "click_absolute", "x": '
 
 class ClickAbsoluteAction(BaseModel):
     """
@@ -17,6 +21,14 @@ class ClickAbsoluteAction(BaseModel):
     y: int = Field(description="The y coordinate, number of pixels from the top edge.")
 
 
+# Instructions with the JSON schema format, rendered once instead of on every request
+CLICK_INSTRUCTIONS = (
+    "Localize an element on the GUI image according to the provided target and output a click position.\n"
+    f" * You must output a valid JSON following the format: {ClickAbsoluteAction.model_json_schema()}\n"
+    " Your target is:"
+)
+
+
 def get_chat_messages(task: str, image: Image.Image) -> list[dict[str, Any]]:
     """
     Constructs a prompt for a navigation task, instructing the model to localize an element
@@ -29,20 +41,36 @@ def get_chat_messages(task: str, image: Image.Image) -> list[dict[str, Any]]:
     Returns:
         list[dict[str, Any]]: A list containing a single chat message dictionary structured for the model.
     """
-    # Create the prompt string with instructions and JSON schema format
-    prompt = (
-        "Localize an element on the GUI image according to the provided target and output a click position.\n"
-        f" * You must output a valid JSON following the format: {ClickAbsoluteAction.model_json_schema()}\n"
-        " Your target is:"
-    )
-
     # Return the chat message structure expected by the model
     return [
         {
             "role": "user",
             "content": [
                 {"type": "image", "image": image},
-                {"type": "text", "text": f"{prompt}\n{task}"},
+                {"type": "text", "text": f"{CLICK_INSTRUCTIONS}\n{task}"},
             ],
         },
-    ]
\ No newline at end of file
+    ]
+
+def parse_click(text: str) -> ClickAbsoluteAction | None:
+    """
+    Parses the model's output into a click action.
+
+    Every '{' is tried as the start of an object, so surrounding text, stray braces and extra objects
+    do not hide a valid click.
+
+    Args:
+        text (str): The decoded model output, expected to contain a ClickAbsoluteAction JSON object.
+
+    Returns:
+        ClickAbsoluteAction | None: The first valid click, or None if the output holds no valid click.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            obj, _ = decoder.raw_decode(text, start)
+            return ClickAbsoluteAction.model_validate(obj)
+        except (json.JSONDecodeError, ValidationError):
+            start = text.find("{", start + 1)
+    return None
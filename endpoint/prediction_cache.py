@@ -0,0 +1,190 @@
+from __future__ import annotations
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Any
+import numpy as np
+from PIL import Image
+
+# Fixed per-entry overhead added to the byte estimate (key tuple, timestamps, dict slots)
+_ENTRY_OVERHEAD = 200
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = 16) -> str:
+    """
+    Computes a difference hash (dHash) of an image.
+
+    The image is shrunk to (hash_size + 1) x hash_size greyscale and each bit records whether a
+    pixel is brighter than its right neighbour, so re-encoding noise and tiny pixel shifts do not
+    change the hash while visible content changes do.
+
+    Args:
+        image (Image.Image): The image to hash.
+        hash_size (int): The hash grid size; the hash has hash_size * hash_size bits.
+
+    Returns:
+        str: The hash as a hex string.
+    """
+    # Skip the full-size colour conversion when the mode can already be resized directly
+    source = image if image.mode in ("RGB", "L") else image.convert("RGB")
+    small = source.resize((hash_size + 1, hash_size), Image.Resampling.BOX, reducing_gap=2.0)
+    pixels = np.asarray(small.convert("L"), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return np.packbits(bits).tobytes().hex()
+
+
+def normalize_task(task: str) -> str:
+    """
+    Normalizes a task description so trivially different phrasings share a cache entry.
+
+    Args:
+        task (str): The target element description.
+
+    Returns:
+        str: The lower-cased task with collapsed whitespace and no trailing punctuation.
+    """
+    return " ".join(task.lower().split()).rstrip(".!?")
+
+
+class PredictionCache:
+    """
+    An LRU + TTL cache of grounding results keyed by image size, perceptual hash and normalized task.
+
+    Attributes:
+        max_entries (int): The maximum number of entries.
+        max_bytes (int): The approximate memory cap in bytes.
+        ttl (float): The entry lifetime in seconds.
+        persist_path (str | None): A JSON file to load from and save to, or None to keep the cache in memory.
+        hits (int): The number of cache hits.
+        misses (int): The number of cache misses.
+        evictions (int): The number of entries evicted for size or age.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 600.0,
+        persist_path: str | None = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def make_key(image: Image.Image, task: str) -> str:
+        """
+        Builds the cache key for an image and task.
+
+        Args:
+            image (Image.Image): The input GUI image.
+            task (str): The target element description.
+
+        Returns:
+            str: The cache key.
+        """
+        # The image size is part of the key because the returned coordinates depend on it
+        return f"{image.width}x{image.height}:{perceptual_hash(image)}:{normalize_task(task)}"
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self, key: str) -> None:
+        self._remove(key)
+        self.evictions += 1
+
+    def get(self, key: str) -> Any | None:
+        """
+        Looks up a result, refreshing its LRU position.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Any | None: The cached result, or None on a miss or an expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, stored_at: float | None = None) -> None:
+        """
+        Stores a result, evicting the least recently used entries to respect the caps.
+
+        Args:
+            key (str): The cache key.
+            value (Any): The JSON-serializable result.
+            stored_at (float | None): The time the result was produced (defaults to now).
+        """
+        size = len(key) + len(json.dumps(value)) + _ENTRY_OVERHEAD
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() if stored_at is None else stored_at, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._evict(next(iter(self._entries)))
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns the cache counters.
+
+        Returns:
+            dict[str, Any]: Hits, misses, hit rate, size and evictions.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
+
+    def save(self) -> None:
+        """Writes the unexpired entries to `persist_path`."""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            records = [[key, value, stored_at] for key, (value, stored_at, _) in self._entries.items()
+                       if now - stored_at <= self.ttl]
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self) -> None:
+        """Loads unexpired entries from `persist_path`, if the file exists."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        with open(self.persist_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        now = time.time()
+        for key, value, stored_at in records:
+            if now - stored_at <= self.ttl:
+                self.put(key, value, stored_at)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+import io
+import time
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Union
+import numpy as np
+from PIL import Image
+from transformers.models.qwen2_vl.image_processing_qwen2_vl import smart_resize
+from .endpoint_functions import get_chat_messages
+
+# Resampling methods: PIL Lanczos (the original, sharpest), PIL bilinear with a box pre-reduction (fast),
+# OpenCV INTER_AREA (SIMD, releases the GIL) and antialiased bilinear on the model's device with torch
+RESAMPLE_METHODS = ("lanczos", "bilinear", "opencv", "torch")
+
+# Placeholder used to split the rendered prompt into the text before and after the task
+TASK_PLACEHOLDER = "<<TASK>>"
+
+# What the endpoint accepts as an image: a decoded PIL image, encoded PNG/JPEG bytes, or an RGB array
+ImageInput = Union[Image.Image, bytes, np.ndarray]
+
+
+@dataclass(frozen=True)
+class ResizePlan:
+    """
+    The model input size for one screen resolution.
+
+    Attributes:
+        source_width (int): The original width.
+        source_height (int): The original height.
+        width (int): The width the model sees; click coordinates refer to it.
+        height (int): The height the model sees.
+    """
+    source_width: int
+    source_height: int
+    width: int
+    height: int
+
+    @property
+    def identity(self) -> bool:
+        """Whether the image is already at the model input size."""
+        return (self.source_width, self.source_height) == (self.width, self.height)
+
+
+@lru_cache(maxsize=256)
+def resize_plan(width: int, height: int, factor: int, min_pixels: int, max_pixels: int) -> ResizePlan:
+    """
+    Computes (once per resolution and processor configuration) the size the image processor resizes to.
+
+    Args:
+        width (int): The image width.
+        height (int): The image height.
+        factor (int): The resize factor (patch size x merge size).
+        min_pixels (int): The image processor's minimum pixel count.
+        max_pixels (int): The image processor's maximum pixel count.
+
+    Returns:
+        ResizePlan: The model input size.
+    """
+    resized_height, resized_width = smart_resize(height, width, factor=factor, min_pixels=min_pixels, max_pixels=max_pixels)
+    return ResizePlan(width, height, resized_width, resized_height)
+
+
+def load_image(data: ImageInput) -> Image.Image:
+    """
+    Converts any accepted input into an RGB PIL image.
+
+    Args:
+        data (ImageInput): A PIL image, PNG/JPEG bytes, or a (height, width, 3) uint8 RGB array.
+
+    Returns:
+        Image.Image: The image (the same object if it already was an RGB PIL image).
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = Image.open(io.BytesIO(data))
+    elif isinstance(data, np.ndarray):
+        return Image.fromarray(np.ascontiguousarray(data[..., :3]))
+    return data if data.mode == "RGB" else data.convert("RGB")
+
+
+class Preprocessor:
+    """
+    Resizes screenshots to the model input size and renders prompts, caching everything that only depends
+    on the resolution or the processor.
+
+    The chat template renders the image as a single placeholder that the processor expands later, so the
+    rendered prompt is the same for every resolution and only the task has to be inserted per request.
+
+    Attributes:
+        method (str): The resampling method (one of RESAMPLE_METHODS).
+        device (Any): The torch device for the "torch" method (e.g. the model's device).
+    """
+
+    def __init__(self, method: str = "lanczos", device: Any = None) -> None:
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(f"Unknown resampling method '{method}'; expected one of {RESAMPLE_METHODS}")
+        self.method = method
+        self.device = device
+        self._prompts: dict[int, tuple[str, str]] = {}
+        self._prefix_cuts: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def plan(self, processor: Any, width: int, height: int) -> ResizePlan:
+        """
+        Returns the cached resize plan for a resolution under a processor's configuration.
+
+        Args:
+            processor (Any): The model's processor.
+            width (int): The image width.
+            height (int): The image height.
+
+        Returns:
+            ResizePlan: The model input size.
+        """
+        config = processor.image_processor
+        return resize_plan(width, height, config.patch_size * config.merge_size, config.min_pixels, config.max_pixels)
+
+    def resize(self, image: Image.Image, plan: ResizePlan) -> Image.Image:
+        """
+        Resizes an image according to a plan with the configured method.
+
+        Args:
+            image (Image.Image): The RGB image at the plan's source size.
+            plan (ResizePlan): The resize plan.
+
+        Returns:
+            Image.Image: The resized image.
+        """
+        size = (plan.width, plan.height)
+        if plan.identity:
+            return image
+        if self.method == "lanczos":
+            return image.resize(size, resample=Image.Resampling.LANCZOS)
+        if self.method == "bilinear":
+            # reducing_gap first shrinks by an integer factor with a cheap box filter
+            return image.resize(size, resample=Image.Resampling.BILINEAR, reducing_gap=3.0)
+        if self.method == "opencv":
+            import cv2
+
+            downscale = plan.width * plan.height < plan.source_width * plan.source_height
+            interpolation = cv2.INTER_AREA if downscale else cv2.INTER_CUBIC
+            return Image.fromarray(cv2.resize(np.asarray(image), size, interpolation=interpolation))
+
+        import torch
+        import torch.nn.functional as F
+
+        pixels = torch.from_numpy(np.array(image)).to(self.device or "cpu")
+        pixels = pixels.permute(2, 0, 1).unsqueeze(0).float()
+        resized = F.interpolate(pixels, size=(plan.height, plan.width), mode="bilinear", antialias=True, align_corners=False)
+        resized = resized.round().clamp(0, 255).to(torch.uint8).squeeze(0).permute(1, 2, 0)
+        return Image.fromarray(resized.cpu().numpy())
+
+    def prepare(self, image: Image.Image, processor: Any) -> tuple[Image.Image, ResizePlan, float]:
+        """
+        Resizes an image to the model input size.
+
+        Args:
+            image (Image.Image): The RGB image.
+            processor (Any): The model's processor.
+
+        Returns:
+            tuple[Image.Image, ResizePlan, float]: The resized image, its plan, and the seconds spent resizing.
+        """
+        start = time.perf_counter()
+        plan = self.plan(processor, image.width, image.height)
+        resized = self.resize(image, plan)
+        return resized, plan, time.perf_counter() - start
+
+    def prompt_parts(self, processor: Any) -> tuple[str, str]:
+        """
+        Returns the rendered prompt split around the task, rendering it on first use.
+
+        Args:
+            processor (Any): The model's processor.
+
+        Returns:
+            tuple[str, str]: The prompt text before and after the task (the latter ends with the generation prompt).
+        """
+        key = id(processor)
+        with self._lock:
+            parts = self._prompts.get(key)
+            if parts is None:
+                placeholder_image = Image.new("RGB", (1, 1))
+                template = processor.apply_chat_template(
+                    get_chat_messages(TASK_PLACEHOLDER, placeholder_image),
+                    tokenize=False,
+                    add_generation_prompt=True
+                )
+                prefix, suffix = template.split(TASK_PLACEHOLDER)
+                parts = self._prompts[key] = (prefix, suffix)
+            return parts
+
+    def shared_prefix(self, processor: Any) -> tuple[str, str]:
+        """
+        Splits the text before the task at its last added (special) token, for prefix KV cache reuse.
+
+        Added tokens are matched before BPE runs, so text on either side of one tokenizes independently:
+        the shared prefix followed by the per-task text gives exactly the IDs of the full prompt, which a
+        split directly before the task (where BPE may merge across the boundary) does not guarantee.
+
+        Args:
+            processor (Any): The model's processor.
+
+        Returns:
+            tuple[str, str]: The shared prefix (ending with an added token, e.g. the image end marker) and the
+            rest of the text before the task, which is tokenized with each task.
+        """
+        prefix, _ = self.prompt_parts(processor)
+        key = id(processor)
+        with self._lock:
+            cut = self._prefix_cuts.get(key)
+            if cut is None:
+                cut = 0
+                for token in processor.tokenizer.get_added_vocab():
+                    index = prefix.rfind(token)
+                    if index != -1:
+                        cut = max(cut, index + len(token))
+                self._prefix_cuts[key] = cut
+        return prefix[:cut], prefix[cut:]
+
+    def render_prompt(self, processor: Any, task: str) -> str:
+        """
+        Renders the full prompt text for one task from the cached template.
+
+        Args:
+            processor (Any): The model's processor.
+            task (str): The target element description.
+
+        Returns:
+            str: The prompt text, ending with the generation prompt.
+        """
+        prefix, suffix = self.prompt_parts(processor)
+        return prefix + task + suffix
@@ -0,0 +1,200 @@
+from __future__ import annotations
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any
+import torch
+from transformers import AutoModelForImageTextToText, AutoProcessor
+
+
+@dataclass(frozen=True)
+class ServingMode:
+    """
+    How the model is loaded and run.
+
+    Attributes:
+        name (str): The mode name used on the command line.
+        device_map (str): The `device_map` passed to `from_pretrained` ("auto" or "cpu").
+        dtype (torch.dtype): The weight dtype.
+        attn_implementation (str): The attention kernel ("sdpa" uses PyTorch's fused attention).
+        quantize_int8 (bool): Whether to apply dynamic int8 quantization to the Linear layers (CPU only).
+        cpu_threads (int | None): The torch intra-op thread count, or None to use every available core.
+    """
+    name: str
+    device_map: str
+    dtype: torch.dtype
+    attn_implementation: str = "sdpa"
+    quantize_int8: bool = False
+    cpu_threads: int | None = None
+
+
+# Available serving modes
+SERVING_MODES: dict[str, ServingMode] = {
+    # GPU (or whatever accelerate finds) in bfloat16, as the endpoint originally ran
+    "gpu": ServingMode("gpu", device_map="auto", dtype=torch.bfloat16),
+    # Plain CPU inference in float32
+    "cpu": ServingMode("cpu", device_map="cpu", dtype=torch.float32),
+    # CPU in bfloat16; fast on CPUs with AVX512-BF16/AMX, slow elsewhere
+    "cpu-bf16": ServingMode("cpu-bf16", device_map="cpu", dtype=torch.bfloat16),
+    # CPU with dynamically quantized int8 Linear layers: smaller and usually the fastest CPU mode
+    "cpu-int8": ServingMode("cpu-int8", device_map="cpu", dtype=torch.float32, quantize_int8=True),
+}
+
+
+def default_mode_name() -> str:
+    """
+    Picks the serving mode from HOLO_SERVING_MODE, falling back to "gpu" when CUDA is available and "cpu-int8" otherwise.
+
+    Returns:
+        str: The serving mode name.
+    """
+    return os.getenv("HOLO_SERVING_MODE") or ("gpu" if torch.cuda.is_available() else "cpu-int8")
+
+
+def available_cpu_count() -> int:
+    """
+    Counts the CPU cores this process may run on.
+
+    Returns:
+        int: The number of usable cores.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_model(model_name: str, mode: ServingMode) -> tuple[Any, Any]:
+    """
+    Loads the model and processor for a serving mode.
+
+    Args:
+        model_name (str): The Hugging Face model name.
+        mode (ServingMode): The serving mode.
+
+    Returns:
+        tuple[Any, Any]: The model and the processor.
+    """
+    if mode.device_map == "cpu":
+        # Use every core for intra-op parallelism and keep inter-op work on one thread
+        torch.set_num_threads(mode.cpu_threads or available_cpu_count())
+        torch.set_num_interop_threads(1)
+
+    model = AutoModelForImageTextToText.from_pretrained(
+        model_name,
+        dtype=mode.dtype,
+        device_map=mode.device_map,
+        attn_implementation=mode.attn_implementation,
+    )
+    model.eval()
+
+    if mode.quantize_int8:
+        # Replace Linear layers with int8 dynamic-quantized versions (weights int8, activations quantized on the fly)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    processor = AutoProcessor.from_pretrained(model_name)
+    # Pad on the left so every prompt in a batch ends where generation starts
+    processor.tokenizer.padding_side = "left"
+    return model, processor
+
+
+class ModelServer:
+    """
+    Loads the model lazily, runs a warmup pass and reports readiness and latency.
+
+    Attributes:
+        model_name (str): The Hugging Face model name.
+        mode (ServingMode): The serving mode.
+        load_time (float | None): Seconds spent loading the model (cold start), once loaded.
+        warmup_time (float | None): Seconds spent on the warmup pass, once done.
+        latencies (list[float]): Recent per-request latencies in seconds.
+    """
+
+    def __init__(self, model_name: str, mode: ServingMode, max_latency_samples: int = 1000) -> None:
+        self.model_name = model_name
+        self.mode = mode
+        self.load_time: float | None = None
+        self.warmup_time: float | None = None
+        self.latencies: list[float] = []
+        self._max_latency_samples = max_latency_samples
+        self._model: Any = None
+        self._processor: Any = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def get(self) -> tuple[Any, Any]:
+        """
+        Returns the model and processor, loading them on first use.
+
+        Returns:
+            tuple[Any, Any]: The model and the processor.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    model, processor = load_model(self.model_name, self.mode)
+                    self.load_time = time.perf_counter() - start
+                    self._processor = processor
+                    self._model = model
+                    print(f"Loaded {self.model_name} in mode '{self.mode.name}' in {self.load_time:.1f}s")
+        return self._model, self._processor
+
+    def warmup(self, run: Any) -> None:
+        """
+        Loads the model and runs one request so kernels and caches are initialized before traffic arrives.
+
+        Args:
+            run (Any): A zero-argument callable that performs one representative request.
+        """
+        self.get()
+        start = time.perf_counter()
+        run()
+        self.warmup_time = time.perf_counter() - start
+        self._ready.set()
+        print(f"Warmup finished in {self.warmup_time:.1f}s")
+
+    def mark_ready(self) -> None:
+        """Marks the server ready without a warmup pass."""
+        self.get()
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        """Whether the model is loaded and warmed up."""
+        return self._ready.is_set()
+
+    def record_latency(self, seconds: float) -> None:
+        """
+        Records the latency of one request.
+
+        Args:
+            seconds (float): The request latency in seconds.
+        """
+        self.latencies.append(seconds)
+        if len(self.latencies) > self._max_latency_samples:
+            del self.latencies[:len(self.latencies) - self._max_latency_samples]
+
+    def status(self) -> dict[str, Any]:
+        """
+        Reports readiness, cold-start time and request latency for the current mode.
+
+        Returns:
+            dict[str, Any]: The status values.
+        """
+        samples = sorted(self.latencies)
+
+        def percentile(q: float) -> float | None:
+            return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+        return {
+            "ready": self.ready,
+            "mode": self.mode.name,
+            "model": self.model_name,
+            "load_time_s": self.load_time,
+            "warmup_time_s": self.warmup_time,
+            "requests": len(samples),
+            "latency_p50_s": percentile(0.5),
+            "latency_p95_s": percentile(0.95),
+        }
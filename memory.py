@@ -0,0 +1,184 @@
+from __future__ import annotations
+from typing import Any
+from streaming import extract_tool_object
+
+# Rough token cost of one screenshot; providers bill images by tiles, this is a safe middle estimate
+IMAGE_TOKEN_ESTIMATE = 1000
+# Rough number of characters per text token
+CHARS_PER_TOKEN = 4
+# Maximum length of one line in the summary of compacted turns
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(message: dict[str, Any]) -> int:
+    """
+    Estimates the prompt tokens a chat message will cost.
+
+    Args:
+        message (dict[str, Any]): A chat message with string or multi-part content.
+
+    Returns:
+        int: The estimated token count.
+    """
+    content = message.get("content")
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 4
+    tokens = 4
+    for part in content or []:
+        if part.get("type") == "text":
+            tokens += len(part.get("text", "")) // CHARS_PER_TOKEN
+        elif part.get("type") == "image_url":
+            tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def strip_images(message: dict[str, Any]) -> dict[str, Any]:
+    """
+    Returns a copy of a message with every image replaced by a short text placeholder.
+
+    Args:
+        message (dict[str, Any]): A chat message with string or multi-part content.
+
+    Returns:
+        dict[str, Any]: The message without image parts.
+    """
+    content = message.get("content")
+    if isinstance(content, str) or not any(part.get("type") == "image_url" for part in content or []):
+        return message
+    parts = [
+        part if part.get("type") != "image_url" else {"type": "text", "text": "[earlier screenshot omitted]"}
+        for part in content
+    ]
+    return {**message, "content": parts}
+
+
+def summarize_message(message: dict[str, Any]) -> str:
+    """
+    Condenses a message into a single line for the summary of earlier steps.
+
+    Args:
+        message (dict[str, Any]): A chat message.
+
+    Returns:
+        str: A one-line summary.
+    """
+    content = message.get("content")
+    if not isinstance(content, str):
+        content = " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+    if message.get("role") == "assistant":
+        # Keep the action the assistant took rather than its reasoning
+        parsed = extract_tool_object(content)
+        if parsed is not None:
+            content = f"{parsed.get('tool')}: {parsed.get('description', '')}"
+    line = " ".join(content.split())
+    if len(line) > SUMMARY_LINE_CHARS:
+        line = line[:SUMMARY_LINE_CHARS - 3] + "..."
+    return f"{message.get('role')}: {line}"
+
+
+class ConversationMemory:
+    """
+    Keeps the conversation within a token budget for long tasks.
+
+    The system prompt and the original query are always kept. Earlier turns lose their images (except
+    the reference screenshot, which ROI crops are relative to), and once the budget is exceeded the oldest turns are folded into a compact summary of earlier
+    steps, so the prompt size (and step latency) stays roughly flat however long the task runs.
+
+    Attributes:
+        system_message (dict[str, Any]): The system prompt message.
+        query_message (dict[str, Any]): The user's original query message.
+        token_budget (int): The maximum estimated prompt tokens per request.
+        keep_recent (int): The number of most recent messages that are never compacted.
+        max_summary_lines (int): The maximum number of summary lines kept; older lines are dropped.
+        turns (list[dict[str, Any]]): The messages after the query that are still kept verbatim.
+        summary (list[str]): One line per compacted message.
+        reference (dict[str, Any] | None): A message whose images are kept in every request until replaced.
+        prompt_tokens (list[int]): The prompt tokens of each request (reported by the provider when available, else estimated).
+    """
+
+    def __init__(
+        self,
+        system_message: dict[str, Any],
+        query_message: dict[str, Any],
+        token_budget: int = 6000,
+        keep_recent: int = 6,
+        max_summary_lines: int = 30,
+    ) -> None:
+        self.system_message = system_message
+        self.query_message = query_message
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.max_summary_lines = max_summary_lines
+        self.turns: list[dict[str, Any]] = []
+        self.summary: list[str] = []
+        self.reference: dict[str, Any] | None = None
+        self.prompt_tokens: list[int] = []
+        self._last_estimate = 0
+
+    def append(self, message: dict[str, Any]) -> None:
+        """
+        Adds a message to the history, dropping any images it carries.
+
+        Args:
+            message (dict[str, Any]): The chat message to add.
+        """
+        self.turns.append(strip_images(message))
+
+    def set_reference(self, message: dict[str, Any] | None) -> None:
+        """
+        Keeps a message, images included, in every following request (e.g. the last full screenshot in ROI mode).
+
+        Args:
+            message (dict[str, Any] | None): The message to keep, replacing the previous one, or None to drop it.
+        """
+        self.reference = message
+
+    def _summary_message(self) -> dict[str, Any] | None:
+        if not self.summary:
+            return None
+        return {"role": "user", "content": "Summary of earlier steps:\n" + "\n".join(self.summary)}
+
+    def _history(self) -> list[dict[str, Any]]:
+        summary_message = self._summary_message()
+        head = [self.system_message, strip_images(self.query_message)]
+        if self.reference is not None:
+            head.append(self.reference)
+        return head + ([summary_message] if summary_message else []) + self.turns
+
+    def build(self, current_state: dict[str, Any]) -> list[dict[str, Any]]:
+        """
+        Builds the message list for the next request, compacting old turns to fit the budget.
+
+        Args:
+            current_state (dict[str, Any]): The message with the current screenshot; it keeps its image.
+
+        Returns:
+            list[dict[str, Any]]: The messages to send.
+        """
+        state_tokens = estimate_tokens(current_state)
+        total = sum(estimate_tokens(message) for message in self._history()) + state_tokens
+
+        # Fold the oldest turns into the summary until the prompt fits the budget
+        while total > self.token_budget and len(self.turns) > self.keep_recent:
+            oldest = self.turns.pop(0)
+            self.summary.append(summarize_message(oldest))
+            if len(self.summary) > self.max_summary_lines:
+                self.summary = self.summary[-self.max_summary_lines:]
+            total = sum(estimate_tokens(message) for message in self._history()) + state_tokens
+
+        self._last_estimate = total
+        return self._history() + [current_state]
+
+    def record_usage(self, prompt_tokens: int | None) -> int:
+        """
+        Records the prompt size of the request just made.
+
+        Args:
+            prompt_tokens (int | None): The prompt tokens reported by the provider, or None if unavailable.
+
+        Returns:
+            int: The recorded token count (the estimate when the provider reported none).
+        """
+        tokens = prompt_tokens if prompt_tokens is not None else self._last_estimate
+        self.prompt_tokens.append(tokens)
+        return tokens
@@ -1,21 +1,31 @@
 from __future__ import annotations
 import os
-import json
 from dotenv import load_dotenv
-from openai import AzureOpenAI
-from capture import take_screenshot
-from utils import encode_image_to_base64
+from pydantic import ValidationError
+from actions import JSON_OUTPUT_PROMPT, TOOL_NAMES, TOOL_RESPONSE_SCHEMA, ActionExecutor, ExecutionError, PlanOutcome, ToolPlan
+from archive import archive_from_env
+from capture import get_default_capture
+from change_detection import ChangeDetector
+from memory import ConversationMemory
+from pipeline import FramePipeline, StepTimer
+from providers import CallInfo, build_pool
+from roi import build_roi_payload
+from router import CLICK_ACTION_PROMPT, TaskRouter, grounding_from_env
+from streaming import extract_tool_object, stream_completion
+from tracing import serve_metrics_from_env, tracer
+from trajectory import TrajectoryRecorder, TrajectoryStore
+from utils import ENCODING_PROFILES, EncodingProfile
 
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_version="2025-03-01-preview",
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_endpoint="https://harsh-mamhtiwt-eastus2.cognitiveservices.azure.com/"
-)
+# Initialize the provider pool: every AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_KEY1 ... key is rotated (endpoint from
+# AZURE_OPENAI_ENDPOINT). Set AZURE_AGENT_PROVIDERS to comma-separated "backend:model" tiers to add failover
+client = build_pool(os.getenv("AZURE_AGENT_PROVIDERS", "azure:gpt-4.1"))  # Replace gpt-4.1 with your deployment name
+
+# Recorded successful runs, replayed without the model when the same query comes in again
+trajectories = TrajectoryStore(os.getenv("TRAJECTORY_STORE", "trajectories.json"))
 
 # System prompt (same as in your original)
 SYSTEM_PROMPT = """
@@ -26,7 +36,7 @@ When typing mention where you are typing (e.g., address bar, search box, form fi
 Process Flow:
     1. Analyze the current screenshot and query to understand the task
     2. Reason step-by-step about required actions to take based on the current screen state.
-    3. After reasoning all the steps, you will describe and execute one action by outputting a JSON object with the required action.
+    3. After reasoning all the steps, you will describe and execute one action, or a plan of several actions whose results you can predict, by outputting a JSON object.
     4. Wait for a new screenshot to be provided. Use this screenshot to check if the action was successful before continuing with the next action. If the action was not successful, adjust your approach based on the new screenshot.
     5. Output plain text when keyboard actions are not required.
     6. Repeat steps 1-5 until the task is complete.
@@ -36,135 +46,391 @@ Output Format:
     2. For keyboard actions: Output ONLY a JSON object with this exact structure
         {"tool": "action",
         "description": "A description of the action being taken based on the current screenshot.",
-        "program": "The python code to execute the action based on the current screenshot."}
-program: 
-    1. Use the pyautogui library to perform keyboard actions. 
-    2. Import pyautogui at the start of your program.
-    3. Use pyautogui.hotkey() for keyboard shortcuts. 
-    4. When typing go to the appropriate field first (e.g., address bar) then use pyautogui.write() to type.
+        "action": <one of the actions below>}
+    3. For a sequence of actions whose results you can predict from the current screenshot: Output ONLY a JSON plan
+        {"tool": "plan",
+        "description": "A description of the plan based on the current screenshot.",
+        "steps": [{"action": <one of the actions below>, "expect_change": true, "checkpoint": false}, ...]}
+        The steps run without new screenshots. "expect_change" (optional) says whether the step should visibly change the screen;
+        the plan stops early if it does not. Set "checkpoint": true on a step after which you need to see the screen before continuing.
+action:
+    1. {"action": "hotkey", "keys": ["ctrl", "t"]} for keyboard shortcuts.
+    2. {"action": "press", "key": "enter", "presses": 1} to press a single key (presses is optional).
+    3. {"action": "write", "text": "..."} to type text. Go to the appropriate field first (e.g., address bar).
+    4. {"action": "wait", "seconds": 2} to wait for a page to load (at most 10 seconds).
+    5. {"action": "batch", "actions": [...]} to run several of the actions above in order.
+    Key names follow pyautogui: ctrl, alt, shift, enter, tab, esc, backspace, delete, up, down, left, right, pageup, pagedown, home, end, f1-f12.
 Important Notes:
     1. Always analyze the current screenshot before taking any action.
     2. If an action does not lead to the expected result of the task, adjust your approach based on the new screenshot.
     3. You will reason step-by-step before taking any action.
+    4. Prefer a plan when the next few actions do not depend on what appears on screen; use single actions when they do.
 Example: # if error occurs remove this
     query: program to open a new tab and navigate to a URL
     initial screenshot: (screenshot of a browser)
     reasoning: I need to open a new tab and navigate to a URL. To do this, I will:
         1. Use the Ctrl+T shortcut to open a new tab.
         2. Use the Ctrl+L shortcut to navigate to the URL.
-    action: {"tool": "action", "description": "Open a new tab and navigate to a URL.", "program": "pyautogui.hotkey('ctrl', 't'); pyautogui.hotkey('ctrl', 'l');"}
+    action: {"tool": "action", "description": "Open a new tab and focus the address bar.", "action": {"action": "batch", "actions": [{"action": "hotkey", "keys": ["ctrl", "t"]}, {"action": "hotkey", "keys": ["ctrl", "l"]}]}}
+    plan: {"tool": "plan", "description": "Open a new tab and go to the URL.", "steps": [{"action": {"action": "hotkey", "keys": ["ctrl", "t"]}, "expect_change": true}, {"action": {"action": "write", "text": "https://example.com"}}, {"action": {"action": "press", "key": "enter"}, "expect_change": true, "checkpoint": true}]}
     """
 
 
-def perform_task(query: str) -> None:
-    # Initialize conversation with system prompt
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT}
-    ]
+# Optional screenshot archive (SCREENSHOT_ARCHIVE=<directory>); frames are written on a background thread
+archive = archive_from_env()
 
-    # Add initial user query
-    messages.append({
-            "role": "user",
-            "content": [
-                {"type": "text", "text": query},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{encode_image_to_base64(take_screenshot())}"}
-                }]
-        })
+# Send a low-resolution thumbnail plus sharp crops of the changed regions when only part of the screen changed
+ROI_CROPS = os.getenv("ROI_CROPS", "0") == "1"
+# Steps in ROI mode after which a full frame is sent again, even if little changed
+ROI_FULL_FRAME_EVERY = int(os.getenv("ROI_FULL_FRAME_EVERY", "5"))
 
-    while True:
-        # Take a fresh screenshot
-        screenshot_path = take_screenshot()
-        image_base64 = encode_image_to_base64(screenshot_path)
+# Consecutive failed model calls (after the pool's own retries and failover) before the task is abandoned
+MAX_API_FAILURES = int(os.getenv("MAX_API_FAILURES", "3"))
 
-        # Append current screen state to messages
-        current_state = {
+# Ask for a single JSON object (reasoning included) and constrain decoding with each provider's response format.
+# Unset, it is only used without streaming: the reasoning comes first, so the object closes at the very end of
+# the response and a streamed action could no longer be acted on early
+JSON_MODE = {"1": True, "0": False}.get(os.getenv("JSON_MODE", ""))
+
+# Local Holo grounding endpoint (HOLO_ENDPOINT_URL); when set, the model may click described elements
+grounding = grounding_from_env()
+
+# Validating executor for the model's actions; pause and typing interval are tunable via the environment
+# (click targets are grounded through the router, set up below perform_task)
+executor = ActionExecutor(
+    pause=float(os.getenv("ACTION_PAUSE", "0.02")),
+    typing_interval=float(os.getenv("TYPING_INTERVAL", "0.0")),
+)
+
+
+def execute_action(action: dict, detector: ChangeDetector | None = None) -> PlanOutcome | None:
+    """
+    Validates and executes one action or plan object produced by the model.
+
+    Args:
+        action (dict): The parsed {"tool": "action", ...} or {"tool": "plan", ...} object.
+        detector (ChangeDetector | None): The change detector used to check plan steps, or None to run plans unchecked.
+
+    Returns:
+        PlanOutcome | None: The plan outcome, or None for a single action.
+
+    Raises:
+        pydantic.ValidationError: If the object does not match the action schema.
+        ValueError: If the action uses an unknown key name.
+    """
+    if action.get("tool") == "plan":
+        return executor.execute_plan(ToolPlan.model_validate(action), detector)
+    executor.execute_tool_object(action)
+    return None
+
+
+def perform_task(query: str, profile: EncodingProfile = ENCODING_PROFILES["azure"], stream: bool = True, replay: bool = True,
+                 roi: bool = ROI_CROPS, json_mode: bool | None = JSON_MODE, note: str | None = None) -> bool:
+    """
+    Runs the screenshot -> Azure OpenAI model -> keyboard action loop until the task is done.
+
+    Args:
+        query (str): The user's task description.
+        profile (EncodingProfile): How screenshots are downscaled and compressed before upload.
+        stream (bool): Whether to stream completions and act on the first complete action.
+        replay (bool): Whether to replay a recorded trajectory for this query before calling the model.
+        roi (bool): Whether to send a thumbnail plus crops of the changed regions instead of the full frame when possible.
+        json_mode (bool | None): Whether to request schema-constrained JSON output with the reasoning in a "reasoning"
+            field; None enables it only when not streaming.
+        note (str | None): What was already done for this task before the model took over (e.g. a local click).
+
+    Returns:
+        bool: True once the model reports the task complete, False if the model calls keep failing.
+    """
+    if json_mode is None:
+        json_mode = not stream
+    # Bounded conversation memory: keeps the system prompt and the query (the first loop iteration
+    # supplies the screenshot, so it is not sent twice) and compacts older turns
+    memory = ConversationMemory(
+        {"role": "system", "content": SYSTEM_PROMPT + (CLICK_ACTION_PROMPT if grounding else "")
+            + (JSON_OUTPUT_PROMPT if json_mode else "")},
+        {
             "role": "user",
             "content": [
-                {"type": "text", "text": "Current screen state:"},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                }
-            ]
+                {"type": "text", "text": query}]
         }
+    )
+
+    # Waits for the screen to settle after each action and remembers the frame the model last saw
+    detector = ChangeDetector(get_default_capture())
+    # Fingerprint of the screen before the last executed action (None if no action was executed)
+    pre_action_fingerprint = None
 
-        # Build full message list for this turn
-        current_messages = messages + [current_state]
+    # Records this run so it can be replayed next time
+    recorder = TrajectoryRecorder(query)
+
+    # Per-task counters: model calls made, actions executed, calls saved by running plans locally,
+    # and model calls repeated because the response had no valid tool object
+    model_calls = 0
+    actions_executed = 0
+    calls_saved = 0
+    format_retries = 0
+    # Model calls that failed in a row; a provider that keeps failing ends the task instead of looping forever
+    api_failures = 0
+
+    # Replay a recorded run of the same query, checking each step against the live screen
+    trajectory = trajectories.lookup(query) if replay else None
+    outcome = None
+    if trajectory is not None:
+        try:
+            outcome = trajectories.replay(trajectory, detector, execute_action)
+        except Exception as e:
+            # A failed replay is not fatal: the model carries on from whatever screen it left
+            print(f"Replay failed, continuing with the model: {e}")
+            tracer.increment("replay_failures")
+    if outcome is not None:
+        print(f"Replayed {len(outcome.steps)}/{len(trajectory.steps)} recorded steps, "
+              f"saving ~{outcome.time_saved:.1f}s of model time (store stats: {trajectories.stats})")
+        if outcome.completed:
+            trajectories.save()
+            print("Task completed successfully (replayed).")
+            return True
+        if outcome.steps:
+            # Continue with the model from where the recorded run diverged
+            recorder.extend(outcome.steps)
+            pre_action_fingerprint = outcome.baseline
+            memory.append({
+                "role": "user",
+                "content": "These actions were already executed: "
+                           + "; ".join(str(step.action.get("description")) for step in outcome.steps)
+                           + ". Continue the task from the current screen state."
+            })
+
+    # Tell the model what the local tier already did on this screen, so it does not blindly repeat it
+    if note:
+        memory.append({"role": "user", "content": note})
+
+    # Encode every new frame seen while settling on a background worker, so the settled frame is
+    # usually encoded (and its data URI built) by the time the screen has held still
+    # (not in ROI mode, where most steps send crops and the full frame is only encoded when it is needed)
+    pipeline = FramePipeline(profile)
+    if not roi:
+        detector.on_frame = pipeline.on_frame
+    # Static request parameters, prepared once; each step only adds its messages
+    request_template = dict(
+        max_completion_tokens=1024,
+        temperature=1,
+        top_p=1
+    )
+    if json_mode:
+        # Turned into each provider's response_format by the pool
+        request_template["response_schema"] = TOOL_RESPONSE_SCHEMA
+    # Stage timer of the current step (None before the first step)
+    timer = None
+    # In ROI mode, the last full frame sent (kept in memory as the reference the crops are relative to)
+    # and the number of steps since
+    reference_frame = None
+    steps_since_reference = 0
+
+    while True:
+        # Report the previous step: its wall-clock time against the sum of its (partly overlapped) stages
+        if timer is not None:
+            print(pipeline.finish_step(timer))
+        timer = StepTimer()
+
+        # Do not call the model on a stale frame: wait until the action's effect has settled
+        with timer.stage("settle"):
+            frame = detector.settle(baseline=pre_action_fingerprint)
+        action_executed = pre_action_fingerprint is not None
+        pre_action_fingerprint = None
+        # Queue the settled frame for archiving; never blocks, and repeated screens are stored once
+        if archive is not None:
+            archive.submit(frame, detector.last_fingerprint)
+
+        # Tell the model when its last action left the screen exactly as it saw it before
+        state_text = "Current screen state:"
+        if action_executed and detector.is_redundant():
+            state_text = "Current screen state (unchanged after the last action):"
+        detector.mark_sent()
+
+        # In ROI mode, send a thumbnail plus crops of what changed since the reference frame; a full frame is sent
+        # instead when there is no reference yet, when too much changed, or every ROI_FULL_FRAME_EVERY steps
+        roi_payload = None
+        if roi and reference_frame is not None and steps_since_reference < ROI_FULL_FRAME_EVERY:
+            with timer.stage("roi"):
+                roi_payload = build_roi_payload(reference_frame, frame)
+        if roi_payload is not None:
+            steps_since_reference += 1
+            encoded = roi_payload.thumbnail
+            payload_bytes = roi_payload.payload_bytes
+            print(f"ROI payload: {payload_bytes / 1024:.1f} KB ({len(roi_payload.crops)} changed regions)")
+            current_state = {"role": "user", "content": roi_payload.content_parts(state_text)}
+        else:
+            # Take the frame encoded in the background while settling (or encode it now if the screen moved on)
+            prepared = pipeline.prepare(frame, detector.last_fingerprint)
+            timer.add("encode", prepared.encode_time)
+            encoded = prepared.encoded
+            payload_bytes = encoded.payload_bytes
+            print(f"Screenshot payload: {payload_bytes / 1024:.1f} KB ({encoded.width}x{encoded.height} {encoded.mime_type})")
+            # Append current screen state to messages
+            current_state = {"role": "user", "content": [{"type": "text", "text": state_text}, prepared.image_part]}
+
+        # Build the compacted message list for this turn
+        with timer.stage("build"):
+            current_messages = memory.build(current_state)
+        if roi and roi_payload is None:
+            # The model keeps this full frame for the following steps, whose crops only show what changed since
+            reference_frame, steps_since_reference = frame, 0
+            memory.set_reference({"role": "user", "content": [
+                {"type": "text", "text": "Reference screenshot (full resolution) that later region crops are relative to:"},
+                prepared.image_part,
+            ]})
+
+        # Arguments shared by the streaming and non-streaming calls
+        # The pool fills call_info with this call's retries and provider
+        call_info = CallInfo()
+        completion_kwargs = dict(request_template, messages=current_messages, info=call_info)
 
         # Call Azure OpenAI model
+        streamed_action = None
         try:
-            completion = client.chat.completions.create(
-                model="gpt-4.1",  # Replace with your actual deployment name
-                messages=current_messages,
-                max_tokens=1024,
-                temperature=1,
-                top_p=1,
-                stream=False
-            )
+            # Model call span: screenshot size and payload, tokens, retries and the provider that answered
+            with timer.stage("model", streamed=stream, width=encoded.width, height=encoded.height,
+                             payload_bytes=payload_bytes) as model_span:
+                if stream:
+                    # Stream the completion and stop reading as soon as the first complete action arrives
+                    result = stream_completion(
+                        client.create,
+                        tool_names=TOOL_NAMES,
+                        **completion_kwargs
+                    )
+                    response_text = result.text
+                    streamed_action = result.action
+                    prompt_tokens, completion_tokens = result.prompt_tokens, result.completion_tokens
+                    if result.time_to_action is not None:
+                        print(f"Time to action: {result.time_to_action:.2f}s")
+                else:
+                    completion = client.create(stream=False, **completion_kwargs)
+                    response_text = completion.choices[0].message.content
+                    prompt_tokens = completion.usage.prompt_tokens if completion.usage else None
+                    completion_tokens = completion.usage.completion_tokens if completion.usage else None
+                model_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               retries=call_info.retries, provider=call_info.provider)
         except Exception as e:
+            # The pool has already retried with backoff and failover; report and try again next turn
             print(f"Error calling Azure OpenAI: {e}")
-            messages.append({
+            api_failures += 1
+            tracer.increment("api_failures")
+            if api_failures >= MAX_API_FAILURES:
+                print(f"Giving up after {api_failures} failed model calls in a row.")
+                return False
+            memory.append({
                 "role": "user",
                 "content": f"API call failed: {str(e)}. Please retry or adjust."
             })
             continue
 
-        response_text = completion.choices[0].message.content
+        api_failures = 0
+        model_latency = model_span.duration
+        model_calls += 1
         print(response_text)
+        # A stream cancelled at the action never receives the usage chunk; the memory's estimate is used instead
+        usage_note = "" if prompt_tokens is not None else " (estimated; no usage reported)"
+        print(f"Prompt tokens: {memory.record_usage(prompt_tokens)}{usage_note}")
 
         # Save assistant response to conversation history
-        messages.append({
+        memory.append({
             "role": "assistant",
             "content": response_text
         })
 
-        # Try to extract JSON object from response
-        start = response_text.find('{')
-        end = response_text.rfind('}') + 1
+        # Pick the tool object out of the response, unless streaming already found it; braces in the
+        # reasoning and extra objects are skipped instead of breaking the parse
+        parsed = streamed_action if streamed_action is not None else extract_tool_object(response_text, TOOL_NAMES)
 
-        if start != -1 and end > start:
-            json_str = response_text[start:end]
+        if parsed is not None:
+            # The reasoning is already in memory with the response; keep it out of the recorded trajectory
+            parsed.pop("reasoning", None)
             try:
-                parsed = json.loads(json_str)
                 tool = parsed.get("tool")
 
                 if tool == "action":
-                    # Execute the provided Python code
-                    exec(parsed.get("program", ""))
+                    # Remember the screen the action starts from so the next settle waits for it to change
+                    pre_action_fingerprint = detector.last_fingerprint
+                    # Validate and execute the action
+                    with timer.stage("execute", tool="action"):
+                        execute_action(parsed)
+                    actions_executed += 1
+                    recorder.add_step(parsed, pre_action_fingerprint, model_latency)
                     # Add feedback that action was executed
-                    messages.append({
+                    memory.append({
                         "role": "user",
                         "content": f"Action executed: {parsed.get('description')}. Please provide the next action based on the new screen state."
                     })
 
+                elif tool == "plan":
+                    # Run the plan locally; only a checkpoint, an unexpected screen or the end of the plan returns to the model
+                    pre_action_fingerprint = detector.last_fingerprint
+                    with timer.stage("execute", tool="plan") as execute_span:
+                        outcome = execute_action(parsed, detector)
+                        execute_span.set(steps=outcome.executed)
+                    actions_executed += outcome.executed
+                    calls_saved += max(0, outcome.executed - 1)
+                    print(f"Plan: {outcome.describe()}")
+                    # Record only the steps that ran, so a replay stops where this run did
+                    recorder.add_step({**parsed, "steps": parsed["steps"][:outcome.executed]}, pre_action_fingerprint, model_latency)
+                    memory.append({
+                        "role": "user",
+                        "content": f"Plan executed: {parsed.get('description')}. {outcome.describe()} Please provide the next action based on the new screen state."
+                    })
+
                 elif tool == "task_complete":
                     print("Task completed successfully.")
-                    break
+                    print(f"Task stats: {actions_executed} actions in {model_calls} model calls "
+                          f"({calls_saved} calls saved by plans, {format_retries} format retries)")
+                    print(pipeline.summary())
+                    print(tracer.report())
+                    recorder.finish(trajectories, detector.last_fingerprint)
+                    return True
 
                 else:
                     print(f"Unknown tool: {tool}")
-                    messages.append({
+                    memory.append({
                         "role": "user",
                         "content": f"Unknown tool '{tool}' in response. Please follow the specified output format."
                     })
 
             except Exception as e:
                 print(f"Error parsing or executing action: {e}")
-                messages.append({
+                if isinstance(e, ValidationError):
+                    # The object did not match the action schema: a format failure like a missing object
+                    format_retries += 1
+                    tracer.increment("format_retries")
+                elif isinstance(e, ExecutionError) and e.completed is not None:
+                    # Part of the action or plan ran: record exactly that, so a replay repeats what happened
+                    recorder.add_step(e.completed, pre_action_fingerprint, model_latency)
+                    actions_executed += len(e.completed["steps"]) if e.completed["tool"] == "plan" else 1
+                memory.append({
                     "role": "user",
                     "content": f"Error occurred during execution: {str(e)}. Please adjust your approach."
                 })
 
         else:
             print("No valid JSON object found in response.")
-            messages.append({
+            format_retries += 1
+            tracer.increment("format_retries")
+            memory.append({
                 "role": "user",
                 "content": "Your response must include a valid JSON object with 'tool' field. Please correct your output format."
             })
 
 
+# Local-first routing: single-click tasks go to the grounding model before the planner, and every click step
+# the planner emits is grounded locally, escalating back to the planner when the answer is not confident
+router = TaskRouter(grounding, perform_task, planner_name="azure", executor=executor)
+if grounding is not None:
+    executor.locate = router.locate
+
+
 if __name__ == "__main__":
+    # Expose stage metrics for Prometheus when TRACE_METRICS_PORT is set
+    serve_metrics_from_env()
     user_query = input("Enter your request: ")
-    perform_task(user_query)
\ No newline at end of file
+    # Run the task local-first; the planner's click steps are routed through the same router
+    router.run(user_query)
+    print(router.summary())
\ No newline at end of file
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator
+import numpy as np
+from tracing import Span, tracer
+from utils import EncodedImage, EncodingProfile, encode_frame
+
+# Shared background worker for speculative encodes; PIL releases the GIL while resizing and compressing,
+# so encoding overlaps the settle polls and the network wait
+_encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+
+
+@dataclass
+class PreparedFrame:
+    """
+    A frame encoded and wrapped into a ready-to-send message part.
+
+    Attributes:
+        encoded (EncodedImage): The encoded screenshot.
+        image_part (dict[str, Any]): The {"type": "image_url", ...} content part with the data URI already built.
+        fingerprint (np.ndarray): The fingerprint of the frame that was encoded.
+        encode_time (float): The seconds of CPU work the encode took.
+        speculative (bool): Whether the encode ran in the background before it was needed.
+    """
+    encoded: EncodedImage
+    image_part: dict[str, Any]
+    fingerprint: np.ndarray
+    encode_time: float
+    speculative: bool = False
+
+
+def prepare_frame(frame: np.ndarray, fingerprint: np.ndarray, profile: EncodingProfile) -> PreparedFrame:
+    """
+    Encodes a frame and builds its message part (including the base64 data URI).
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 array in RGB order.
+        fingerprint (np.ndarray): The frame's fingerprint.
+        profile (EncodingProfile): How to downscale and compress the frame.
+
+    Returns:
+        PreparedFrame: The encoded frame and its message part.
+    """
+    start = time.perf_counter()
+    encoded = encode_frame(frame, profile)
+    image_part = {"type": "image_url", "image_url": {"url": encoded.data_uri}}
+    return PreparedFrame(encoded, image_part, fingerprint, time.perf_counter() - start)
+
+
+class StepTimer:
+    """
+    Times the stages of one agent step and compares the step's wall-clock time with their sum.
+
+    Attributes:
+        started (float): The perf_counter time the step started.
+        stages (dict[str, float]): Seconds spent per stage (stages may overlap each other).
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Times a block of code as a stage and records it as a trace span.
+
+        Args:
+            name (str): The stage name.
+            **attributes (Any): Initial span attributes.
+
+        Yields:
+            Span: The span being recorded; attributes can be added inside the block.
+        """
+        start = time.perf_counter()
+        try:
+            with tracer.span(name, **attributes) as span:
+                yield span
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        Adds time to a stage measured elsewhere (e.g. on a background worker).
+
+        Args:
+            name (str): The stage name.
+            seconds (float): The seconds to add.
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        """The wall-clock seconds since the step started."""
+        return time.perf_counter() - self.started
+
+
+class FramePipeline:
+    """
+    Overlaps screenshot encoding with settling: every new frame seen while polling is encoded speculatively.
+
+    Pass `on_frame` to `ChangeDetector.on_frame`; by the time the screen has held still for a few polls,
+    the settled frame has usually already been encoded and `prepare` returns immediately.
+
+    A speculative encode is only reused for exactly the same pixels (usually the very frame object the
+    detector settled on): the detector may call a screen with a few changed cells "settled", but a frame
+    missing a few typed characters or a toggled checkbox must not be sent in place of the settled one.
+
+    Attributes:
+        profile (EncodingProfile): How frames are downscaled and compressed.
+        hits (int): The number of frames served from a speculative encode.
+        misses (int): The number of frames encoded on demand.
+        steps (int): The number of steps recorded with `finish_step`.
+        wall_time (float): The total wall-clock seconds of recorded steps.
+        stage_time (float): The total of the recorded steps' stage times.
+    """
+
+    def __init__(self, profile: EncodingProfile, pool: ThreadPoolExecutor | None = None) -> None:
+        self.profile = profile
+        self.hits = 0
+        self.misses = 0
+        self.steps = 0
+        self.wall_time = 0.0
+        self.stage_time = 0.0
+        self._pool = pool or _encode_pool
+        self._pending: tuple[np.ndarray, np.ndarray, Future[PreparedFrame]] | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _same_frame(pending: tuple[np.ndarray, np.ndarray, Future[PreparedFrame]], frame: np.ndarray,
+                    fingerprint: np.ndarray) -> bool:
+        # The fingerprint comparison is a cheap early out; only identical pixels count as the same frame
+        return pending[0] is frame or (np.array_equal(pending[1], fingerprint) and np.array_equal(pending[0], frame))
+
+    def on_frame(self, frame: np.ndarray, fingerprint: np.ndarray) -> None:
+        """
+        Starts a background encode of a polled frame unless one is already running for the same screen.
+
+        Args:
+            frame (np.ndarray): The polled frame.
+            fingerprint (np.ndarray): The polled frame's fingerprint.
+        """
+        with self._lock:
+            if self._pending is not None and self._same_frame(self._pending, frame, fingerprint):
+                return
+            if self._pending is not None:
+                # The screen moved on; the old encode is no longer useful
+                self._pending[2].cancel()
+            self._pending = (frame, fingerprint, self._pool.submit(prepare_frame, frame, fingerprint, self.profile))
+
+    def prepare(self, frame: np.ndarray, fingerprint: np.ndarray) -> PreparedFrame:
+        """
+        Returns the encoded settled frame, reusing the speculative encode when it has identical pixels.
+
+        Args:
+            frame (np.ndarray): The settled frame.
+            fingerprint (np.ndarray): The settled frame's fingerprint.
+
+        Returns:
+            PreparedFrame: The encoded frame.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None and self._same_frame(pending, frame, fingerprint) and not pending[2].cancelled():
+            self.hits += 1
+            prepared = pending[2].result()
+            prepared.speculative = True
+            return prepared
+        if pending is not None:
+            pending[2].cancel()
+        self.misses += 1
+        return prepare_frame(frame, fingerprint, self.profile)
+
+    def finish_step(self, timer: StepTimer) -> str:
+        """
+        Records a finished step and describes how much its stages overlapped.
+
+        Args:
+            timer (StepTimer): The step's timer.
+
+        Returns:
+            str: A one-line summary of the step's latency against the sum of its stages.
+        """
+        wall = timer.elapsed()
+        total = sum(timer.stages.values())
+        self.steps += 1
+        self.wall_time += wall
+        self.stage_time += total
+        tracer.record(Span("step", time.time() - wall, wall, {"stage_sum_s": total}))
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timer.stages.items())
+        return f"Step latency {wall:.2f}s vs {total:.2f}s sum of stages ({stages})"
+
+    def summary(self) -> str:
+        """
+        Describes the pipelining gains over all recorded steps.
+
+        Returns:
+            str: A one-line summary.
+        """
+        return (f"Pipeline: {self.steps} steps, {self.wall_time:.2f}s wall vs {self.stage_time:.2f}s sequential "
+                f"({self.stage_time - self.wall_time:.2f}s hidden), speculative encodes {self.hits} hit / {self.misses} miss")
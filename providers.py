@@ -0,0 +1,516 @@
+from __future__ import annotations
+import os
+import re
+import time
+import random
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+import httpx
+from tracing import tracer
+
+# Default Azure OpenAI resource used by open_ai.py
+DEFAULT_AZURE_ENDPOINT = "https://harsh-mamhtiwt-eastus2.cognitiveservices.azure.com/"
+DEFAULT_AZURE_API_VERSION = "2025-03-01-preview"
+# Default OpenAI-compatible local endpoint (e.g. a vLLM or llama.cpp server, or stub_server.py)
+DEFAULT_LOCAL_BASE_URL = "http://127.0.0.1:8000/v1"
+
+# Status codes that mean "try again later" rather than "the request is wrong"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Status codes that mean the request itself is malformed; no provider will accept it
+REQUEST_ERROR_STATUS = {400, 422}
+
+# How a provider constrains its output to a response schema: full schema, any JSON object, or not at all
+RESPONSE_FORMATS = ("json_schema", "json_object", "none")
+
+# Error codes a 400 carries when a model or API version does not support a request parameter
+UNSUPPORTED_PARAMETER_CODES = {"unsupported_parameter", "unsupported_value", "invalid_parameter", "invalid_request_error"}
+
+# One pooled, keep-alive HTTP client shared by every provider in the process
+_http_client: httpx.Client | None = None
+_http_client_lock = threading.Lock()
+
+
+def shared_http_client() -> httpx.Client:
+    """
+    Returns the process-wide pooled HTTP client, creating it on first use.
+
+    Returns:
+        httpx.Client: A keep-alive client shared by all SDK clients.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _http_client
+
+
+def parse_reset_duration(value: str | None) -> float | None:
+    """
+    Parses a rate-limit reset value such as "1.5", "7.66s", "120ms" or "2m59.56s" into seconds.
+
+    Args:
+        value (str | None): The header value.
+
+    Returns:
+        float | None: The duration in seconds, or None if the value is missing or unparseable.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def rate_limit_delay(headers: Any) -> float | None:
+    """
+    Works out how long to wait before the next request from rate-limit response headers.
+
+    Args:
+        headers (Any): The response headers (a case-insensitive mapping).
+
+    Returns:
+        float | None: The delay in seconds, or None if the headers do not ask for a pause.
+    """
+    if headers is None:
+        return None
+    # Explicit retry hints take precedence
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        return float(retry_after_ms) / 1000.0
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    # Otherwise pause only when a quota is exhausted, until that quota resets
+    delays = []
+    for kind in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if remaining is not None and remaining.strip().isdigit() and int(remaining) == 0:
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if reset is not None:
+                delays.append(reset)
+    return max(delays) if delays else None
+
+
+def response_format_for(mode: str, schema: dict[str, Any] | None) -> dict[str, Any] | None:
+    """
+    Builds the `response_format` request argument for a provider's response format mode.
+
+    Args:
+        mode (str): One of RESPONSE_FORMATS.
+        schema (dict[str, Any] | None): The JSON schema of the response, or None if the call is unconstrained.
+
+    Returns:
+        dict[str, Any] | None: The argument, or None to leave the output unconstrained.
+    """
+    if schema is None or mode == "none":
+        return None
+    if mode == "json_object":
+        return {"type": "json_object"}
+    # Non-strict: strict mode rejects schemas with optional fields, and the agents validate the result anyway
+    return {"type": "json_schema", "json_schema": {"name": "tool_response", "schema": schema, "strict": False}}
+
+
+def rejects_response_format(error: Exception) -> bool:
+    """
+    Whether an API error says the request's response_format is not supported.
+
+    Only the error's structured fields are checked (the SDKs parse them from the error body), so a 400
+    about something else, such as a message that merely mentions JSON, is not mistaken for one.
+
+    Args:
+        error (Exception): The error raised by the SDK client.
+
+    Returns:
+        bool: True if the error is a 400 naming the response_format parameter.
+    """
+    if getattr(error, "status_code", None) != 400:
+        return False
+    body = getattr(error, "body", None)
+    details = body.get("error", body) if isinstance(body, dict) else {}
+    details = details if isinstance(details, dict) else {}
+    param = getattr(error, "param", None) or details.get("param")
+    code = getattr(error, "code", None) or details.get("code") or details.get("type")
+    if param is not None:
+        return str(param).split(".")[0] == "response_format"
+    # Some backends leave param empty; then the code must say the parameter is unsupported and name it
+    return code in UNSUPPORTED_PARAMETER_CODES and "response_format" in str(details.get("message", ""))
+
+
+def is_transport_error(error: Exception) -> bool:
+    """
+    Whether an exception without an HTTP status is a network failure worth retrying.
+
+    Args:
+        error (Exception): The error raised by the SDK client.
+
+    Returns:
+        bool: True for connection errors and timeouts (httpx's, or the SDKs' APIConnectionError and its
+        APITimeoutError subclass); False for anything else, such as a TypeError from bad arguments.
+    """
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+def _response_format_env(backend: str, default: str) -> str:
+    # e.g. GROQ_RESPONSE_FORMAT=none turns JSON mode off for every Groq key
+    mode = os.getenv(f"{backend.upper()}_RESPONSE_FORMAT", default)
+    if mode not in RESPONSE_FORMATS:
+        raise ValueError(f"Invalid {backend.upper()}_RESPONSE_FORMAT '{mode}'; expected one of {RESPONSE_FORMATS}")
+    return mode
+
+
+@dataclass
+class Provider:
+    """
+    One API key on one backend serving one model.
+
+    Attributes:
+        name (str): A label for logs (e.g. "groq#2").
+        client (Any): An OpenAI-compatible SDK client (Groq, AzureOpenAI or OpenAI).
+        model (str): The model or deployment name to request.
+        priority (int): The failover tier; lower tiers are tried first.
+        available_at (float): The monotonic time before which the provider should not be used.
+        last_used (float): The monotonic time of the last request, used to rotate keys within a tier.
+        failures (int): The number of consecutive failed requests.
+        response_format (str): How the provider constrains output to a response schema (one of RESPONSE_FORMATS).
+        format_disabled_until (float): The monotonic time before which the response format is not sent, after the
+            provider rejected it.
+    """
+    name: str
+    client: Any
+    model: str
+    priority: int = 0
+    available_at: float = 0.0
+    last_used: float = 0.0
+    failures: int = 0
+    response_format: str = "none"
+    format_disabled_until: float = 0.0
+
+
+@dataclass
+class PoolStats:
+    """
+    Counters for a provider pool.
+
+    Attributes:
+        requests (int): The number of requests sent.
+        retries (int): The number of requests that were retried.
+        failovers (int): The number of times a request moved to a different provider.
+        throttled (int): The number of rate-limit (429) responses.
+        format_failures (int): The number of responses the provider rejected as invalid JSON.
+        disabled (int): The number of times a provider was set aside after refusing a request.
+        per_provider (dict[str, int]): The number of requests sent to each provider.
+    """
+    requests: int = 0
+    retries: int = 0
+    failovers: int = 0
+    throttled: int = 0
+    format_failures: int = 0
+    disabled: int = 0
+    per_provider: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class CallInfo:
+    """
+    Details of one pool call, filled in by `ProviderPool.create` for the caller that passed it.
+
+    Attributes:
+        retries (int): The retries the call needed.
+        provider (str | None): The provider that served the call, once it succeeded.
+    """
+    retries: int = 0
+    provider: str | None = None
+
+
+class ProviderPool:
+    """
+    Sends chat completions through a set of providers with key rotation, pacing and failover.
+
+    Within a tier, requests rotate across API keys (least recently used first). Rate-limit headers
+    pause a key until its quota resets; throttled or failing keys fail over to another key or to the
+    next tier, and when nothing is available the pool waits with jittered exponential backoff.
+
+    A key that is refused outright (401/403/404, e.g. a revoked key or a missing deployment) is set aside
+    for `disable_for` seconds and the call moves on. Malformed requests (400/422) and errors that are
+    neither HTTP nor network failures (programming errors) are raised at once.
+
+    Attributes:
+        providers (list[Provider]): The providers in the pool.
+        max_attempts (int): The maximum number of attempts per call.
+        base_delay (float): The initial backoff delay in seconds.
+        max_delay (float): The maximum backoff delay in seconds.
+        format_retry_after (float): The seconds a provider's rejected response format stays off before it is tried again.
+        disable_for (float): The seconds a refused provider is set aside.
+        max_wait (float): The longest the pool waits for a provider to become available before giving up.
+        stats (PoolStats): Request, retry and failover counters, shared by all callers (updated under the lock).
+    """
+
+    def __init__(
+        self,
+        providers: list[Provider],
+        max_attempts: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        format_retry_after: float = 600.0,
+        disable_for: float = 3600.0,
+        max_wait: float = 300.0,
+    ) -> None:
+        if not providers:
+            raise ValueError("ProviderPool needs at least one provider")
+        self.providers = providers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.format_retry_after = format_retry_after
+        self.disable_for = disable_for
+        self.max_wait = max_wait
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> tuple[Provider, float]:
+        # Pick the best available provider, or the one that becomes available soonest.
+        # A failed provider is paused (available_at in the future), which is what makes calls fail over.
+        with self._lock:
+            now = time.monotonic()
+            ready = [p for p in self.providers if p.available_at <= now]
+            if ready:
+                provider = min(ready, key=lambda p: (p.priority, p.last_used))
+                wait = 0.0
+            else:
+                provider = min(self.providers, key=lambda p: (p.available_at, p.priority))
+                wait = provider.available_at - now
+            provider.last_used = now + wait
+            return provider, wait
+
+    def _count(self, counter: str, provider: Provider | None = None) -> None:
+        # Concurrent callers share the stats, so every update happens under the lock
+        with self._lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+            if provider is not None:
+                self.stats.per_provider[provider.name] = self.stats.per_provider.get(provider.name, 0) + 1
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def create(self, info: CallInfo | None = None, **kwargs: Any) -> Any:
+        """
+        Sends a chat completion through the pool, with the same arguments as `chat.completions.create`.
+
+        The `model` argument is supplied by the chosen provider. A `response_schema` argument is turned
+        into each provider's `response_format` (JSON schema, JSON mode or nothing); a provider that rejects
+        its response format is retried without it, and sends unconstrained requests for `format_retry_after`
+        seconds before trying the format again.
+
+        Args:
+            info (CallInfo | None): Filled in with this call's retries and serving provider; per call, so it
+                stays correct when several threads share the pool.
+            **kwargs (Any): The completion arguments (messages, stream, response_schema, ...).
+
+        Returns:
+            Any: The completion, or a stream of chunks when `stream=True`.
+        """
+        kwargs.pop("model", None)
+        response_schema = kwargs.pop("response_schema", None)
+        previous: Provider | None = None
+        last_error: Exception | None = None
+        info = info if info is not None else CallInfo()
+
+        for attempt in range(self.max_attempts):
+            provider, wait = self._acquire()
+            if wait > self.max_wait:
+                # Every provider is set aside or out of quota for longer than a caller should block
+                raise RuntimeError(f"No provider available for {wait:.0f}s") from last_error
+            if wait > 0:
+                time.sleep(wait)
+            if previous is not None and provider is not previous:
+                self._count("failovers")
+            previous = provider
+            if attempt:
+                self._count("retries")
+                info.retries += 1
+
+            request = dict(kwargs)
+            mode = provider.response_format if provider.format_disabled_until <= time.monotonic() else "none"
+            response_format = response_format_for(mode, response_schema)
+            if response_format is not None:
+                request["response_format"] = response_format
+            try:
+                self._count("requests", provider)
+                raw = provider.client.chat.completions.with_raw_response.create(model=provider.model, **request)
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                message = str(e)
+                if status == 400 and response_format is not None and "json_validate_failed" in message:
+                    # JSON mode caught output that is not valid JSON (Groq); sampling again usually fixes it
+                    last_error = e
+                    self._count("format_failures")
+                    tracer.increment("provider_format_failures")
+                    print(f"Provider {provider.name} returned invalid JSON; retrying")
+                    continue
+                if response_format is not None and rejects_response_format(e):
+                    # The model or API version does not support this response format: prompt-only JSON for a while,
+                    # so a misconfigured deployment does not fail every call but a fixed one gets the format back
+                    last_error = e
+                    with self._lock:
+                        provider.format_disabled_until = time.monotonic() + self.format_retry_after
+                    print(f"Provider {provider.name} rejected response_format {response_format['type']}; "
+                          f"unconstrained output for {self.format_retry_after:.0f}s")
+                    continue
+                if status in REQUEST_ERROR_STATUS or (status is None and not is_transport_error(e)):
+                    # The request itself is invalid (or the call is broken); retrying elsewhere will not help
+                    raise
+                last_error = e
+                if status is not None and status not in RETRYABLE_STATUS:
+                    # This key or deployment is refused (revoked key, missing deployment, ...); the others may work
+                    with self._lock:
+                        provider.available_at = time.monotonic() + self.disable_for
+                    self._count("disabled")
+                    print(f"Provider {provider.name} refused the request ({status}); disabled for {self.disable_for:.0f}s")
+                    continue
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                delay = rate_limit_delay(headers) if status == 429 else None
+                if status == 429:
+                    self._count("throttled")
+                with self._lock:
+                    provider.failures += 1
+                    pause = delay if delay is not None else self._backoff(provider.failures)
+                    provider.available_at = time.monotonic() + pause
+                print(f"Provider {provider.name} failed ({status or type(e).__name__}); retrying")
+                continue
+
+            # Pace the key according to the quota left in the response headers
+            delay = rate_limit_delay(raw.headers)
+            with self._lock:
+                provider.failures = 0
+                if delay is not None:
+                    provider.available_at = time.monotonic() + delay
+            info.provider = provider.name
+            return raw.parse()
+
+        raise RuntimeError(f"All providers failed after {self.max_attempts} attempts") from last_error
+
+
+def _env_keys(prefix: str) -> list[str]:
+    # Collect PREFIX, PREFIX1, PREFIX2, ... from the environment
+    keys = [os.getenv(prefix)] + [os.getenv(f"{prefix}{i}") for i in range(1, 10)]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def groq_providers(model: str, priority: int = 0) -> list[Provider]:
+    """
+    Creates one provider per Groq API key found in GROQ_API_KEY, GROQ_API_KEY1 ... GROQ_API_KEY9.
+
+    Args:
+        model (str): The Groq model name.
+        priority (int): The failover tier.
+
+    Returns:
+        list[Provider]: One provider per key.
+    """
+    from groq import Groq
+
+    # Groq supports JSON object mode on every model, but JSON schema only on some
+    response_format = _response_format_env("groq", "json_object")
+    return [
+        Provider(f"groq#{i}", Groq(api_key=key, http_client=shared_http_client(), max_retries=0), model, priority,
+                 response_format=response_format)
+        for i, key in enumerate(_env_keys("GROQ_API_KEY"), start=1)
+    ]
+
+
+def azure_providers(model: str, priority: int = 0) -> list[Provider]:
+    """
+    Creates one provider per Azure OpenAI key found in AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_KEY1 ...
+
+    The endpoint is read from AZURE_OPENAI_ENDPOINT (defaulting to the resource open_ai.py used).
+
+    Args:
+        model (str): The Azure deployment name.
+        priority (int): The failover tier.
+
+    Returns:
+        list[Provider]: One provider per key.
+    """
+    from openai import AzureOpenAI
+
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", DEFAULT_AZURE_ENDPOINT)
+    response_format = _response_format_env("azure", "json_schema")
+    return [
+        Provider(
+            f"azure#{i}",
+            AzureOpenAI(
+                api_version=DEFAULT_AZURE_API_VERSION,
+                api_key=key,
+                azure_endpoint=endpoint,
+                http_client=shared_http_client(),
+                max_retries=0,
+            ),
+            model,
+            priority,
+            response_format=response_format,
+        )
+        for i, key in enumerate(_env_keys("AZURE_OPENAI_API_KEY"), start=1)
+    ]
+
+
+def local_providers(model: str, priority: int = 0) -> list[Provider]:
+    """
+    Creates a provider for an OpenAI-compatible local endpoint at LOCAL_LLM_BASE_URL.
+
+    Args:
+        model (str): The model name the local server expects.
+        priority (int): The failover tier.
+
+    Returns:
+        list[Provider]: A single provider.
+    """
+    from openai import OpenAI
+
+    base_url = os.getenv("LOCAL_LLM_BASE_URL", DEFAULT_LOCAL_BASE_URL)
+    client = OpenAI(base_url=base_url, api_key=os.getenv("LOCAL_LLM_API_KEY", "local"),
+                    http_client=shared_http_client(), max_retries=0)
+    # vLLM and llama.cpp servers accept JSON schemas and enforce them with guided decoding
+    return [Provider("local", client, model, priority, response_format=_response_format_env("local", "json_schema"))]
+
+
+# Factory for each backend name usable in a pool spec
+PROVIDER_FACTORIES = {
+    "groq": groq_providers,
+    "azure": azure_providers,
+    "local": local_providers,
+}
+
+
+def build_pool(spec: str) -> ProviderPool:
+    """
+    Builds a pool from a spec such as "groq:meta-llama/llama-4-scout-17b-16e-instruct,azure:gpt-4.1".
+
+    Each comma-separated entry is a failover tier, tried in the order given.
+
+    Args:
+        spec (str): The comma-separated "backend:model" entries.
+
+    Returns:
+        ProviderPool: The pool.
+    """
+    providers: list[Provider] = []
+    for priority, entry in enumerate(item.strip() for item in spec.split(",") if item.strip()):
+        backend, _, model = entry.partition(":")
+        if backend not in PROVIDER_FACTORIES or not model:
+            raise ValueError(f"Invalid provider entry '{entry}'; expected one of {sorted(PROVIDER_FACTORIES)} as 'backend:model'")
+        providers.extend(PROVIDER_FACTORIES[backend](model, priority))
+    return ProviderPool(providers)
@@ -0,0 +1,211 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any
+import numpy as np
+from change_detection import CELL_THRESHOLD
+from utils import EncodedImage, EncodingProfile, encode_frame
+
+# Low-resolution overview of the whole screen sent alongside the crops
+THUMBNAIL_PROFILE = EncodingProfile(max_size=768, format="jpeg", quality=70)
+# Changed regions are sent at (up to) native resolution
+CROP_PROFILE = EncodingProfile(max_size=1280, format="jpeg", quality=85)
+
+
+@dataclass(frozen=True)
+class Region:
+    """
+    A rectangle in full-screen pixel coordinates (right and bottom exclusive).
+
+    Attributes:
+        left (int): The left edge.
+        top (int): The top edge.
+        right (int): The right edge.
+        bottom (int): The bottom edge.
+    """
+    left: int
+    top: int
+    right: int
+    bottom: int
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+    def union(self, other: Region) -> Region:
+        """Returns the smallest region containing both regions."""
+        return Region(min(self.left, other.left), min(self.top, other.top),
+                      max(self.right, other.right), max(self.bottom, other.bottom))
+
+    def overlaps(self, other: Region) -> bool:
+        """Whether the two regions intersect."""
+        return self.left < other.right and other.left < self.right and self.top < other.bottom and other.top < self.bottom
+
+
+def changed_regions(
+    previous: np.ndarray,
+    current: np.ndarray,
+    cell: int = 32,
+    padding: int = 1,
+    max_regions: int = 4,
+) -> list[Region]:
+    """
+    Finds the bounding boxes of the screen areas that changed between two frames.
+
+    Both frames are reduced to a grid of `cell` x `cell` blocks holding the largest grey-level change in
+    the block; changed blocks are grown by `padding` blocks (so nearby changes merge and crops get some
+    context) and grouped into connected components.
+
+    Args:
+        previous (np.ndarray): The frame the model last saw, (height, width, 3) uint8 RGB.
+        current (np.ndarray): The new frame, same shape.
+        cell (int): The block size in pixels.
+        padding (int): The number of blocks each changed block is grown by.
+        max_regions (int): The maximum number of regions; beyond this all changes are merged into one box.
+
+    Returns:
+        list[Region]: The changed regions in full-screen pixels, largest first (empty if nothing changed).
+    """
+    if previous.shape != current.shape:
+        height, width = current.shape[:2]
+        return [Region(0, 0, width, height)]
+    height, width = current.shape[:2]
+    rows, cols = -(-height // cell), -(-width // cell)
+
+    # Per-pixel grey-level difference, padded to whole blocks and reduced to the largest change per block
+    diff = np.abs(current.astype(np.int16) - previous.astype(np.int16)).max(axis=2)
+    diff = np.pad(diff, ((0, rows * cell - height), (0, cols * cell - width)))
+    changed = diff.reshape(rows, cell, cols, cell).max(axis=(1, 3)) > CELL_THRESHOLD
+    if not changed.any():
+        return []
+
+    # Grow the changed blocks so that nearby changes join one region
+    grown = changed.copy()
+    for _ in range(padding):
+        step = grown.copy()
+        step[1:] |= grown[:-1]
+        step[:-1] |= grown[1:]
+        step[:, 1:] |= grown[:, :-1]
+        step[:, :-1] |= grown[:, 1:]
+        grown = step
+
+    # Connected components on the small block grid
+    labels = np.zeros(grown.shape, dtype=np.int32)
+    regions: list[Region] = []
+    for start in zip(*np.nonzero(grown)):
+        if labels[start]:
+            continue
+        label = len(regions) + 1
+        labels[start] = label
+        stack = [start]
+        top, left, bottom, right = start[0], start[1], start[0], start[1]
+        while stack:
+            r, c = stack.pop()
+            top, left, bottom, right = min(top, r), min(left, c), max(bottom, r), max(right, c)
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and grown[nr, nc] and not labels[nr, nc]:
+                    labels[nr, nc] = label
+                    stack.append((nr, nc))
+        regions.append(Region(left * cell, top * cell, min(width, (right + 1) * cell), min(height, (bottom + 1) * cell)))
+
+    # Merge boxes that overlap after growing, then cap the number of regions
+    merged: list[Region] = []
+    for region in sorted(regions, key=lambda r: r.area, reverse=True):
+        for i, existing in enumerate(merged):
+            if existing.overlaps(region):
+                merged[i] = existing.union(region)
+                break
+        else:
+            merged.append(region)
+    if len(merged) > max_regions:
+        union = merged[0]
+        for region in merged[1:]:
+            union = union.union(region)
+        merged = [union]
+    return sorted(merged, key=lambda r: r.area, reverse=True)
+
+
+@dataclass
+class RoiPayload:
+    """
+    A low-resolution full-screen thumbnail plus high-resolution crops of the changed regions.
+
+    Attributes:
+        screen_width (int): The full-screen width in pixels.
+        screen_height (int): The full-screen height in pixels.
+        thumbnail (EncodedImage): The encoded full-screen thumbnail.
+        crops (list[tuple[Region, EncodedImage]]): The changed regions and their encoded crops.
+    """
+    screen_width: int
+    screen_height: int
+    thumbnail: EncodedImage
+    crops: list[tuple[Region, EncodedImage]]
+
+    @property
+    def payload_bytes(self) -> int:
+        """The total base64 payload of the thumbnail and the crops."""
+        return self.thumbnail.payload_bytes + sum(crop.payload_bytes for _, crop in self.crops)
+
+    def content_parts(self, text: str) -> list[dict[str, Any]]:
+        """
+        Builds the message content: a description of the layout, the thumbnail, then each crop.
+
+        Args:
+            text (str): The leading text (e.g. "Current screen state:").
+
+        Returns:
+            list[dict[str, Any]]: The content parts for a user message.
+        """
+        lines = [
+            text,
+            f"Image 1 is the full {self.screen_width}x{self.screen_height} screen, downscaled to "
+            f"{self.thumbnail.width}x{self.thumbnail.height}. Only the regions below changed since the reference "
+            f"screenshot; they follow at higher resolution (coordinates in full-screen pixels):",
+        ]
+        for i, (region, crop) in enumerate(self.crops, 2):
+            lines.append(f"Image {i}: region ({region.left}, {region.top})-({region.right}, {region.bottom}), "
+                         f"shown at {crop.width}x{crop.height}.")
+        parts: list[dict[str, Any]] = [{"type": "text", "text": "\n".join(lines)}]
+        for image in [self.thumbnail] + [crop for _, crop in self.crops]:
+            parts.append({"type": "image_url", "image_url": {"url": image.data_uri}})
+        return parts
+
+
+def build_roi_payload(
+    previous: np.ndarray | None,
+    current: np.ndarray,
+    thumbnail_profile: EncodingProfile = THUMBNAIL_PROFILE,
+    crop_profile: EncodingProfile = CROP_PROFILE,
+    max_changed_fraction: float = 0.4,
+) -> RoiPayload | None:
+    """
+    Builds a thumbnail-plus-crops payload when only a small part of the screen changed.
+
+    Args:
+        previous (np.ndarray | None): The last full frame the model still holds, or None.
+        current (np.ndarray): The new frame.
+        thumbnail_profile (EncodingProfile): The encoding for the full-screen thumbnail.
+        crop_profile (EncodingProfile): The encoding for the crops.
+        max_changed_fraction (float): The changed share of the screen above which the full frame is better.
+
+    Returns:
+        RoiPayload | None: The payload, or None if there is no previous frame, nothing changed, or too much changed.
+    """
+    if previous is None:
+        return None
+    regions = changed_regions(previous, current)
+    height, width = current.shape[:2]
+    if not regions or sum(region.area for region in regions) > max_changed_fraction * width * height:
+        return None
+    crops = [
+        (region, encode_frame(np.ascontiguousarray(current[region.top:region.bottom, region.left:region.right]), crop_profile))
+        for region in regions
+    ]
+    return RoiPayload(width, height, encode_frame(current, thumbnail_profile), crops)
@@ -0,0 +1,414 @@
+from __future__ import annotations
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import importlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable
+import numpy as np
+from PIL import Image
+from actions import ActionExecutor, ClickAction
+from capture import ScreenCapture, get_default_capture
+from change_detection import ChangeDetector
+from roi import Region
+from tracing import serve_metrics_from_env, span, tracer
+
+# Prompt section added to the agents' system prompts when a grounding endpoint is configured
+CLICK_ACTION_PROMPT = """
+Clicking:
+    When the keyboard cannot reach an element, use {"action": "click", "target": "<short description of the element>"}
+    (add "clicks": 2 for a double click). A local grounding model finds the element on the current screen, so describe
+    exactly one visible element, e.g. "the search box" or "the Sign in button". If it reports that it could not
+    confidently locate the element, nothing was clicked: describe the element differently or use the keyboard.
+"""
+
+# Queries the local tier can handle alone: a single click on one described element
+_SIMPLE_CLICK = re.compile(r"^\s*(?:please\s+)?(?:click|tap)\s+(?:on\s+)?(?P<target>.+?)\s*[.!]?\s*$", re.IGNORECASE)
+# Words and punctuation that mean the query needs more than one step
+_MULTI_STEP = re.compile(r"\b(?:and|then|after|before|until|if)\b|[,;:]", re.IGNORECASE)
+
+
+def simple_click_target(query: str) -> str | None:
+    """
+    Returns the target of a query that is a single click, e.g. "click the search box" -> "the search box".
+
+    Args:
+        query (str): The user's task description.
+
+    Returns:
+        str | None: The target description, or None if the query needs planning.
+    """
+    match = _SIMPLE_CLICK.match(query)
+    if match is None or _MULTI_STEP.search(match.group("target")):
+        return None
+    return match.group("target")
+
+
+def save_png(frame: np.ndarray, path: str) -> None:
+    """
+    Saves a frame as a lossless, fast PNG: the model must see the same pixels the click lands on.
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 RGB array (or a view into one).
+        path (str): The file to write.
+    """
+    Image.fromarray(np.ascontiguousarray(frame)).save(path, compress_level=1)
+
+
+@dataclass
+class GroundingResult:
+    """
+    The local grounding model's answer for one target.
+
+    Attributes:
+        target (str): The target description.
+        x (int | None): The click x coordinate in screen pixels, or None if the answer was unusable.
+        y (int | None): The click y coordinate in screen pixels, or None if the answer was unusable.
+        raw (Any): The model's raw output.
+        latency (float): The round-trip time in seconds.
+        reason (str | None): Why the answer is unusable, if it is.
+    """
+    target: str
+    x: int | None
+    y: int | None
+    raw: Any
+    latency: float
+    reason: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.x is not None and self.y is not None
+
+
+class GroundingClient:
+    """
+    Calls the Holo grounding endpoint (endpoint/endpoint.py) through its Gradio API.
+
+    Attributes:
+        url (str): The endpoint URL (e.g. "http://localhost:7860").
+        timeout (float): The request timeout in seconds.
+    """
+
+    def __init__(self, url: str, timeout: float = 15.0) -> None:
+        self.url = url
+        self.timeout = timeout
+        self._client: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        # Connecting fetches the API description, so it is deferred until the first request
+        with self._lock:
+            if self._client is None:
+                from gradio_client import Client
+                self._client = Client(self.url, verbose=False, httpx_kwargs={"timeout": self.timeout})
+            return self._client
+
+    def locate(self, frame: np.ndarray, target: str, region: Region | None = None, image_path: str | None = None) -> GroundingResult:
+        """
+        Finds a target on a frame, optionally searching only one region of it.
+
+        Only the region is encoded and uploaded, so a small region is both cheaper to send and seen by the
+        model at a higher resolution. With `image_path`, the already-encoded full screen is sent instead and
+        the endpoint crops the region itself.
+
+        Args:
+            frame (np.ndarray): The full screen, (height, width, 3) uint8 RGB.
+            target (str): The target element description.
+            region (Region | None): The part of the screen to search, or None for the whole screen.
+            image_path (str | None): A PNG of the full frame to upload instead of encoding the crop.
+
+        Returns:
+            GroundingResult: The click position in full-screen pixels, or the reason it is unusable.
+        """
+        height, width = frame.shape[:2]
+        region = region or Region(0, 0, width, height)
+        crop = frame[region.top:region.bottom, region.left:region.right]
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as directory:
+            path = image_path
+            if path is None:
+                path = os.path.join(directory, "screen.png")
+                save_png(crop, path)
+            from gradio_client import handle_file
+            answer = self.client.predict(
+                handle_file(path), target, region.left, region.top, region.right, region.bottom,
+                api_name="/predict_region",
+            )
+        latency = time.perf_counter() - start
+
+        if not isinstance(answer, dict) or "x" not in answer or "y" not in answer:
+            raw = answer.get("raw") if isinstance(answer, dict) else answer
+            return GroundingResult(target, None, None, raw, latency, "unparseable answer")
+        x, y = int(answer["x"]), int(answer["y"])
+        if not (region.left <= x < region.right and region.top <= y < region.bottom):
+            return GroundingResult(target, None, None, answer.get("raw"), latency, f"click ({x}, {y}) outside the searched area")
+        return GroundingResult(target, x, y, answer.get("raw"), latency)
+
+    def locate_confident(self, frame: np.ndarray, target: str, radius: int = 160, tolerance: int = 24) -> GroundingResult:
+        """
+        Finds a target and checks the answer by grounding the target again in a zoomed crop around it.
+
+        Holo returns a point without a confidence score, so agreement between the whole-screen answer and
+        the answer at higher resolution stands in for one: a point the model cannot find again (or finds
+        elsewhere) is treated as low confidence. The check runs before anything is clicked.
+
+        Args:
+            frame (np.ndarray): The full screen, (height, width, 3) uint8 RGB.
+            target (str): The target element description.
+            radius (int): Half the side of the zoomed crop in pixels.
+            tolerance (int): The largest distance in pixels between the two answers that still counts as agreement.
+
+        Returns:
+            GroundingResult: The zoomed (more precise) answer, or the reason the target is not confidently located.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            # Encoded once and sent with both requests; the endpoint crops the zoomed region itself
+            path = os.path.join(directory, "screen.png")
+            save_png(frame, path)
+            first = self.locate(frame, target, image_path=path)
+            if not first.ok:
+                return first
+            height, width = frame.shape[:2]
+            region = Region(max(0, first.x - radius), max(0, first.y - radius),
+                            min(width, first.x + radius), min(height, first.y + radius))
+            second = self.locate(frame, target, region, image_path=path)
+        latency = first.latency + second.latency
+        if not second.ok:
+            return GroundingResult(target, None, None, second.raw, latency,
+                                   f"not found again around ({first.x}, {first.y}): {second.reason}")
+        if max(abs(second.x - first.x), abs(second.y - first.y)) > tolerance:
+            return GroundingResult(target, None, None, second.raw, latency,
+                                   f"answers disagree: ({first.x}, {first.y}) vs ({second.x}, {second.y})")
+        return GroundingResult(target, second.x, second.y, second.raw, latency)
+
+
+def grounding_from_env() -> GroundingClient | None:
+    """
+    Creates a grounding client from HOLO_ENDPOINT_URL (and the optional HOLO_ENDPOINT_TIMEOUT).
+
+    Returns:
+        GroundingClient | None: The client, or None if HOLO_ENDPOINT_URL is not set.
+    """
+    url = os.getenv("HOLO_ENDPOINT_URL")
+    if not url:
+        return None
+    return GroundingClient(url, timeout=float(os.getenv("HOLO_ENDPOINT_TIMEOUT", "15")))
+
+
+@dataclass
+class RouteDecision:
+    """
+    One routing decision and its outcome.
+
+    Attributes:
+        query (str): The task description, or the click target for a step routed inside a planner's loop.
+        tier (str): "local" (grounding model) or "cloud" (planner).
+        reason (str): Why this tier was used, or why it failed.
+        success (bool): Whether the tier completed the task or step.
+        latency (float): The seconds the tier spent on the task or step.
+    """
+    query: str
+    tier: str
+    reason: str
+    success: bool
+    latency: float
+
+
+class TaskRouter:
+    """
+    Routes work local-first, per task and per step.
+
+    A task that is a single click on a described element goes to the local grounding model. Inside the
+    planner's loop, every click step the planner emits is grounded locally too (`locate` is the executor's
+    locate function). Either way the local answer is only used when `GroundingClient.locate_confident`
+    agrees with itself; otherwise nothing is clicked and the work escalates to the planner from the
+    current screen: the whole task goes to the planner, or the planner is told the step failed and picks
+    another approach for it. A local click on a whole task must also visibly change the screen; if it does
+    not, the planner takes over from the post-click screen and is told where the click landed.
+
+    Attributes:
+        grounding (GroundingClient | None): The local grounding client, or None to always use the planner.
+        planner (Callable[..., bool]): Runs a task with the cloud planner (e.g. `agent.perform_task`); called
+            with the query, plus a `note` keyword about work already done when a local click was made.
+        planner_name (str): The planner's name for logs.
+        executor (ActionExecutor): Executes local clicks.
+        verify_timeout (float): The seconds to wait for a local click to change the screen.
+        verify_radius (int): Half the side of the zoomed crop the target is grounded again in.
+        verify_tolerance (int): The largest disagreement in pixels between the two grounding answers.
+        decisions (list[RouteDecision]): Every decision made so far.
+    """
+
+    def __init__(
+        self,
+        grounding: GroundingClient | None,
+        planner: Callable[..., bool],
+        planner_name: str = "cloud",
+        executor: ActionExecutor | None = None,
+        capture: ScreenCapture | None = None,
+        verify_timeout: float = 2.0,
+        verify_radius: int = 160,
+        verify_tolerance: int = 24,
+    ) -> None:
+        self.grounding = grounding
+        self.planner = planner
+        self.planner_name = planner_name
+        self.executor = executor or ActionExecutor()
+        self.verify_timeout = verify_timeout
+        self.verify_radius = verify_radius
+        self.verify_tolerance = verify_tolerance
+        self.decisions: list[RouteDecision] = []
+        self._capture = capture
+        self._lock = threading.Lock()
+
+    def run(self, query: str) -> bool:
+        """
+        Runs a task on the cheapest tier that can handle it.
+
+        Args:
+            query (str): The task description.
+
+        Returns:
+            bool: True if the task completed.
+        """
+        target = simple_click_target(query)
+        note = None
+        if self.grounding is None:
+            reason = "no grounding endpoint"
+        elif target is None:
+            reason = "needs planning"
+        else:
+            success, reason, note = self._run_local(query, target)
+            if success:
+                return True
+            reason = f"local {reason}"
+
+        print(f"Route: {self.planner_name} ({reason})")
+        start = time.perf_counter()
+        with span("route_cloud", planner=self.planner_name, reason=reason) as cloud_span:
+            # The planner starts from the current screen; the note says what the local tier already did there
+            success = self.planner(query, note=note) if note else self.planner(query)
+            cloud_span.set(success=success)
+        self._record(RouteDecision(query, "cloud", reason, success, time.perf_counter() - start))
+        return success
+
+    def _run_local(self, query: str, target: str) -> tuple[bool, str, str | None]:
+        # Returns (success, reason, note for the planner if a click was already made)
+        start = time.perf_counter()
+        note = None
+        with span("route_local", target=target) as local_span:
+            try:
+                detector = ChangeDetector(self._capture or get_default_capture())
+                result = self.grounding.locate_confident(detector.settle(), target, self.verify_radius, self.verify_tolerance)
+                if not result.ok:
+                    # Nothing was clicked, so the planner starts from the same screen
+                    success, reason = False, result.reason
+                else:
+                    self.executor.execute(ClickAction(x=result.x, y=result.y))
+                    # A click that changes nothing most likely missed its target
+                    changed = detector.wait_for_change(detector.last_fingerprint, timeout=self.verify_timeout)
+                    success, reason = changed, "clicked" if changed else "click caused no visible change"
+                    if not changed:
+                        note = (f"A click on '{target}' was already made at ({result.x}, {result.y}) and did not visibly "
+                                f"change the screen. Check whether it took effect before clicking again.")
+            except Exception as e:
+                success, reason = False, f"error: {e}"
+            local_span.set(success=success, reason=reason)
+        latency = time.perf_counter() - start
+        print(f"Route: local grounding for '{target}' {'succeeded' if success else 'failed'} ({reason}, {latency:.2f}s)")
+        self._record(RouteDecision(query, "local", reason, success, latency))
+        return success, reason, note
+
+    def locate(self, target: str) -> tuple[int, int]:
+        """
+        Grounds one click step of the planner on the current screen; usable as `ActionExecutor.locate`.
+
+        Args:
+            target (str): The target element description.
+
+        Returns:
+            tuple[int, int]: The (x, y) click position in screen pixels.
+
+        Raises:
+            ValueError: If there is no grounding endpoint or the target is not confidently located; the
+                planner gets the message as feedback and handles the step itself.
+        """
+        if self.grounding is None:
+            raise ValueError(f"Cannot click '{target}': no grounding model is configured")
+        start = time.perf_counter()
+        with span("route_local", target=target, caller="planner") as local_span:
+            try:
+                result = self.grounding.locate_confident(
+                    (self._capture or get_default_capture()).grab(), target, self.verify_radius, self.verify_tolerance
+                )
+            except Exception as e:
+                result = GroundingResult(target, None, None, None, time.perf_counter() - start, f"error: {e}")
+            local_span.set(ok=result.ok, reason=result.reason)
+        self._record(RouteDecision(target, "local", result.reason or "located", result.ok, time.perf_counter() - start))
+        if not result.ok:
+            raise ValueError(f"Could not confidently locate '{target}' on screen ({result.reason}); nothing was clicked")
+        return result.x, result.y
+
+    def _record(self, decision: RouteDecision) -> None:
+        with self._lock:
+            self.decisions.append(decision)
+        tracer.increment(f"route_{decision.tier}_tasks")
+        if not decision.success:
+            tracer.increment(f"route_{decision.tier}_failures")
+
+    def summary(self) -> str:
+        """
+        Describes how tasks were routed and the median latency per tier.
+
+        Returns:
+            str: A one-line summary.
+        """
+        parts = []
+        for tier in ("local", "cloud"):
+            latencies = sorted(d.latency for d in self.decisions if d.tier == tier)
+            if latencies:
+                succeeded = sum(d.success for d in self.decisions if d.tier == tier)
+                parts.append(f"{tier} {len(latencies)} ({succeeded} ok, median {latencies[len(latencies) // 2]:.2f}s)")
+        escalated = sum(1 for d in self.decisions if d.tier == "local" and not d.success)
+        return f"Routing: {', '.join(parts) or 'no tasks'}; {escalated} escalated from local to {self.planner_name}"
+
+
+def build_router(provider: str = "groq", grounding: GroundingClient | None = None) -> TaskRouter:
+    """
+    Returns the router of a provider's agent module, which also grounds the click steps of its planner.
+
+    Args:
+        provider (str): The provider key in runner.PROVIDER_MODULES.
+        grounding (GroundingClient | None): A grounding client to use instead of the one from HOLO_ENDPOINT_URL.
+
+    Returns:
+        TaskRouter: The router.
+    """
+    from runner import PROVIDER_MODULES
+    # Imported lazily: the agent modules build their provider pools at import time
+    module = importlib.import_module(PROVIDER_MODULES[provider])
+    if grounding is not None:
+        module.router.grounding = grounding
+        module.executor.locate = module.router.locate
+    return module.router
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a task local-first, escalating to a cloud planner when needed.")
+    parser.add_argument("query", nargs="?", help="The task; prompted for if omitted.")
+    parser.add_argument("--provider", choices=["groq", "azure"], default="groq", help="The cloud planner.")
+    args = parser.parse_args()
+
+    serve_metrics_from_env()
+    router = build_router(args.provider)
+    success = router.run(args.query or input("Enter your request: "))
+    print(router.summary())
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import shlex
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+
+# Agent module that implements perform_task for each provider
+PROVIDER_MODULES = {
+    "groq": "agent",
+    "azure": "open_ai",
+}
+
+# Default number of tasks allowed in flight per provider
+DEFAULT_PROVIDER_LIMITS = {
+    "groq": 4,
+    "azure": 4,
+}
+
+
+@dataclass
+class Task:
+    """
+    A single task read from the task file.
+
+    Attributes:
+        task_id (str): An identifier for reporting (defaults to the line number).
+        query (str): The user request passed to perform_task.
+        provider (str): The provider key in PROVIDER_MODULES.
+    """
+    task_id: str
+    query: str
+    provider: str = "groq"
+
+
+@dataclass
+class TaskResult:
+    """
+    The outcome of running one task.
+
+    Attributes:
+        task_id (str): The task identifier.
+        session (int): The index of the session that ran the task.
+        success (bool): Whether the agent reported the task complete.
+        duration (float): The wall-clock time in seconds.
+        error (str | None): The failure reason, if any.
+    """
+    task_id: str
+    session: int
+    success: bool
+    duration: float
+    error: str | None = None
+
+
+def load_tasks(path: str) -> list[Task]:
+    """
+    Reads tasks from a JSONL file with one {"query": ..., "provider": ..., "task_id": ...} object per line.
+
+    Args:
+        path (str): The path of the JSONL task file.
+
+    Returns:
+        list[Task]: The tasks in file order.
+    """
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            provider = record.get("provider", "groq")
+            if provider not in PROVIDER_MODULES:
+                raise ValueError(f"Unknown provider '{provider}' on line {line_number}")
+            tasks.append(Task(
+                task_id=str(record.get("task_id", line_number)),
+                query=record["query"],
+                provider=provider,
+            ))
+    return tasks
+
+
+class VirtualDisplay:
+    """
+    An Xvfb server giving one session its own X display.
+
+    Attributes:
+        number (int): The X display number (the display is ":<number>").
+        size (str): The screen geometry and depth passed to Xvfb (e.g. "1920x1080x24").
+    """
+
+    def __init__(self, number: int, size: str = "1920x1080x24") -> None:
+        self.number = number
+        self.size = size
+        self._process: asyncio.subprocess.Process | None = None
+
+    @property
+    def name(self) -> str:
+        """The DISPLAY value for this server."""
+        return f":{self.number}"
+
+    async def start(self, timeout: float = 10.0, grace: float = 0.3) -> None:
+        """
+        Starts Xvfb and waits until its socket accepts connections.
+
+        A socket or lock file left by another server would pass the wait while this Xvfb exits with
+        "display in use", and the session would then drive someone else's display; so a taken display
+        is refused up front, and the server must still be running `grace` seconds after its socket appears.
+
+        Args:
+            timeout (float): The maximum time in seconds to wait for the server.
+            grace (float): The seconds the server must survive after its socket appears.
+
+        Raises:
+            RuntimeError: If the display is already in use or Xvfb does not start.
+        """
+        socket_path = f"/tmp/.X11-unix/X{self.number}"
+        lock_path = f"/tmp/.X{self.number}-lock"
+        if os.path.exists(socket_path) or os.path.exists(lock_path):
+            raise RuntimeError(f"Display {self.name} is already in use")
+        self._process = await asyncio.create_subprocess_exec(
+            "Xvfb", self.name, "-screen", "0", self.size, "-nolisten", "tcp",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(socket_path):
+            if self._process.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Xvfb failed to start on display {self.name}")
+            await asyncio.sleep(0.05)
+        try:
+            # The socket may belong to a server that won the race for this display number
+            await asyncio.wait_for(self._process.wait(), timeout=grace)
+        except asyncio.TimeoutError:
+            return
+        raise RuntimeError(f"Xvfb exited on display {self.name} (code {self._process.returncode}); the display is in use")
+
+    async def stop(self) -> None:
+        """Terminates the Xvfb server."""
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+            await self._process.wait()
+
+
+@dataclass
+class Session:
+    """
+    An isolated agent session: one virtual display plus an optional application running on it.
+
+    Attributes:
+        index (int): The session index.
+        display (VirtualDisplay): The session's X display.
+        app_command (str | None): A command started on the display (e.g. a browser), or None.
+    """
+    index: int
+    display: VirtualDisplay
+    app_command: str | None = None
+    _app: asyncio.subprocess.Process | None = field(default=None, repr=False)
+
+    @property
+    def env(self) -> dict[str, str]:
+        """The environment for processes that should run on this session's display."""
+        return {**os.environ, "DISPLAY": self.display.name}
+
+    async def start(self) -> None:
+        """Starts the display and the session application."""
+        await self.display.start()
+        if self.app_command:
+            self._app = await asyncio.create_subprocess_exec(
+                *shlex.split(self.app_command),
+                env=self.env,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+
+    async def stop(self) -> None:
+        """Stops the session application and the display."""
+        if self._app is not None and self._app.returncode is None:
+            self._app.terminate()
+            await self._app.wait()
+        await self.display.stop()
+
+    async def run_task(self, task: Task, timeout: float | None) -> TaskResult:
+        """
+        Runs one task in a worker process bound to this session's display.
+
+        pyautogui and mss bind to $DISPLAY when they are imported, so each task runs in its own
+        process with DISPLAY pointing at the session's Xvfb server.
+
+        Args:
+            task (Task): The task to run.
+            timeout (float | None): The maximum time in seconds for the task, or None for no limit.
+
+        Returns:
+            TaskResult: The outcome of the task.
+        """
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "worker", task.provider, task.query,
+            env=self.env,
+            stdin=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            returncode = await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return TaskResult(task.task_id, self.index, False, time.perf_counter() - start, "timeout")
+        error = None if returncode == 0 else f"exit code {returncode}"
+        return TaskResult(task.task_id, self.index, returncode == 0, time.perf_counter() - start, error)
+
+
+async def run_tasks(
+    tasks: list[Task],
+    num_sessions: int,
+    provider_limits: dict[str, int],
+    app_command: str | None = None,
+    first_display: int = 99,
+    task_timeout: float | None = 600.0,
+) -> list[TaskResult]:
+    """
+    Schedules tasks across isolated sessions, respecting per-provider concurrency limits.
+
+    Args:
+        tasks (list[Task]): The tasks to run.
+        num_sessions (int): The number of parallel sessions (each with its own Xvfb display).
+        provider_limits (dict[str, int]): The maximum number of tasks in flight per provider.
+        app_command (str | None): A command to start on every display (e.g. a browser).
+        first_display (int): The X display number of the first session.
+        task_timeout (float | None): The maximum time in seconds per task.
+
+    Returns:
+        list[TaskResult]: One result per task, in completion order.
+    """
+    sessions = [
+        Session(index, VirtualDisplay(first_display + index), app_command)
+        for index in range(num_sessions)
+    ]
+    limits = {provider: asyncio.Semaphore(limit) for provider, limit in provider_limits.items()}
+    queue: asyncio.Queue[Task] = asyncio.Queue()
+    for task in tasks:
+        queue.put_nowait(task)
+    results: list[TaskResult] = []
+
+    async def session_worker(session: Session) -> None:
+        # Each session pulls tasks until the queue is empty
+        while True:
+            try:
+                task = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with limits[task.provider]:
+                result = await session.run_task(task, task_timeout)
+            status = "ok" if result.success else f"failed ({result.error})"
+            print(f"[session {session.index}] task {task.task_id}: {status} in {result.duration:.1f}s")
+            results.append(result)
+
+    await asyncio.gather(*(session.start() for session in sessions))
+    try:
+        await asyncio.gather(*(session_worker(session) for session in sessions))
+    finally:
+        await asyncio.gather(*(session.stop() for session in sessions))
+    return results
+
+
+def run_worker(provider: str, query: str) -> int:
+    """
+    Entry point of a worker process: runs one task local-first, with the provider's agent as the planner.
+
+    Args:
+        provider (str): The provider key in PROVIDER_MODULES.
+        query (str): The user request.
+
+    Returns:
+        int: The process exit code (0 if the task completed).
+    """
+    from router import build_router
+    # Without HOLO_ENDPOINT_URL the router sends every task straight to the provider's agent
+    router = build_router(provider)
+    success = router.run(query)
+    print(router.summary())
+    return 0 if success else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run agent tasks in parallel on virtual displays.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a JSONL task file.")
+    run_parser.add_argument("tasks", help="JSONL file with one {\"query\": ..., \"provider\": ...} per line.")
+    run_parser.add_argument("--sessions", type=int, default=os.cpu_count() or 1, help="Number of parallel sessions.")
+    run_parser.add_argument("--app", default=None, help="Command started on every display, e.g. 'firefox'.")
+    run_parser.add_argument("--first-display", type=int, default=99, help="X display number of the first session.")
+    run_parser.add_argument("--timeout", type=float, default=600.0, help="Per-task timeout in seconds.")
+    for provider, limit in DEFAULT_PROVIDER_LIMITS.items():
+        run_parser.add_argument(f"--{provider}-limit", type=int, default=limit, help=f"Max concurrent {provider} tasks.")
+
+    worker_parser = subparsers.add_parser("worker", help="Run a single task (used internally by 'run').")
+    worker_parser.add_argument("provider", choices=sorted(PROVIDER_MODULES))
+    worker_parser.add_argument("query")
+
+    args = parser.parse_args()
+    if args.command == "worker":
+        sys.exit(run_worker(args.provider, args.query))
+
+    tasks = load_tasks(args.tasks)
+    limits = {provider: getattr(args, f"{provider}_limit") for provider in DEFAULT_PROVIDER_LIMITS}
+    start = time.perf_counter()
+    results = asyncio.run(run_tasks(tasks, args.sessions, limits, args.app, args.first_display, args.timeout))
+    elapsed = time.perf_counter() - start
+
+    # Report throughput
+    succeeded = sum(result.success for result in results)
+    print(f"Completed {succeeded}/{len(results)} tasks in {elapsed:.1f}s "
+          f"({len(results) / elapsed * 3600:.1f} tasks/hour, {args.sessions} sessions)")
+
+
+if __name__ == "__main__":
+    main()
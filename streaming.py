@@ -0,0 +1,241 @@
+from __future__ import annotations
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+
+def is_tool_object(obj: Any, tool_names: tuple[str, ...] | None = None) -> bool:
+    """
+    Whether a decoded JSON value is a tool object.
+
+    Args:
+        obj (Any): The decoded value.
+        tool_names (tuple[str, ...] | None): The accepted "tool" values, or None to accept any.
+
+    Returns:
+        bool: True if it is a dict with an accepted "tool" value.
+    """
+    return isinstance(obj, dict) and "tool" in obj and (tool_names is None or obj["tool"] in tool_names)
+
+
+def extract_tool_object(text: str, tool_names: tuple[str, ...] | None = None) -> dict[str, Any] | None:
+    """
+    Finds the first JSON object with a "tool" key anywhere in a piece of text.
+
+    Unlike slicing from the first '{' to the last '}', this tolerates braces in the surrounding
+    reasoning and several objects in one response. With `tool_names`, objects naming an unknown
+    tool (e.g. a schema echoed in the reasoning) are skipped in favour of a later valid one.
+
+    Args:
+        text (str): The model's response text.
+        tool_names (tuple[str, ...] | None): The accepted "tool" values, or None to accept any.
+
+    Returns:
+        dict[str, Any] | None: The first decoded tool object, or None if there is none.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            obj, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            obj = None
+        if is_tool_object(obj, tool_names):
+            return obj
+        start = text.find("{", start + 1)
+    return None
+
+
+@dataclass
+class _Candidate:
+    # One possible object start and the brace/string state seen from it
+    start: int
+    depth: int = 1
+    in_string: bool = False
+    escape: bool = False
+
+
+class IncrementalJSONScanner:
+    """
+    Detects the first complete JSON object with a "tool" key while text is still arriving.
+
+    Like `extract_tool_object`, every '{' is treated as a possible start: quotes and braces in the
+    prose before it (e.g. `He said "hi {"`) cannot tell whether a later brace is inside a string, so
+    each candidate tracks brace depth and string state from its own start. Each character is examined
+    once per open candidate, and a candidate is only decoded when its closing brace arrives.
+
+    Attributes:
+        text (str): All text fed so far.
+        end (int | None): The index just past the detected object, once one has been found.
+        tool_names (tuple[str, ...] | None): The accepted "tool" values, or None to accept any.
+        max_candidates (int): The number of open candidates kept; the oldest is dropped beyond it.
+    """
+
+    def __init__(self, tool_names: tuple[str, ...] | None = None, max_candidates: int = 32) -> None:
+        self.text = ""
+        self.tool_names = tool_names
+        self.max_candidates = max_candidates
+        self.end: int | None = None
+        self._pos = 0
+        self._candidates: list[_Candidate] = []
+
+    def feed(self, chunk: str) -> dict[str, Any] | None:
+        """
+        Adds a chunk of text and returns the tool object if it has just been completed.
+
+        Args:
+            chunk (str): The next piece of streamed text.
+
+        Returns:
+            dict[str, Any] | None: The decoded tool object, or None if it is not complete yet.
+        """
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            closed = []
+            for candidate in self._candidates:
+                if candidate.in_string:
+                    if candidate.escape:
+                        candidate.escape = False
+                    elif ch == "\\":
+                        candidate.escape = True
+                    elif ch == '"':
+                        candidate.in_string = False
+                elif ch == '"':
+                    candidate.in_string = True
+                elif ch == "{":
+                    candidate.depth += 1
+                elif ch == "}":
+                    candidate.depth -= 1
+                    if candidate.depth == 0:
+                        closed.append(candidate)
+            if ch == "{":
+                self._candidates.append(_Candidate(i))
+                if len(self._candidates) > self.max_candidates:
+                    # Braces inside strings leave candidates that never close; keep the scan bounded
+                    self._candidates.pop(0)
+            for candidate in closed:
+                self._candidates.remove(candidate)
+                try:
+                    obj = json.loads(text[candidate.start:i + 1])
+                except json.JSONDecodeError:
+                    obj = None
+                if is_tool_object(obj, self.tool_names):
+                    self._pos = self.end = i + 1
+                    self._candidates.clear()
+                    return obj
+        self._pos = len(text)
+        return None
+
+
+@dataclass
+class StreamResult:
+    """
+    The outcome of a streamed completion.
+
+    Attributes:
+        text (str): The response text received (trimmed after the action if the stream was cancelled).
+        action (dict[str, Any] | None): The first tool object found, or None.
+        time_to_action (float | None): Seconds from the request until the action was detected.
+        total_time (float): Seconds from the request until the stream ended.
+        cancelled (bool): Whether the stream was closed early after the action was found.
+        prompt_tokens (int | None): The prompt tokens reported by the provider, if the stream included usage
+            (None when the stream was cancelled before the final usage chunk).
+        completion_tokens (int | None): The completion tokens reported by the provider, if the stream included usage.
+    """
+    text: str
+    action: dict[str, Any] | None
+    time_to_action: float | None
+    total_time: float
+    cancelled: bool
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+def _chunk_usage(chunk: Any) -> Any:
+    # OpenAI-style streams put usage on the final chunk; Groq puts it under x_groq
+    usage = getattr(chunk, "usage", None)
+    if usage is None:
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+    return usage
+
+
+def stream_completion(
+    create: Callable[..., Any],
+    on_action: Callable[[dict[str, Any]], None] | None = None,
+    cancel_on_action: bool = True,
+    tool_names: tuple[str, ...] | None = None,
+    **kwargs: Any,
+) -> StreamResult:
+    """
+    Streams a chat completion and surfaces the first tool object as soon as it is complete.
+
+    Works with any OpenAI-compatible client (Groq, Azure OpenAI) by taking its
+    `chat.completions.create` method, or with `ProviderPool.create`.
+
+    Args:
+        create (Callable[..., Any]): The client's `chat.completions.create` method or a pool's `create`.
+        on_action (Callable[[dict[str, Any]], None] | None): Called with the tool object the moment it is detected.
+        cancel_on_action (bool): Whether to close the stream once the action is found instead of reading the rest.
+        tool_names (tuple[str, ...] | None): The accepted "tool" values, or None to accept any.
+        **kwargs (Any): Arguments forwarded to `create` (model, messages, ...).
+
+    Returns:
+        StreamResult: The streamed text, the detected action and timing information.
+    """
+    start_time = time.perf_counter()
+    # Ask for usage on the final chunk; it only arrives when the stream is read to the end, so a
+    # cancelled stream leaves the token counts None and callers fall back to their own estimate
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    stream = create(stream=True, **kwargs)
+    scanner = IncrementalJSONScanner(tool_names)
+    action: dict[str, Any] | None = None
+    time_to_action: float | None = None
+    cancelled = False
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+    try:
+        for chunk in stream:
+            usage = _chunk_usage(chunk)
+            if usage is not None:
+                prompt_tokens = getattr(usage, "prompt_tokens", None)
+                completion_tokens = getattr(usage, "completion_tokens", None)
+            # Some providers send chunks without choices (e.g. content filter results)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if action is not None:
+                scanner.text += delta
+                continue
+            action = scanner.feed(delta)
+            if action is not None:
+                time_to_action = time.perf_counter() - start_time
+                if on_action is not None:
+                    on_action(action)
+                if cancel_on_action:
+                    cancelled = True
+                    break
+    finally:
+        # Closing the stream drops the connection so the provider stops generating
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    text = scanner.text[:scanner.end] if cancelled else scanner.text
+    if action is None:
+        # Fall back to a full scan in case the incremental scan was thrown off by stray quotes
+        action = extract_tool_object(text, tool_names)
+    return StreamResult(
+        text=text,
+        action=action,
+        time_to_action=time_to_action,
+        total_time=time.perf_counter() - start_time,
+        cancelled=cancelled,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+    )
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import json
+import time
+import base64
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+# Response returned when no canned responses are configured
+DEFAULT_RESPONSE = 'The task is complete.\n{"tool": "task_complete"}'
+
+# Token estimate for an image whose size cannot be read from its header (a 1024x1024 high-detail image)
+FALLBACK_IMAGE_TOKENS = 765
+
+
+class StubState:
+    """
+    Shared configuration and counters for the stub server.
+
+    Attributes:
+        responses (list[str]): Canned assistant responses, returned in order and then repeated from the last.
+        latency (float): Seconds to wait before answering each request.
+        throttle_every (int): Return 429 on every Nth request (0 disables throttling).
+        retry_after (float): The retry-after value sent with a 429.
+        requests (int): The number of requests received.
+        request_bytes (list[int]): The body size in bytes of every request, in order.
+    """
+
+    def __init__(self, responses: list[str] | None = None, latency: float = 0.0,
+                 throttle_every: int = 0, retry_after: float = 1.0) -> None:
+        self.responses = responses or [DEFAULT_RESPONSE]
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.request_bytes: list[int] = []
+        self._served = 0
+        self._lock = threading.Lock()
+
+    def next_request(self) -> tuple[bool, str]:
+        # Returns (throttled, response text) for the next request
+        with self._lock:
+            self.requests += 1
+            if self.throttle_every and self.requests % self.throttle_every == 0:
+                return True, ""
+            text = self.responses[min(self._served, len(self.responses) - 1)]
+            self._served += 1
+            return False, text
+
+
+def _image_size(data: bytes) -> tuple[int, int] | None:
+    # Reads (width, height) from a PNG or JPEG header without decoding the image
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data.startswith(b"\xff\xd8"):
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            # Start-of-frame markers (except DHT, JPG and DAC) carry the image size
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def _image_tokens(url: str, detail: str) -> int:
+    # OpenAI's vision pricing: 85 tokens, plus 170 per 512px tile after fitting into 2048 and then 768 on the short side
+    if detail == "low":
+        return 85
+    try:
+        size = _image_size(base64.b64decode(url.split(",", 1)[1])) if url.startswith("data:") else None
+    except (ValueError, struct.error):
+        size = None
+    if size is None:
+        return FALLBACK_IMAGE_TOKENS
+    width, height = size
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = -(-int(width * scale) // 512) * -(-int(height * scale) // 512)
+    return 85 + 170 * tiles
+
+
+def estimate_prompt_tokens(messages: list[dict[str, Any]]) -> int:
+    """
+    Estimates a request's prompt tokens: about 4 characters per text token, images by their size.
+
+    Args:
+        messages (list[dict[str, Any]]): The request's chat messages.
+
+    Returns:
+        int: The estimated prompt token count.
+    """
+    tokens = 0
+    for message in messages:
+        # Role and message framing
+        tokens += 4
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4
+            elif part.get("type") == "image_url":
+                image = part.get("image_url", {})
+                tokens += _image_tokens(image.get("url", ""), image.get("detail", "auto"))
+    return tokens
+
+
+def _usage(prompt_tokens: int, text: str) -> dict[str, int]:
+    completion_tokens = len(text) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _completion(text: str, model: str, prompt_tokens: int) -> dict[str, Any]:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": _usage(prompt_tokens, text),
+    }
+
+
+def _chunk(model: str, content: str | None, finish_reason: str | None = None) -> dict[str, Any]:
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _usage_chunk(model: str, usage: dict[str, int]) -> dict[str, Any]:
+    # Sent last when the request asks for stream_options.include_usage, as the real providers do
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": usage,
+    }
+
+
+def make_handler(state: StubState) -> type[BaseHTTPRequestHandler]:
+    """
+    Creates a request handler class bound to the given state.
+
+    Args:
+        state (StubState): The shared stub configuration.
+
+    Returns:
+        type[BaseHTTPRequestHandler]: The handler class.
+    """
+
+    class StubHandler(BaseHTTPRequestHandler):
+        # HTTP/1.1 so clients can keep connections alive, as they do against the real providers
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self) -> None:
+            # Accepts both OpenAI-style (/v1/chat/completions) and Azure-style
+            # (/openai/deployments/<name>/chat/completions) paths
+            if not self.path.split("?")[0].endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            state.request_bytes.append(length)
+            model = request.get("model", "stub")
+            prompt_tokens = estimate_prompt_tokens(request.get("messages", []))
+
+            throttled, text = state.next_request()
+            if throttled:
+                self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                {"retry-after": str(state.retry_after)})
+                return
+            if state.latency:
+                time.sleep(state.latency)
+
+            rate_headers = {"x-ratelimit-remaining-requests": "1000", "x-ratelimit-reset-requests": "1s"}
+            if not request.get("stream"):
+                self._send_json(200, _completion(text, model, prompt_tokens), rate_headers)
+                return
+
+            # Server-sent events, one small chunk per few characters like a real token stream
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            for name, value in rate_headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                for i in range(0, len(text), 8):
+                    self.wfile.write(f"data: {json.dumps(_chunk(model, text[i:i + 8]))}\n\n".encode("utf-8"))
+                self.wfile.write(f"data: {json.dumps(_chunk(model, None, 'stop'))}\n\n".encode("utf-8"))
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    usage = _usage_chunk(model, _usage(prompt_tokens, text))
+                    self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early (e.g. after the action was found)
+                pass
+            self.close_connection = True
+
+    return StubHandler
+
+
+def start_stub_server(state: StubState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts an OpenAI-compatible stub server on a background thread.
+
+    Point a "local" provider at it with LOCAL_LLM_BASE_URL=http://<host>:<port>/v1.
+
+    Args:
+        state (StubState): The canned responses and behaviour.
+        host (str): The interface to bind.
+        port (int): The port to bind (0 picks a free port).
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown()` to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for offline runs.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--responses", help="JSON file with a list of canned assistant responses.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Return 429 on every Nth request.")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+    server = start_stub_server(StubState(responses, args.latency, args.throttle_every), port=args.port)
+    print(f"Stub server listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    threading.Event().wait()
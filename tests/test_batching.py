@@ -0,0 +1,88 @@
+from __future__ import annotations
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from endpoint.batching import MicroBatcher
+
+
+class RecordingBatch:
+    """A batch function that doubles each item and records the batches it was given."""
+
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.batches: list[list[int]] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, items: list[int]) -> list[int]:
+        with self.lock:
+            self.batches.append(list(items))
+        if self.error is not None:
+            raise self.error
+        return [item * 2 for item in items]
+
+
+def submit_all(batcher: MicroBatcher, items: list[int]) -> list:
+    # Submit concurrently and return each caller's outcome (result or exception), in item order
+    def submit(item: int):
+        try:
+            return batcher.submit(item)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(submit, items))
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_results():
+    process = RecordingBatch()
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=2000)
+    start = time.monotonic()
+    assert submit_all(batcher, [1, 2, 3, 4]) == [2, 4, 6, 8]
+    # A full batch is dispatched without waiting for the window to close
+    assert time.monotonic() - start < 1.0
+    assert [sorted(batch) for batch in process.batches] == [[1, 2, 3, 4]]
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["items"] == 4 and stats["max_batch_size"] == 4
+
+
+def test_batches_never_exceed_max_batch_size():
+    process = RecordingBatch()
+    batcher = MicroBatcher(process, max_batch_size=3, max_wait_ms=100)
+    items = list(range(10))
+    assert submit_all(batcher, items) == [item * 2 for item in items]
+    assert all(len(batch) <= 3 for batch in process.batches)
+    assert sorted(item for batch in process.batches for item in batch) == items
+
+
+def test_partial_batch_is_flushed_when_the_window_closes():
+    process = RecordingBatch()
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=50)
+    start = time.monotonic()
+    assert batcher.submit(21) == 42
+    elapsed = time.monotonic() - start
+    assert 0.04 <= elapsed < 1.0
+    assert process.batches == [[21]]
+
+
+def test_batch_error_is_raised_to_every_waiter():
+    error = ValueError("model failed")
+    batcher = MicroBatcher(RecordingBatch(error), max_batch_size=3, max_wait_ms=2000)
+    outcomes = submit_all(batcher, [1, 2, 3])
+    assert all(outcome is error for outcome in outcomes)
+
+
+def test_wrong_result_count_is_an_error_for_every_waiter():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=2, max_wait_ms=2000)
+    outcomes = submit_all(batcher, [1, 2])
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+
+def test_batcher_keeps_serving_after_an_error():
+    process = RecordingBatch(ValueError("once"))
+    batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=10)
+    with pytest.raises(ValueError):
+        batcher.submit(1)
+    process.error = None
+    assert batcher.submit(2) == 4
+    # Failed batches are not counted in the metrics
+    assert batcher.stats()["batches"] == 1
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from memory import IMAGE_TOKEN_ESTIMATE, ConversationMemory, estimate_tokens, strip_images
+
+SYSTEM = {"role": "system", "content": "You are a browser agent."}
+QUERY = {"role": "user", "content": "Find the weather in Paris."}
+
+
+def screenshot_message(text: str) -> dict:
+    return {"role": "user", "content": [
+        {"type": "text", "text": text},
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+    ]}
+
+
+def assistant_message(step: int) -> dict:
+    return {"role": "assistant", "content": f'Step {step} reasoning. {{"tool": "action", "description": "step {step}"}}'}
+
+
+def has_image(message: dict) -> bool:
+    content = message["content"]
+    return not isinstance(content, str) and any(part.get("type") == "image_url" for part in content)
+
+
+def test_estimate_tokens_counts_images():
+    assert estimate_tokens(screenshot_message("")) == 4 + IMAGE_TOKEN_ESTIMATE
+    assert estimate_tokens({"role": "user", "content": "x" * 40}) == 10 + 4
+
+
+def test_appended_turns_lose_their_images():
+    memory = ConversationMemory(SYSTEM, QUERY)
+    memory.append(screenshot_message("old screen"))
+    assert not has_image(memory.turns[0])
+    assert memory.turns[0]["content"][1] == {"type": "text", "text": "[earlier screenshot omitted]"}
+    message = {"role": "user", "content": "no images"}
+    assert strip_images(message) is message
+
+
+def test_build_keeps_head_and_current_state_without_compacting_under_budget():
+    memory = ConversationMemory(SYSTEM, QUERY, token_budget=100_000)
+    for step in range(5):
+        memory.append(assistant_message(step))
+    current = screenshot_message("current screen")
+    messages = memory.build(current)
+    assert messages[0] is SYSTEM
+    assert messages[1] == QUERY
+    assert messages[-1] is current and has_image(messages[-1])
+    assert len(messages) == 2 + 5 + 1
+    assert memory.summary == []
+
+
+def test_compaction_folds_oldest_turns_into_summary_and_keeps_recent():
+    memory = ConversationMemory(SYSTEM, QUERY, token_budget=4000, keep_recent=4, max_summary_lines=100)
+    for step in range(30):
+        memory.append(assistant_message(step))
+        memory.append({"role": "user", "content": "Result of the step. " * 25})
+    messages = memory.build(screenshot_message("current screen"))
+
+    assert len(memory.turns) >= memory.keep_recent
+    assert sum(estimate_tokens(message) for message in messages) <= memory.token_budget
+    # The oldest turns are summarized in order; the assistant turns keep their action, not their reasoning
+    assert memory.summary[0] == "assistant: action: step 0"
+    assert memory.summary[1].startswith("user: Result of the step.")
+    assert memory.turns[-1]["content"].startswith("Result of the step.")
+    summary_message = messages[2]
+    assert summary_message["content"].startswith("Summary of earlier steps:\n")
+
+
+def test_compaction_never_drops_recent_turns_even_over_budget():
+    memory = ConversationMemory(SYSTEM, QUERY, token_budget=10, keep_recent=3)
+    for step in range(6):
+        memory.append(assistant_message(step))
+    memory.build(screenshot_message("current screen"))
+    assert [turn["content"] for turn in memory.turns] == [assistant_message(step)["content"] for step in range(3, 6)]
+    assert len(memory.summary) == 3
+
+
+def test_summary_is_capped():
+    memory = ConversationMemory(SYSTEM, QUERY, token_budget=10, keep_recent=1, max_summary_lines=5)
+    for step in range(20):
+        memory.append(assistant_message(step))
+    memory.build(screenshot_message("current screen"))
+    assert len(memory.summary) == 5
+    assert memory.summary[-1] == "assistant: action: step 18"
+
+
+def test_reference_keeps_its_image():
+    memory = ConversationMemory(SYSTEM, QUERY)
+    reference = screenshot_message("full screen")
+    memory.set_reference(reference)
+    messages = memory.build(screenshot_message("crop"))
+    assert messages[2] is reference and has_image(messages[2])
+    memory.set_reference(None)
+    assert reference not in memory.build(screenshot_message("crop"))
+
+
+def test_record_usage_falls_back_to_the_estimate():
+    memory = ConversationMemory(SYSTEM, QUERY)
+    messages = memory.build(screenshot_message("current screen"))
+    assert memory.record_usage(1234) == 1234
+    assert memory.record_usage(None) == sum(estimate_tokens(message) for message in messages)
+    assert memory.prompt_tokens == [1234, memory.prompt_tokens[1]]
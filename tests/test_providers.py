@@ -0,0 +1,165 @@
+from __future__ import annotations
+import time
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("httpx")
+from providers import CallInfo, Provider, ProviderPool, parse_reset_duration, rate_limit_delay
+
+
+class FakeAPIError(Exception):
+    """An SDK-style API error carrying an HTTP status and response headers."""
+
+    def __init__(self, status_code: int, headers: dict[str, str] | None = None) -> None:
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class FakeClient:
+    """
+    Stands in for an OpenAI-compatible SDK client: each call takes the next scripted outcome
+    (an exception to raise, or a result to return), and returns "ok" once the script runs out.
+    """
+
+    def __init__(self, *outcomes: object, headers: dict[str, str] | None = None) -> None:
+        self.outcomes = list(outcomes)
+        self.headers = headers or {}
+        self.calls: list[dict] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=self.create)))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(headers=self.headers, parse=lambda: outcome)
+
+
+def make_pool(*clients: FakeClient, priorities: tuple[int, ...] | None = None, **options) -> ProviderPool:
+    priorities = priorities or (0,) * len(clients)
+    providers = [Provider(f"p{i}", client, "model", priority) for i, (client, priority) in enumerate(zip(clients, priorities))]
+    return ProviderPool(providers, base_delay=0.0, **options)
+
+
+def test_requests_rotate_across_keys_in_a_tier():
+    first, second = FakeClient(), FakeClient()
+    pool = make_pool(first, second)
+    served = []
+    for _ in range(4):
+        info = CallInfo()
+        assert pool.create(info, messages=[]) == "ok"
+        served.append(info.provider)
+    assert served == ["p0", "p1", "p0", "p1"]
+    assert pool.stats.per_provider == {"p0": 2, "p1": 2}
+    assert first.calls[0]["model"] == "model"
+
+
+def test_lower_tier_is_preferred():
+    backup, primary = FakeClient(), FakeClient()
+    pool = make_pool(backup, primary, priorities=(1, 0))
+    for _ in range(3):
+        pool.create(messages=[])
+    assert len(primary.calls) == 3 and not backup.calls
+
+
+def test_throttled_key_cools_down_and_the_call_fails_over():
+    throttled = FakeClient(FakeAPIError(429, {"retry-after": "30"}))
+    other = FakeClient()
+    pool = make_pool(throttled, other)
+    info = CallInfo()
+    start = time.monotonic()
+    assert pool.create(info, messages=[]) == "ok"
+    assert time.monotonic() - start < 5
+    assert info.provider == "p1" and info.retries == 1
+    assert pool.stats.throttled == 1 and pool.stats.failovers == 1
+    # The throttled key stays paused for the retry-after period, so the next call skips it
+    assert pool.providers[0].available_at >= start + 29
+    pool.create(messages=[])
+    assert len(throttled.calls) == 1 and len(other.calls) == 2
+
+
+def test_exhausted_quota_headers_pace_the_key():
+    paced = FakeClient(headers={"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "20s"})
+    pool = make_pool(paced, FakeClient())
+    start = time.monotonic()
+    pool.create(messages=[])
+    assert pool.providers[0].available_at >= start + 19
+
+
+@pytest.mark.parametrize("status", [400, 422])
+def test_malformed_request_is_raised_without_retrying(status):
+    error = FakeAPIError(status)
+    first, second = FakeClient(error), FakeClient()
+    pool = make_pool(first, second)
+    with pytest.raises(FakeAPIError) as raised:
+        pool.create(messages=[])
+    assert raised.value is error
+    assert pool.stats.requests == 1 and not second.calls
+
+
+def test_programming_error_is_raised_without_retrying():
+    first, second = FakeClient(TypeError("unexpected keyword")), FakeClient()
+    pool = make_pool(first, second)
+    with pytest.raises(TypeError):
+        pool.create(messages=[])
+    assert not second.calls
+
+
+def test_connection_error_is_retried():
+    pool = make_pool(FakeClient(ConnectionError("reset")), FakeClient())
+    info = CallInfo()
+    assert pool.create(info, messages=[]) == "ok"
+    assert info.retries == 1
+
+
+@pytest.mark.parametrize("status", [401, 403, 404])
+def test_refused_key_is_disabled_and_the_call_fails_over(status):
+    refused, other = FakeClient(FakeAPIError(status)), FakeClient()
+    pool = make_pool(refused, other, disable_for=3600.0)
+    start = time.monotonic()
+    info = CallInfo()
+    assert pool.create(info, messages=[]) == "ok"
+    assert info.provider == "p1"
+    assert pool.stats.disabled == 1
+    assert pool.providers[0].available_at >= start + 3599
+    pool.create(messages=[])
+    assert len(refused.calls) == 1
+
+
+def test_gives_up_instead_of_waiting_for_a_disabled_pool():
+    pool = make_pool(FakeClient(FakeAPIError(401)), disable_for=3600.0, max_wait=300.0)
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="No provider available"):
+        pool.create(messages=[])
+    assert time.monotonic() - start < 5
+
+
+def test_gives_up_after_max_attempts():
+    errors = [FakeAPIError(503) for _ in range(3)]
+    pool = make_pool(FakeClient(*errors), max_attempts=3, max_delay=0.0)
+    with pytest.raises(RuntimeError, match="after 3 attempts") as raised:
+        pool.create(messages=[])
+    assert raised.value.__cause__ is errors[-1]
+    assert pool.stats.retries == 2
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1.5", 1.5), ("7.66s", 7.66), ("120ms", 0.12), ("2m59.56s", 179.56), ("1h", 3600.0), ("", None), ("soon", None),
+])
+def test_parse_reset_duration(value, seconds):
+    if seconds is None:
+        assert parse_reset_duration(value) is None
+    else:
+        assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+def test_rate_limit_delay_prefers_retry_hints():
+    assert rate_limit_delay({"retry-after-ms": "250", "retry-after": "10"}) == 0.25
+    assert rate_limit_delay({"retry-after": "10"}) == 10.0
+    assert rate_limit_delay({"x-ratelimit-remaining-requests": "3", "x-ratelimit-reset-requests": "5s"}) is None
+    assert rate_limit_delay({
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "5s",
+        "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "1m",
+    }) == 60.0
+    assert rate_limit_delay(None) is None
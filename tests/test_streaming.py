@@ -0,0 +1,74 @@
+from __future__ import annotations
+import json
+import random
+import pytest
+from streaming import IncrementalJSONScanner, extract_tool_object
+
+TOOL_OBJECT = {"tool": "action", "description": 'Type "{braces}" and a \\ backslash', "action": {"action": "write", "text": "a } b { c"}}
+
+RESPONSES = [
+    # Plain reasoning, then the object
+    "I will open a new tab.\n" + json.dumps(TOOL_OBJECT),
+    # Braces and quotes in the prose before the object
+    'The page says "press {enter}" and shows a } on its own. He said "hi {".\n' + json.dumps(TOOL_OBJECT),
+    # A non-tool object (e.g. an echoed schema) before the tool object, and trailing text after it
+    'Schema: {"type": "object", "nested": {"a": 1}} so I answer ' + json.dumps(TOOL_OBJECT) + " and then stop.",
+    # An unbalanced brace inside a string before the object
+    'Note: "{ this never closes" ' + json.dumps(TOOL_OBJECT),
+]
+
+
+def feed_in_chunks(text: str, boundaries: list[int]) -> tuple[dict | None, IncrementalJSONScanner]:
+    scanner = IncrementalJSONScanner()
+    result = None
+    previous = 0
+    for boundary in boundaries + [len(text)]:
+        result = scanner.feed(text[previous:boundary])
+        previous = boundary
+        if result is not None:
+            break
+    return result, scanner
+
+
+@pytest.mark.parametrize("text", RESPONSES)
+def test_whole_text_matches_extract_tool_object(text):
+    result, scanner = feed_in_chunks(text, [])
+    assert result == TOOL_OBJECT == extract_tool_object(text)
+    encoded = json.dumps(TOOL_OBJECT)
+    assert scanner.end == text.index(encoded) + len(encoded)
+
+
+@pytest.mark.parametrize("text", RESPONSES)
+def test_single_character_chunks(text):
+    result, _ = feed_in_chunks(text, list(range(1, len(text))))
+    assert result == TOOL_OBJECT
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("text", RESPONSES)
+def test_random_chunk_boundaries(text, seed):
+    rng = random.Random(seed)
+    boundaries = sorted(rng.sample(range(1, len(text)), k=rng.randint(1, min(20, len(text) - 1))))
+    result, _ = feed_in_chunks(text, boundaries)
+    assert result == TOOL_OBJECT
+
+
+def test_object_is_returned_as_soon_as_it_closes():
+    prefix = "Reasoning first. "
+    text = prefix + json.dumps(TOOL_OBJECT)
+    scanner = IncrementalJSONScanner()
+    assert scanner.feed(text[:-1]) is None
+    assert scanner.feed(text[-1]) == TOOL_OBJECT
+    assert scanner.end == len(text)
+
+
+def test_incomplete_object_returns_none():
+    scanner = IncrementalJSONScanner()
+    assert scanner.feed('Thinking {"tool": "action", "description": "unfinished') is None
+    assert scanner.end is None
+
+
+def test_tool_names_skip_unknown_tools():
+    text = '{"tool": "example"} then {"tool": "task_complete"}'
+    scanner = IncrementalJSONScanner(tool_names=("action", "task_complete"))
+    assert scanner.feed(text) == {"tool": "task_complete"}
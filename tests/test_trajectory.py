@@ -0,0 +1,77 @@
+from __future__ import annotations
+import json
+import itertools
+import pytest
+
+np = pytest.importorskip("numpy")
+# trajectory imports change_detection, which imports the screen capture module
+pytest.importorskip("mss")
+import trajectory as trajectory_module
+from trajectory import Trajectory, TrajectoryStep, TrajectoryStore, decode_fingerprint, encode_fingerprint
+
+
+@pytest.fixture(autouse=True)
+def increasing_clock(monkeypatch):
+    # Each recording gets a distinct, increasing timestamp, however fast the test runs
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(trajectory_module.time, "time", lambda: float(next(clock)))
+
+
+def make_trajectory(query: str, keys: list[str]) -> Trajectory:
+    steps = [TrajectoryStep({"tool": "action", "action": {"action": "hotkey", "keys": keys}}, "1x1:00", 0.5)]
+    return Trajectory(query, steps)
+
+
+def test_fingerprint_round_trip():
+    fingerprint = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    encoded = encode_fingerprint(fingerprint)
+    assert encoded.startswith("3x4:")
+    assert np.array_equal(decode_fingerprint(encoded), fingerprint)
+
+
+def test_lookup_normalizes_the_query(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.json"))
+    store.record(make_trajectory("Open  a New Tab", ["ctrl", "t"]))
+    assert store.lookup("open a new tab").steps[0].action["action"]["keys"] == ["ctrl", "t"]
+    assert store.lookup("close the tab") is None
+    assert store.stats["hits"] == 1 and store.stats["misses"] == 1
+
+
+def test_saves_from_two_workers_are_merged(tmp_path):
+    path = str(tmp_path / "trajectories.json")
+    first, second = TrajectoryStore(path), TrajectoryStore(path)
+    first.record(make_trajectory("open a new tab", ["ctrl", "t"]))
+    second.record(make_trajectory("reload the page", ["f5"]))
+
+    reloaded = TrajectoryStore(path)
+    assert reloaded.lookup("open a new tab") is not None
+    assert reloaded.lookup("reload the page") is not None
+    with open(path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)["trajectories"]) == 2
+
+
+def test_newer_recording_of_a_query_wins(tmp_path):
+    path = str(tmp_path / "trajectories.json")
+    stale, fresh = TrajectoryStore(path), TrajectoryStore(path)
+    stale.record(make_trajectory("open a new tab", ["ctrl", "t"]))
+    fresh.record(make_trajectory("open a new tab", ["ctrl", "shift", "t"]))
+    # The stale worker saving again must not overwrite the newer recording with its own copy
+    stale.save()
+
+    reloaded = TrajectoryStore(path)
+    assert reloaded.lookup("open a new tab").steps[0].action["action"]["keys"] == ["ctrl", "shift", "t"]
+    assert stale.lookup("open a new tab").steps[0].action["action"]["keys"] == ["ctrl", "shift", "t"]
+
+
+def test_stat_increments_are_added_not_overwritten(tmp_path):
+    path = str(tmp_path / "trajectories.json")
+    first, second = TrajectoryStore(path), TrajectoryStore(path)
+    first.lookup("a")
+    first.lookup("b")
+    second.lookup("c")
+    first.save()
+    second.save()
+    # Saving again without new lookups must not count the same increments twice
+    first.save()
+
+    assert TrajectoryStore(path).stats["misses"] == 3
@@ -0,0 +1,236 @@
+from __future__ import annotations
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+# Span attributes that are also summed into per-stage counters (sizes like width/height are not)
+COUNTED_ATTRIBUTES = ("payload_bytes", "prompt_tokens", "completion_tokens", "retries")
+
+
+@dataclass
+class Span:
+    """
+    One timed stage.
+
+    Attributes:
+        name (str): The stage name (e.g. "capture", "encode", "model").
+        start (float): The UNIX time the stage started.
+        duration (float): The stage duration in seconds.
+        attributes (dict[str, Any]): Stage details such as image size, payload bytes, tokens and retries.
+        error (str | None): The exception raised inside the span, if any.
+    """
+    name: str
+    start: float
+    duration: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+    def set(self, **attributes: Any) -> None:
+        """
+        Adds attributes to the span; None values are skipped.
+
+        Args:
+            **attributes (Any): The attributes to add.
+        """
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+
+class Tracer:
+    """
+    Records spans to a JSONL file and keeps per-stage latency samples and counters for reports and Prometheus.
+
+    Attributes:
+        path (str | None): The JSONL trace file, or None to keep spans in memory only.
+        max_samples (int): The number of recent durations kept per stage for percentiles.
+        counters (dict[str, float]): Monotonic counters (errors, `COUNTED_ATTRIBUTES` sums and `increment` calls).
+    """
+
+    def __init__(self, path: str | None = None, max_samples: int = 2048) -> None:
+        self.path = path
+        self.max_samples = max_samples
+        self.counters: dict[str, float] = {}
+        self._samples: dict[str, deque[float]] = {}
+        self._totals: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        if self._file is not None:
+            atexit.register(self._file.close)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Times a block of code as a span.
+
+        Args:
+            name (str): The stage name.
+            **attributes (Any): Initial span attributes; more can be added with `Span.set` inside the block.
+
+        Yields:
+            Span: The span being recorded.
+        """
+        span = Span(name, time.time())
+        span.set(**attributes)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.record(span)
+
+    def record(self, span: Span) -> None:
+        """
+        Stores a finished span: updates samples and counters and appends it to the trace file.
+
+        Args:
+            span (Span): The finished span.
+        """
+        line = json.dumps(asdict(span), default=str) if self._file is not None else None
+        with self._lock:
+            samples = self._samples.setdefault(span.name, deque(maxlen=self.max_samples))
+            samples.append(span.duration)
+            count, total = self._totals.get(span.name, (0, 0.0))
+            self._totals[span.name] = (count + 1, total + span.duration)
+            for key in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(key)
+                if isinstance(value, (int, float)):
+                    counter = f"{span.name}_{key}"
+                    self.counters[counter] = self.counters.get(counter, 0) + value
+            if span.error is not None:
+                self.counters[f"{span.name}_errors"] = self.counters.get(f"{span.name}_errors", 0) + 1
+            if line is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The counter name.
+            value (float): The amount to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        Computes per-stage latency statistics.
+
+        Returns:
+            dict[str, dict[str, float]]: For each stage, the span count, total seconds, and p50/p95 seconds.
+        """
+        with self._lock:
+            snapshot = {name: (sorted(samples), self._totals[name]) for name, samples in self._samples.items()}
+
+        def percentile(samples: list[float], q: float) -> float:
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {
+            name: {"count": count, "total_s": total, "p50_s": percentile(samples, 0.5), "p95_s": percentile(samples, 0.95)}
+            for name, (samples, (count, total)) in snapshot.items()
+        }
+
+    def report(self) -> str:
+        """
+        Formats the per-stage summary as a table.
+
+        Returns:
+            str: One line per stage with count, p50, p95 and total time.
+        """
+        lines = [f"{'stage':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}"]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f"{name:<16}{stats['count']:>8}{stats['p50_s'] * 1000:>10.1f}"
+                         f"{stats['p95_s'] * 1000:>10.1f}{stats['total_s']:>10.2f}")
+        return "\n".join(lines)
+
+    def prometheus_text(self, prefix: str = "agent") -> str:
+        """
+        Renders the stage statistics and counters in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): The metric name prefix.
+
+        Returns:
+            str: The metrics page.
+        """
+        lines = [
+            f"# HELP {prefix}_stage_duration_seconds Stage latency.",
+            f"# TYPE {prefix}_stage_duration_seconds summary",
+        ]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f'{prefix}_stage_duration_seconds{{stage="{name}",quantile="0.5"}} {stats["p50_s"]:.6f}')
+            lines.append(f'{prefix}_stage_duration_seconds{{stage="{name}",quantile="0.95"}} {stats["p95_s"]:.6f}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{name}"}} {stats["total_s"]:.6f}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{name}"}} {stats["count"]}')
+        with self._lock:
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port: int, host: str = "0.0.0.0", prefix: str = "agent") -> ThreadingHTTPServer:
+        """
+        Serves `prometheus_text` at /metrics on a background thread.
+
+        Args:
+            port (int): The port to listen on.
+            host (str): The interface to bind.
+            prefix (str): The metric name prefix.
+
+        Returns:
+            ThreadingHTTPServer: The running server.
+        """
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text(prefix).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # Scrapes are frequent; keep them out of the agent's output
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+
+# Process-wide tracer; TRACE_FILE enables the JSONL export
+tracer = Tracer(os.getenv("TRACE_FILE"))
+span = tracer.span
+
+
+def serve_metrics_from_env(prefix: str = "agent") -> ThreadingHTTPServer | None:
+    """
+    Starts the Prometheus endpoint if TRACE_METRICS_PORT is set.
+
+    Called from entry points rather than at import time, so worker subprocesses do not compete for the port.
+
+    Args:
+        prefix (str): The metric name prefix.
+
+    Returns:
+        ThreadingHTTPServer | None: The running server, or None if the variable is not set.
+    """
+    port = os.getenv("TRACE_METRICS_PORT")
+    return tracer.serve_metrics(int(port), prefix=prefix) if port else None
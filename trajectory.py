@@ -0,0 +1,326 @@
+from __future__ import annotations
+import os
+import json
+import sys
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable
+import numpy as np
+from change_detection import ChangeDetector, fingerprints_match
+
+# Replay tolerance: looser than change detection, since clocks, cursors and ads differ between runs
+REPLAY_TOLERANCE = 0.03
+
+
+@contextmanager
+def _file_lock(path: str):
+    # Exclusive lock on a sidecar file, held across processes while the store is read, merged and written
+    with open(path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def encode_fingerprint(fingerprint: np.ndarray) -> str:
+    """
+    Serializes a fingerprint as "<rows>x<cols>:<hex>".
+
+    Args:
+        fingerprint (np.ndarray): A fingerprint produced by `frame_fingerprint`.
+
+    Returns:
+        str: The serialized fingerprint.
+    """
+    rows, cols = fingerprint.shape
+    return f"{rows}x{cols}:{fingerprint.astype(np.uint8).tobytes().hex()}"
+
+
+def decode_fingerprint(value: str) -> np.ndarray:
+    """
+    Parses a fingerprint serialized by `encode_fingerprint`.
+
+    Args:
+        value (str): The serialized fingerprint.
+
+    Returns:
+        np.ndarray: The fingerprint.
+    """
+    shape, data = value.split(":", 1)
+    rows, cols = (int(n) for n in shape.split("x"))
+    return np.frombuffer(bytes.fromhex(data), dtype=np.uint8).reshape(rows, cols)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query so repeated runs of the same task share a trajectory.
+
+    Args:
+        query (str): The user's task description.
+
+    Returns:
+        str: The lower-cased query with collapsed whitespace.
+    """
+    return " ".join(query.lower().split())
+
+
+@dataclass
+class TrajectoryStep:
+    """
+    One recorded action.
+
+    Attributes:
+        action (dict[str, Any]): The tool object the model produced.
+        fingerprint (str): The serialized fingerprint of the screen the action was taken on.
+        model_latency (float): The seconds the model call for this step took when it was recorded.
+    """
+    action: dict[str, Any]
+    fingerprint: str
+    model_latency: float = 0.0
+
+
+@dataclass
+class Trajectory:
+    """
+    A successful run of a query.
+
+    Attributes:
+        query (str): The original query.
+        steps (list[TrajectoryStep]): The actions in order.
+        final_fingerprint (str | None): The serialized fingerprint of the screen when the task was reported complete.
+        recorded_at (float): The UNIX time the run was recorded.
+    """
+    query: str
+    steps: list[TrajectoryStep] = field(default_factory=list)
+    final_fingerprint: str | None = None
+    recorded_at: float = 0.0
+
+
+@dataclass
+class ReplayOutcome:
+    """
+    The result of replaying a trajectory against the live screen.
+
+    Attributes:
+        steps (list[TrajectoryStep]): The steps that were replayed successfully.
+        completed (bool): Whether every step replayed and the final screen matched.
+        baseline (np.ndarray | None): The fingerprint before the last replayed action, for the next settle.
+        time_saved (float): The recorded model time of the replayed steps (and the final check).
+    """
+    steps: list[TrajectoryStep]
+    completed: bool
+    baseline: np.ndarray | None
+    time_saved: float
+
+
+class TrajectoryStore:
+    """
+    A JSON-backed store of successful trajectories keyed by normalized query.
+
+    Attributes:
+        path (str): The JSON file the store is saved to.
+        tolerance (float): The fraction of changed fingerprint cells still accepted during replay.
+        stats (dict[str, float]): Lookup hits and misses, full and partial replays, model calls and seconds saved.
+    """
+
+    def __init__(self, path: str = "trajectories.json", tolerance: float = REPLAY_TOLERANCE) -> None:
+        self.path = path
+        self.tolerance = tolerance
+        self.stats: dict[str, float] = {
+            "hits": 0, "misses": 0, "full_replays": 0, "partial_replays": 0,
+            "model_calls_saved": 0, "seconds_saved": 0.0,
+        }
+        self._trajectories: dict[str, Trajectory] = {}
+        self._saved_stats: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _read(self) -> tuple[dict[str, Trajectory], dict[str, float]]:
+        if not os.path.exists(self.path):
+            return {}, {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        trajectories = {}
+        for record in data.get("trajectories", []):
+            steps = [TrajectoryStep(**step) for step in record.pop("steps", [])]
+            trajectory = Trajectory(steps=steps, **record)
+            trajectories[normalize_query(trajectory.query)] = trajectory
+        return trajectories, data.get("stats", {})
+
+    def _load(self) -> None:
+        with _file_lock(f"{self.path}.lock"):
+            trajectories, stats = self._read()
+        self._trajectories.update(trajectories)
+        self.stats.update(stats)
+        # Stats as last seen on disk; only the increments since then are added when saving
+        self._saved_stats = dict(self.stats)
+
+    def save(self) -> None:
+        """
+        Merges the trajectories and stats into `path`.
+
+        Several workers may share one file, so the file is re-read under a lock: the newer recording of
+        each query wins, and this store's stat increments since its last save are added to the file's.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with _file_lock(f"{self.path}.lock"):
+            on_disk, disk_stats = self._read()
+            with self._lock:
+                for key, trajectory in on_disk.items():
+                    current = self._trajectories.get(key)
+                    if current is None or current.recorded_at < trajectory.recorded_at:
+                        self._trajectories[key] = trajectory
+                merged_stats = dict(disk_stats)
+                for key, value in self.stats.items():
+                    merged_stats[key] = merged_stats.get(key, 0) + value - self._saved_stats.get(key, 0)
+                self.stats.update(merged_stats)
+                self._saved_stats = dict(self.stats)
+                data = {
+                    "trajectories": [asdict(trajectory) for trajectory in self._trajectories.values()],
+                    "stats": self.stats,
+                }
+            # A per-process temp file in the same directory, so the rename is atomic and never shared
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=directory, prefix=".trajectories-", suffix=".tmp", delete=False
+            ) as f:
+                json.dump(data, f)
+            try:
+                os.replace(f.name, self.path)
+            except OSError:
+                os.unlink(f.name)
+                raise
+
+    def lookup(self, query: str) -> Trajectory | None:
+        """
+        Finds the recorded trajectory for a query.
+
+        Args:
+            query (str): The user's task description.
+
+        Returns:
+            Trajectory | None: The trajectory, or None if the query has not been recorded.
+        """
+        with self._lock:
+            trajectory = self._trajectories.get(normalize_query(query))
+            self.stats["hits" if trajectory else "misses"] += 1
+            return trajectory
+
+    def record(self, trajectory: Trajectory) -> None:
+        """
+        Stores (or replaces) the trajectory for its query and saves the store.
+
+        Args:
+            trajectory (Trajectory): The successful run.
+        """
+        trajectory.recorded_at = time.time()
+        with self._lock:
+            self._trajectories[normalize_query(trajectory.query)] = trajectory
+        self.save()
+
+    def replay(
+        self,
+        trajectory: Trajectory,
+        detector: ChangeDetector,
+        execute: Callable[[dict[str, Any]], None],
+    ) -> ReplayOutcome:
+        """
+        Replays a trajectory, checking each step's fingerprint against the live screen first.
+
+        Replay stops at the first step whose screen does not match; the caller then falls back to the
+        model from that point.
+
+        Args:
+            trajectory (Trajectory): The trajectory to replay.
+            detector (ChangeDetector): The change detector used to settle the screen between steps.
+            execute (Callable[[dict[str, Any]], None]): Executes one recorded action.
+
+        Returns:
+            ReplayOutcome: Which steps were replayed and whether the task is complete.
+        """
+        replayed: list[TrajectoryStep] = []
+        baseline = None
+        time_saved = 0.0
+
+        for step in trajectory.steps:
+            detector.settle(baseline=baseline)
+            if not fingerprints_match(detector.last_fingerprint, decode_fingerprint(step.fingerprint), self.tolerance):
+                break
+            baseline = detector.last_fingerprint
+            execute(step.action)
+            replayed.append(step)
+            time_saved += step.model_latency
+
+        completed = False
+        if len(replayed) == len(trajectory.steps) and trajectory.final_fingerprint is not None:
+            # The final screen must match too before the task is reported complete without the model
+            detector.settle(baseline=baseline)
+            completed = fingerprints_match(
+                detector.last_fingerprint, decode_fingerprint(trajectory.final_fingerprint), self.tolerance
+            )
+
+        with self._lock:
+            self.stats["full_replays" if completed else "partial_replays"] += 1
+            self.stats["model_calls_saved"] += len(replayed) + (1 if completed else 0)
+            self.stats["seconds_saved"] += time_saved
+        return ReplayOutcome(replayed, completed, baseline, time_saved)
+
+
+class TrajectoryRecorder:
+    """
+    Collects the steps of a live run so a successful run can be stored.
+
+    Attributes:
+        trajectory (Trajectory): The trajectory being recorded.
+    """
+
+    def __init__(self, query: str) -> None:
+        self.trajectory = Trajectory(query=query)
+
+    def add_step(self, action: dict[str, Any], fingerprint: np.ndarray | None, model_latency: float) -> None:
+        """
+        Records one executed action.
+
+        Args:
+            action (dict[str, Any]): The tool object that was executed.
+            fingerprint (np.ndarray | None): The fingerprint of the screen the action was taken on.
+            model_latency (float): The seconds the model call took.
+        """
+        if fingerprint is None:
+            return
+        self.trajectory.steps.append(TrajectoryStep(action, encode_fingerprint(fingerprint), model_latency))
+
+    def extend(self, steps: list[TrajectoryStep]) -> None:
+        """
+        Adds steps that were replayed from an earlier trajectory.
+
+        Args:
+            steps (list[TrajectoryStep]): The replayed steps.
+        """
+        self.trajectory.steps.extend(steps)
+
+    def finish(self, store: TrajectoryStore, final_fingerprint: np.ndarray | None) -> None:
+        """
+        Stores the trajectory after the task completed.
+
+        Args:
+            store (TrajectoryStore): The store to save into.
+            final_fingerprint (np.ndarray | None): The fingerprint of the screen when the task was reported complete.
+        """
+        if final_fingerprint is not None:
+            self.trajectory.final_fingerprint = encode_fingerprint(final_fingerprint)
+        store.record(self.trajectory)
@@ -1,5 +1,11 @@
 from __future__ import annotations
+import io
 import base64
+from dataclasses import dataclass
+from typing import Literal
+import numpy as np
+from PIL import Image
+from tracing import span
 
 
 def encode_image_to_data_uri(image_path: str, mime_type: str = "png") -> str:
@@ -23,4 +29,109 @@ def encode_image_to_data_uri(image_path: str, mime_type: str = "png") -> str:
 def encode_image_to_base64(image_path): # for open ai api
     """Encode image to base64 string"""
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
\ No newline at end of file
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    Settings that control how a frame is shrunk and compressed before it is sent to a model.
+
+    Attributes:
+        max_size (int | None): The maximum length in pixels of the longest side, or None to keep full resolution.
+        format (Literal["jpeg", "webp", "png"]): The image format to encode to.
+        quality (int): The lossy quality (1-100) for JPEG and WebP; ignored for PNG.
+        grayscale (bool): Whether to drop colour information before encoding.
+    """
+    max_size: int | None = 1568
+    format: Literal["jpeg", "webp", "png"] = "jpeg"
+    quality: int = 80
+    grayscale: bool = False
+
+
+# Per-provider encoding profiles
+ENCODING_PROFILES: dict[str, EncodingProfile] = {
+    # Groq rejects base64 images over 4 MB; a 1280 px JPEG stays far below that and uploads quickly
+    "groq": EncodingProfile(max_size=1280, format="jpeg", quality=80),
+    # Azure OpenAI rescales images to fit 2048 px anyway, so anything larger is wasted upload
+    "azure": EncodingProfile(max_size=2048, format="jpeg", quality=85),
+    # Full-resolution lossless PNG, matching the original behaviour
+    "lossless": EncodingProfile(max_size=None, format="png"),
+}
+
+# MIME type and PIL format name for each supported format
+_FORMATS: dict[str, tuple[str, str]] = {
+    "jpeg": ("image/jpeg", "JPEG"),
+    "webp": ("image/webp", "WEBP"),
+    "png": ("image/png", "PNG"),
+}
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """
+    An encoded frame together with the metadata needed to send and report it.
+
+    Attributes:
+        data (bytes): The encoded image file contents.
+        mime_type (str): The MIME type matching `data` (e.g. "image/jpeg").
+        width (int): The encoded image width in pixels.
+        height (int): The encoded image height in pixels.
+    """
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+
+    @property
+    def base64(self) -> str:
+        """The image data as a base64 string."""
+        return base64.b64encode(self.data).decode("utf-8")
+
+    @property
+    def data_uri(self) -> str:
+        """The image as a Data URI with the correct MIME type."""
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def payload_bytes(self) -> int:
+        """The size in bytes of the base64 payload that goes over the wire."""
+        return 4 * ((len(self.data) + 2) // 3)
+
+
+def encode_frame(frame: np.ndarray, profile: EncodingProfile) -> EncodedImage:
+    """
+    Downscales and compresses an in-memory RGB frame according to an encoding profile.
+
+    Args:
+        frame (np.ndarray): A (height, width, 3) uint8 array in RGB order.
+        profile (EncodingProfile): The encoding settings to apply.
+
+    Returns:
+        EncodedImage: The encoded image with its MIME type and dimensions.
+    """
+    if profile.format not in _FORMATS:
+        raise ValueError(f"Unsupported image format: {profile.format}")
+    mime_type, pil_format = _FORMATS[profile.format]
+
+    with span("encode", format=profile.format, source_width=frame.shape[1], source_height=frame.shape[0]) as s:
+        image = Image.fromarray(frame)
+        if profile.grayscale:
+            image = image.convert("L")
+
+        # Shrink so that the longest side fits max_size, keeping the aspect ratio
+        if profile.max_size is not None and max(image.size) > profile.max_size:
+            image.thumbnail((profile.max_size, profile.max_size), resample=Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+        # Encode with format-specific options
+        buffer = io.BytesIO()
+        if pil_format == "PNG":
+            image.save(buffer, format="PNG", compress_level=1)
+        elif pil_format == "WEBP":
+            image.save(buffer, format="WEBP", quality=profile.quality, method=0)
+        else:
+            image.save(buffer, format="JPEG", quality=profile.quality, optimize=False)
+
+        encoded = EncodedImage(data=buffer.getvalue(), mime_type=mime_type, width=image.width, height=image.height)
+        s.set(width=encoded.width, height=encoded.height, payload_bytes=encoded.payload_bytes)
+    return encoded